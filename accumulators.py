@@ -0,0 +1,164 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Streaming accumulators to summarise per-article ratios (TTR, anglicisms usage...) in constant memory per group instead
+of keeping every value in a list. All of them can be merged, so partial results from different shards or workers can
+be combined afterwards.
+"""
+import bisect
+import itertools
+import math
+import random
+from collections import namedtuple
+
+Z_95 = 1.959963984540054
+KLL_K = 200
+KLL_C = 2 / 3
+SUMMARY_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+Summary = namedtuple('Summary', ['mean', 'variance', 'ci_low', 'ci_high', 'minimum', 'p5', 'p25', 'median', 'p75',
+                                 'p95', 'maximum', 'count'])
+
+
+class MomentsAccumulator:
+    """Count, mean, variance (Welford's algorithm), minimum and maximum of a stream of values"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def merge(self, other):
+        """Adds the values seen by another accumulator (Chan et al. parallel algorithm)"""
+        if not other.count:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    @property
+    def variance(self):
+        """Sample variance"""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def get_confidence_interval(self, z=Z_95):
+        """Normal approximation of the confidence interval of the mean (95% by default)"""
+        if not self.count:
+            return math.nan, math.nan
+        margin = z * math.sqrt(self.variance / self.count)
+        return self.mean - margin, self.mean + margin
+
+
+class KLLSketch:
+    """KLL quantiles sketch (Karnin, Lang and Liberty, 2016). It keeps a hierarchy of compactors whose capacity decreases
+    geometrically with their depth, so the memory used is O(k) no matter the amount of values seen"""
+
+    def __init__(self, k=KLL_K, c=KLL_C, seed=None):
+        self.k = k
+        self.c = c
+        self.compactors = [[]]
+        self.size = 0
+        self.max_size = 0
+        self._random = random.Random(seed)
+        self._update_max_size()
+
+    def _capacity(self, height):
+        depth = len(self.compactors) - height - 1
+        return int(math.ceil(self.k * self.c ** depth)) + 1
+
+    def _update_max_size(self):
+        self.max_size = sum(self._capacity(height) for height in range(len(self.compactors)))
+
+    def _grow(self):
+        self.compactors.append([])
+        self._update_max_size()
+
+    def update(self, value):
+        self.compactors[0].append(value)
+        self.size += 1
+        if self.size >= self.max_size:
+            self._compress()
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for height, items in enumerate(other.compactors):
+            self.compactors[height].extend(items)
+        self.size = sum(len(items) for items in self.compactors)
+        while self.size >= self.max_size:
+            self._compress()
+        return self
+
+    def _compress(self):
+        for height in range(len(self.compactors)):
+            if len(self.compactors[height]) >= self._capacity(height):
+                if height + 1 >= len(self.compactors):
+                    self._grow()
+                items = sorted(self.compactors[height])
+                # An odd item stays in its level, the rest are halved randomly (keeping the odd or the even ones)
+                self.compactors[height] = [items.pop()] if len(items) % 2 else []
+                self.compactors[height + 1].extend(items[self._random.randint(0, 1)::2])
+                self.size = sum(len(items) for items in self.compactors)
+                if self.size < self.max_size:
+                    break
+
+    def get_quantiles(self, quantiles):
+        """Returns the approximate values of the given quantiles (between 0 and 1)"""
+        weighted = sorted((value, 2 ** height) for height, items in enumerate(self.compactors) for value in items)
+        if not weighted:
+            return [math.nan for _ in quantiles]
+        cumulative = list(itertools.accumulate(weight for _, weight in weighted))
+        last = len(weighted) - 1
+        return [weighted[min(bisect.bisect_left(cumulative, quantile * cumulative[-1]), last)][0]
+                for quantile in quantiles]
+
+
+class StatsAccumulator:
+    """Moments plus quantiles of a stream of values, summarised with `summary`"""
+
+    def __init__(self, k=KLL_K, seed=None):
+        self.moments = MomentsAccumulator()
+        self.quantiles = KLLSketch(k, seed=seed)
+
+    def update(self, value):
+        self.moments.update(value)
+        self.quantiles.update(value)
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.quantiles.merge(other.quantiles)
+        return self
+
+    @property
+    def count(self):
+        return self.moments.count
+
+    @property
+    def mean(self):
+        return self.moments.mean if self.moments.count else math.nan
+
+    def summary(self, z=Z_95):
+        ci_low, ci_high = self.moments.get_confidence_interval(z)
+        minimum, maximum = (self.moments.minimum, self.moments.maximum) if self.count else (math.nan, math.nan)
+        return Summary(self.mean, self.moments.variance, ci_low, ci_high, minimum,
+                       *self.quantiles.get_quantiles(SUMMARY_QUANTILES), maximum, self.count)
+
+
+def format_summary(summary, delimiter=';'):
+    """Joins the summary fields to be printed as CSV columns (the mean first, as the original CSVs did)"""
+    return delimiter.join(str(value) for value in summary)
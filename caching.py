@@ -0,0 +1,61 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Least recently used cache bounded by the size of its values instead of by their amount, since a single cached result
+(e.g. the daily series of a term or a whole article) can weigh thousands of times more than another.
+"""
+import sys
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Keeps values up to `max_size` (measured with `get_size`, bytes by default), evicting the least recently used
+    ones first. Values bigger than `max_size` are never cached"""
+
+    def __init__(self, max_size, get_size=sys.getsizeof):
+        self.max_size = max_size
+        self.get_size = get_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._values = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key, default=None):
+        if key not in self._values:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._values.move_to_end(key)
+        return self._values[key][0]
+
+    def put(self, key, value):
+        size = self.get_size(value)
+        self.pop(key)
+        if size > self.max_size:
+            return
+        self._values[key] = (value, size)
+        self.size += size
+        while self.size > self.max_size:
+            _, (_, evicted_size) = self._values.popitem(last=False)
+            self.size -= evicted_size
+
+    def pop(self, key, default=None):
+        if key not in self._values:
+            return default
+        value, size = self._values.pop(key)
+        self.size -= size
+        return value
+
+    def clear(self):
+        self._values.clear()
+        self.size = 0
+
+    def get_stats(self):
+        return {'entries': len(self._values), 'size': self.size, 'max_size': self.max_size, 'hits': self.hits,
+                'misses': self.misses}
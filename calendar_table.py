@@ -0,0 +1,119 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Precomputed calendar dimension table: for every day between two dates it stores its year, month, ISO week, quarter,
+season (also as whole seasons, with the winter spanning two years) and weekday as NumPy columns, so grouping the
+corpus by any calendar dimension is a vectorised lookup by the day offset instead of rebuilding and filtering the list
+of dates once per group.
+"""
+import datetime
+import itertools
+from collections import namedtuple
+
+import numpy as np
+
+Season = namedtuple('Season', ['name', 'start_month', 'start_day'])
+
+# Same seasons as the original `get_words_count_per_season`, including the last days of the year as 'winter2'
+SEASONS = [Season('winter', 1, 1),
+           Season('spring', 3, 21),
+           Season('summer', 6, 21),
+           Season('autumn', 9, 21),
+           Season('winter2', 12, 21)]
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+CALENDAR_FIELDS = ['year', 'month', 'day', 'quarter', 'iso_year', 'week', 'weekday', 'season', 'season_year',
+                   'whole_season']
+# Fields with the same values every year, so all their groups exist even if the date range doesn't reach them
+CYCLIC_FIELDS = {'month': range(1, 13),
+                 'quarter': range(1, 5),
+                 'weekday': range(len(WEEKDAYS)),
+                 'season': range(len(SEASONS)),
+                 'whole_season': range(len(SEASONS) - 1)}
+
+
+class CalendarTable:
+    """Calendar columns indexed by the offset in days from `start_date`"""
+
+    def __init__(self, start_date, end_date):
+        self.start_date = _to_date(start_date)
+        self.end_date = _to_date(end_date)
+        self.dates = np.arange(np.datetime64(self.start_date, 'D'), np.datetime64(self.end_date, 'D') + 1)
+        self.days = len(self.dates)
+
+        months_start = self.dates.astype('datetime64[M]')
+        years = self.dates.astype('datetime64[Y]').astype(np.int64) + 1970
+        months = months_start.astype(np.int64) % 12 + 1
+        month_days = (self.dates - months_start).astype(np.int64) + 1
+        # 1970-01-01 was a Thursday
+        weekdays = (self.dates.astype(np.int64) + 3) % 7
+        # The ISO year and week are the ones of the Thursday of the same week
+        thursdays = self.dates + (3 - weekdays)
+        iso_years = thursdays.astype('datetime64[Y]')
+        weeks = (thursdays - iso_years.astype('datetime64[D]')).astype(np.int64) // 7 + 1
+        seasons = np.searchsorted([s.start_month * 100 + s.start_day for s in SEASONS],
+                                  months * 100 + month_days, side='right') - 1
+        # To group by (season_year, whole_season), the last days of December are the winter of the next year
+        last_days = seasons == len(SEASONS) - 1
+
+        self.columns = {
+            'year': years,
+            'month': months,
+            'day': month_days,
+            'quarter': (months - 1) // 3 + 1,
+            'iso_year': iso_years.astype(np.int64) + 1970,
+            'week': weeks,
+            'weekday': weekdays,
+            'season': seasons,
+            'season_year': years + last_days,
+            'whole_season': np.where(last_days, 0, seasons),
+        }
+
+    def get_offset(self, date):
+        """Returns the row of the table for the given date"""
+        return (_to_date(date) - self.start_date).days
+
+    def get_offsets(self, dates):
+        """Vectorised version of `get_offset`"""
+        return (np.asarray(dates, dtype='datetime64[D]') - self.dates[0]).astype(np.int64)
+
+    def get_column(self, field):
+        if field not in self.columns:
+            raise ValueError(f'unknown calendar field {field}, it must be one of {CALENDAR_FIELDS}')
+        return self.columns[field]
+
+    def get_groups(self, fields):
+        """Groups the days by the values of the given fields. Returns an array with the group index of every day and
+        the list of groups (tuples with the value of every field), sorted by those values in order"""
+        keys = np.stack([self.get_column(field) for field in fields], axis=1)
+        groups, day_groups = np.unique(keys, axis=0, return_inverse=True)
+        return day_groups.ravel(), [tuple(int(value) for value in group) for group in groups]
+
+    def get_declared_groups(self, fields):
+        """Every group of the given fields: all the combinations of values if they are all cyclic (like every season,
+        as the original per-season CSVs), or else the ones of `get_groups`"""
+        if all(field in CYCLIC_FIELDS for field in fields):
+            return list(itertools.product(*(CYCLIC_FIELDS[field] for field in fields)))
+        return self.get_groups(fields)[1]
+
+    @staticmethod
+    def format_group(fields, group):
+        """Human-readable label of a group returned by `get_groups`, e.g. '2017' or 'spring'"""
+        labels = []
+        for field, value in zip(fields, group):
+            if field in ('season', 'whole_season'):
+                labels.append(SEASONS[value].name)
+            elif field == 'weekday':
+                labels.append(WEEKDAYS[value])
+            elif field == 'week':
+                labels.append(f'W{value:02d}')
+            elif field in ('month', 'day'):
+                labels.append(f'{value:02d}')
+            elif field == 'quarter':
+                labels.append(f'Q{value}')
+            else:
+                labels.append(str(value))
+        return '-'.join(labels)
+
+
+def _to_date(date):
+    return date.date() if isinstance(date, datetime.datetime) else date
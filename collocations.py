@@ -0,0 +1,205 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Collocations engine: streams the lemmatized texts once, counting how many times every pair of words appears within a
+window of each other per year (or per province), and saves those counts as sparse matrices so PMI and log-likelihood
+collocates of any word in any slice are computed without reading the corpus again.
+
+The pairs are partitioned into shards by their head word id, and the pending pairs are aggregated and spilled to disk
+per shard whenever they grow too much. At the end every shard is merged on its own, so only a shard (and not the whole
+co-occurrence matrix) has to fit in memory.
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from news_stats import ARTICLE_PARTS, get_dates_from_cfg, read_articles, split_words
+from sparse_store import get_row, load_meta, load_rows, load_vocabulary, save_meta, save_rows, save_vocabulary
+
+COLLOCATIONS_DIR = 'collocations'
+VOCABULARY_FILE = 'vocabulary.txt'
+SPILL_DIR_PREFIX = 'spill_'
+SHARD_NAME = 'pairs_{slice}_{shard}'
+MARGINALS_FILE = 'marginals_{slice}.npy'
+GROUP_BY = ['year', 'province']
+MEASURES = ['pmi', 'llr', 'count']
+WINDOW = 5
+SHARDS = 16
+# Amount of pending pairs (of all the shards) before aggregating and spilling them to disk
+PAIRS_CHUNK_SIZE = 20_000_000
+TERM_BITS = 32
+
+
+class _ShardedPairsCounter:
+    """Counts (head, collocate) pairs of a slice, partitioned by head and spilled to disk in aggregated chunks"""
+
+    def __init__(self, spill_dir, slice_name, shards):
+        self.spill_paths = [f'{spill_dir}/{slice_name}_{shard}.npy' for shard in range(shards)]
+        self.shards = shards
+        self.pending = 0
+        self._keys_chunks = [[] for _ in range(shards)]
+
+    def add(self, heads, collocates):
+        keys = (heads.astype(np.int64) << TERM_BITS) | collocates
+        shards = heads % self.shards
+        for shard in range(self.shards):
+            self._keys_chunks[shard].append(keys[shards == shard])
+        self.pending += len(keys)
+
+    def spill(self):
+        for shard, chunks in enumerate(self._keys_chunks):
+            if chunks:
+                keys, counts = np.unique(np.concatenate(chunks), return_counts=True)
+                with open(self.spill_paths[shard], 'ab') as f:
+                    np.save(f, keys)
+                    np.save(f, counts)
+        self._keys_chunks = [[] for _ in range(self.shards)]
+        self.pending = 0
+
+    def merge_shard(self, shard):
+        """Returns the aggregated (keys, counts) of every spilled chunk of the shard"""
+        keys_chunks, counts_chunks = [], []
+        if os.path.exists(self.spill_paths[shard]):
+            with open(self.spill_paths[shard], 'rb') as f:
+                while f.peek(1):
+                    keys_chunks.append(np.load(f))
+                    counts_chunks.append(np.load(f))
+        if not keys_chunks:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        keys, inverse = np.unique(np.concatenate(keys_chunks), return_inverse=True)
+        return keys, np.bincount(inverse.ravel(), weights=np.concatenate(counts_chunks)).astype(np.int64)
+
+
+def get_window_pairs(tokens, window=WINDOW):
+    """Returns the (head, collocate) pairs of the tokens at most `window` positions away, in both directions"""
+    heads, collocates = [], []
+    for distance in range(1, min(window, len(tokens) - 1) + 1):
+        heads += [tokens[:-distance], tokens[distance:]]
+        collocates += [tokens[distance:], tokens[:-distance]]
+    if not heads:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(heads), np.concatenate(collocates)
+
+
+def build_collocations(collocations_dir=COLLOCATIONS_DIR, group_by='year', text='lemmatized_text', window=WINDOW,
+                       shards=SHARDS):
+    """Reads the corpus once and saves the windowed co-occurrence counts of every slice (year or province)"""
+    if group_by not in GROUP_BY:
+        raise ValueError(f'unknown grouping {group_by}, it must be one of {GROUP_BY}')
+    start_cfg_date, end_cfg_date = get_dates_from_cfg()
+    os.makedirs(collocations_dir, exist_ok=True)
+    # A new spill directory per run, so the shards left by a crashed run are never merged again
+    spill_dir = tempfile.mkdtemp(prefix=SPILL_DIR_PREFIX, dir=collocations_dir)
+    try:
+        vocabulary, counters = _count_pairs(spill_dir, start_cfg_date, end_cfg_date, group_by, text, window, shards)
+        _save_shards(collocations_dir, vocabulary, counters, shards)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    save_vocabulary(f'{collocations_dir}/{VOCABULARY_FILE}', vocabulary)
+    save_meta(collocations_dir, group_by=group_by, text=text, window=window, shards=shards, slices=list(counters))
+
+
+def _count_pairs(spill_dir, start_date, end_date, group_by, text, window, shards):
+    vocabulary = {}
+    counters = {}
+    for category, date, article in read_articles(start_date, end_date):
+        print(f'\tExtracting {category} {date}\'s collocations...', end='\r')
+        slice_name = str(date.year if group_by == 'year' else category)
+        counter = counters.setdefault(slice_name, _ShardedPairsCounter(spill_dir, slice_name, shards))
+        # The windows don't cross the limits between the title, the lead and the body
+        for part in ARTICLE_PARTS:
+            words = split_words(article[part][text])
+            tokens = np.fromiter((vocabulary.setdefault(word, len(vocabulary)) for word in words), dtype=np.int64,
+                                 count=len(words))
+            counter.add(*get_window_pairs(tokens, window))
+        if sum(c.pending for c in counters.values()) >= PAIRS_CHUNK_SIZE:
+            for c in counters.values():
+                c.spill()
+    print()
+    return vocabulary, counters
+
+
+def _save_shards(collocations_dir, vocabulary, counters, shards):
+    shard_rows = -(-len(vocabulary) // shards)
+    for slice_name, counter in counters.items():
+        print(f'Merging {slice_name}\'s shards...')
+        counter.spill()
+        marginals = np.zeros(len(vocabulary), dtype=np.int64)
+        for shard in range(shards):
+            keys, counts = counter.merge_shard(shard)
+            heads, collocates = keys >> TERM_BITS, keys & ((1 << TERM_BITS) - 1)
+            # Symmetric counts, so the head marginals are the collocate marginals too
+            np.add.at(marginals, heads, counts)
+            save_rows(collocations_dir, SHARD_NAME.format(slice=slice_name, shard=shard), heads // shards,
+                      collocates.astype(np.int32), counts, shard_rows)
+        np.save(f'{collocations_dir}/{MARGINALS_FILE.format(slice=slice_name)}', marginals)
+
+
+def get_log_likelihoods(pair_counts, head_marginal, collocate_marginals, total):
+    """Dunning's log-likelihood ratio (G2) of the 2x2 contingency table of every (head, collocate) pair"""
+    observed = np.array([pair_counts,
+                         head_marginal - pair_counts,
+                         collocate_marginals - pair_counts,
+                         total - head_marginal - collocate_marginals + pair_counts], dtype=np.float64)
+    expected = np.array([head_marginal * collocate_marginals,
+                         head_marginal * (total - collocate_marginals),
+                         (total - head_marginal) * collocate_marginals,
+                         (total - head_marginal) * (total - collocate_marginals)], dtype=np.float64) / total
+    terms = np.zeros(observed.shape)
+    np.multiply(observed, np.log(observed / expected, where=observed > 0, out=np.zeros(observed.shape)), out=terms,
+                where=observed > 0)
+    return 2 * terms.sum(axis=0)
+
+
+class Collocations:
+    """Query API over the co-occurrence counts saved by `build_collocations`"""
+
+    def __init__(self, collocations_dir=COLLOCATIONS_DIR):
+        meta = load_meta(collocations_dir)
+        self.group_by = meta['group_by']
+        self.window = meta['window']
+        self.shards = meta['shards']
+        self.slices = meta['slices']
+        self.vocabulary = load_vocabulary(f'{collocations_dir}/{VOCABULARY_FILE}')
+        self.words = list(self.vocabulary)
+        self.marginals = {slice_name: np.load(f'{collocations_dir}/{MARGINALS_FILE.format(slice=slice_name)}',
+                                              mmap_mode='r') for slice_name in self.slices}
+        self.pairs = {(slice_name, shard): load_rows(collocations_dir, SHARD_NAME.format(slice=slice_name, shard=shard))
+                      for slice_name in self.slices for shard in range(self.shards)}
+
+    def get_collocates(self, word, slice_name, measure='pmi', top=20, min_count=5):
+        """Returns a list of (collocate, score, count) tuples with the best collocates of the word in the slice"""
+        if measure not in MEASURES:
+            raise ValueError(f'unknown measure {measure}, it must be one of {MEASURES}')
+        slice_name = str(slice_name)
+        if word not in self.vocabulary or slice_name not in self.marginals:
+            return []
+        head = self.vocabulary[word]
+        collocates, counts = get_row(self.pairs[(slice_name, head % self.shards)], head // self.shards)
+        keep = (counts >= min_count) & (collocates != head)
+        collocates, counts = np.asarray(collocates[keep]), np.asarray(counts[keep], dtype=np.float64)
+        marginals = self.marginals[slice_name]
+        total, head_marginal, collocate_marginals = marginals.sum(), marginals[head], marginals[collocates]
+        if measure == 'pmi':
+            scores = np.log2(counts * total / (head_marginal * collocate_marginals))
+        elif measure == 'llr':
+            scores = get_log_likelihoods(counts, head_marginal, collocate_marginals, total)
+        else:
+            scores = counts
+        best = np.argsort(-scores, kind='stable')[:top]
+        return [(self.words[collocates[i]], float(scores[i]), int(counts[i])) for i in best]
+
+    def get_collocates_over_slices(self, word, measure='pmi', top=20, min_count=5):
+        """Returns a {slice: collocates} dict, e.g. to see how the collocates of a word changed over the years"""
+        return {slice_name: self.get_collocates(word, slice_name, measure, top, min_count)
+                for slice_name in sorted(self.slices)}
+
+
+if __name__ == '__main__':
+    # Example:
+    build_collocations(group_by='year', text='lemmatized_text_reduced')
+    collocations = Collocations()
+    for year, year_collocates in collocations.get_collocates_over_slices('corrupción', measure='llr').items():
+        print(f'{year}: {", ".join(collocate for collocate, _, _ in year_collocates)}')
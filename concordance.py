@@ -0,0 +1,247 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Keyword-in-context (KWIC) concordances, to see how a word is actually used without grepping the JSONs by hand.
+
+`build_concordance` copies the raw and lemmatized texts of every article part into a UTF-8 file per text (one line per
+part), which is memory-mapped when queried, along with:
+
+* The byte offsets and the term id of every token, and the range of tokens of every part (raw binary arrays, also
+  memory-mapped).
+* A token-position index (CSR, see `sparse_store`) with the positions of every term and the part they belong to.
+* A CSV with the url, province and date of every article.
+
+Unlike the counts of `news_stats.py` (`split_words`, by single spaces), the texts are tokenised by any whitespace, as the
+raw text has line breaks between paragraphs and every part must fit in a single line of the blob, so the occurrences of
+a term may differ slightly from the ones of the words_count_*.csv.
+
+Queries are case-insensitive and may be a single word or a phrase. Only the context windows that are returned are read
+from the blob, and very frequent terms can be paginated or randomly sampled.
+
+It can be queried from the command line too:
+
+    python concordance.py -q "trama" [-t lemmatized_text -w 10 -n 20 -o 0 -r]
+"""
+import csv
+import datetime
+import getopt
+import mmap
+import os
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+from news_stats import ARTICLE_PARTS, DATES_SQL_FORMAT, get_dates_from_cfg, read_articles
+from sparse_store import get_row, load_meta, load_rows, load_vocabulary, save_meta, save_rows, save_vocabulary
+
+CONCORDANCE_DIR = 'concordance'
+TEXTS = ['raw_text', 'lemmatized_text']
+ARTICLES_FILE = 'articles.csv'
+BLOB_FILE = '{text}.txt'
+VOCABULARY_FILE = '{text}_vocabulary.txt'
+POSITIONS_NAME = '{text}_positions'
+TOKEN_STARTS_FILE = '{text}_token_starts.bin'
+TOKEN_ENDS_FILE = '{text}_token_ends.bin'
+TOKEN_IDS_FILE = '{text}_token_ids.bin'
+PART_TOKENS_FILE = '{text}_part_tokens.bin'
+PART_ARTICLES_FILE = 'part_articles.bin'
+OFFSETS_DTYPE = np.int64
+IDS_DTYPE = np.int32
+WINDOW = 10
+LIMIT = 20
+
+ConcordanceLine = namedtuple('ConcordanceLine', ['province', 'date', 'url', 'part', 'left', 'keyword', 'right'])
+
+
+class _TextWriter:
+    """Appends the tokens of every article part of a text to its blob and its token arrays"""
+
+    def __init__(self, concordance_dir, text):
+        self.text = text
+        self.vocabulary = {}
+        self.blob_size = 0
+        self.tokens = 0
+        self._files = {path: open(f'{concordance_dir}/{path.format(text=text)}', 'wb')
+                       for path in (BLOB_FILE, TOKEN_STARTS_FILE, TOKEN_ENDS_FILE, TOKEN_IDS_FILE, PART_TOKENS_FILE)}
+        np.zeros(1, dtype=OFFSETS_DTYPE).tofile(self._files[PART_TOKENS_FILE])
+
+    def add_part(self, text):
+        tokens = text.split()
+        encoded = [token.encode('utf8') for token in tokens]
+        lengths = np.fromiter((len(token) for token in encoded), dtype=OFFSETS_DTYPE, count=len(encoded))
+        # Tokens are separated by a single space, and every part ends with a new line
+        starts = self.blob_size + np.concatenate([[0], np.cumsum(lengths + 1)])[:len(tokens)].astype(OFFSETS_DTYPE)
+        ids = np.fromiter((self.vocabulary.setdefault(token.lower(), len(self.vocabulary)) for token in tokens),
+                          dtype=IDS_DTYPE, count=len(tokens))
+        self._files[BLOB_FILE].write(b' '.join(encoded) + b'\n')
+        starts.tofile(self._files[TOKEN_STARTS_FILE])
+        (starts + lengths).tofile(self._files[TOKEN_ENDS_FILE])
+        ids.tofile(self._files[TOKEN_IDS_FILE])
+        self.blob_size += int(lengths.sum()) + max(len(tokens) - 1, 0) + 1
+        self.tokens += len(tokens)
+        np.array([self.tokens], dtype=OFFSETS_DTYPE).tofile(self._files[PART_TOKENS_FILE])
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+
+
+def build_concordance(concordance_dir=CONCORDANCE_DIR, texts=TEXTS, provinces=None, start_date=None, end_date=None):
+    """Builds the text store and the token-position index of the articles of the given provinces (those of
+    admitted_categories.txt by default) between both dates (those of config.cfg by default)"""
+    start_cfg_date, end_cfg_date = get_dates_from_cfg()
+    start_date, end_date = start_date or start_cfg_date, end_date or end_cfg_date
+    os.makedirs(concordance_dir, exist_ok=True)
+
+    writers = [_TextWriter(concordance_dir, text) for text in texts]
+    articles = 0
+    with open(f'{concordance_dir}/{ARTICLES_FILE}', 'w', newline='') as articles_csv, \
+            open(f'{concordance_dir}/{PART_ARTICLES_FILE}', 'wb') as part_articles:
+        # URLs may contain the delimiter, so the CSV module quotes them
+        articles_writer = csv.writer(articles_csv, delimiter=';')
+        articles_writer.writerow(['url', 'province', 'date'])
+        for category, date, article in read_articles(start_date, end_date, provinces):
+            print(f'\tStoring {category} {date}\'s texts...', end='\r')
+            articles_writer.writerow([article['url'], category, date.strftime(DATES_SQL_FORMAT)])
+            for part in ARTICLE_PARTS:
+                for writer in writers:
+                    writer.add_part(article[part][writer.text])
+            np.full(len(ARTICLE_PARTS), articles, dtype=IDS_DTYPE).tofile(part_articles)
+            articles += 1
+    print()
+
+    for writer in writers:
+        print(f'Indexing {writer.text}\'s positions...')
+        writer.close()
+        token_ids = np.fromfile(f'{concordance_dir}/{TOKEN_IDS_FILE.format(text=writer.text)}', dtype=IDS_DTYPE)
+        part_tokens = np.fromfile(f'{concordance_dir}/{PART_TOKENS_FILE.format(text=writer.text)}',
+                                  dtype=OFFSETS_DTYPE)
+        token_parts = np.repeat(np.arange(len(part_tokens) - 1, dtype=IDS_DTYPE), np.diff(part_tokens))
+        save_rows(concordance_dir, POSITIONS_NAME.format(text=writer.text), token_ids,
+                  np.arange(len(token_ids), dtype=OFFSETS_DTYPE), token_parts, len(writer.vocabulary))
+        save_vocabulary(f'{concordance_dir}/{VOCABULARY_FILE.format(text=writer.text)}', writer.vocabulary)
+    save_meta(concordance_dir, texts=list(texts), articles=articles, start_date=start_date.strftime(DATES_SQL_FORMAT),
+              end_date=end_date.strftime(DATES_SQL_FORMAT))
+
+
+class _TextStore:
+    """Memory-mapped blob, token arrays and position index of a text"""
+
+    def __init__(self, concordance_dir, text):
+        with open(f'{concordance_dir}/{BLOB_FILE.format(text=text)}', 'rb') as f:
+            self.blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+        self.token_starts, self.token_ends, self.token_ids, self.part_tokens = (
+            _load_array(f'{concordance_dir}/{path.format(text=text)}', dtype)
+            for path, dtype in ((TOKEN_STARTS_FILE, OFFSETS_DTYPE), (TOKEN_ENDS_FILE, OFFSETS_DTYPE),
+                                (TOKEN_IDS_FILE, IDS_DTYPE), (PART_TOKENS_FILE, OFFSETS_DTYPE)))
+        self.positions = load_rows(concordance_dir, POSITIONS_NAME.format(text=text))
+        self.vocabulary = load_vocabulary(f'{concordance_dir}/{VOCABULARY_FILE.format(text=text)}')
+
+    def decode(self, start, end):
+        return self.blob[start:end].decode('utf8')
+
+
+def _load_array(path, dtype):
+    return np.memmap(path, dtype=dtype, mode='r') if os.path.getsize(path) else np.zeros(0, dtype=dtype)
+
+
+class Concordance:
+    """Query API over a store built with `build_concordance`"""
+
+    def __init__(self, concordance_dir=CONCORDANCE_DIR):
+        meta = load_meta(concordance_dir)
+        self.stores = {text: _TextStore(concordance_dir, text) for text in meta['texts']}
+        self.part_articles = _load_array(f'{concordance_dir}/{PART_ARTICLES_FILE}', IDS_DTYPE)
+        with open(f'{concordance_dir}/{ARTICLES_FILE}', newline='') as f:
+            articles_reader = csv.reader(f, delimiter=';')
+            next(articles_reader)
+            self.articles = list(articles_reader)
+
+    def get_matches(self, query, text='lemmatized_text'):
+        """Returns the positions of the first token of every occurrence of the query (a word or a phrase) and the
+        parts where they are"""
+        store = self.stores[text]
+        words = query.lower().split()
+        if not words or any(word not in store.vocabulary for word in words):
+            return np.zeros(0, dtype=OFFSETS_DTYPE), np.zeros(0, dtype=IDS_DTYPE)
+        positions, parts = (np.asarray(array) for array in get_row(store.positions, store.vocabulary[words[0]]))
+        # The rest of the phrase has to follow the first word without leaving its part
+        for distance, word in enumerate(words[1:], 1):
+            following = positions + distance
+            keep = following < store.part_tokens[parts + 1]
+            keep[keep] = store.token_ids[following[keep]] == store.vocabulary[word]
+            positions, parts = positions[keep], parts[keep]
+        return positions, parts
+
+    def count(self, query, text='lemmatized_text'):
+        return len(self.get_matches(query, text)[0])
+
+    def get_concordance(self, query, text='lemmatized_text', window=WINDOW, limit=LIMIT, offset=0, sample=False,
+                        seed=None):
+        """Returns a list of `ConcordanceLine` with up to `window` tokens at each side of the occurrences of the query.
+        The occurrences are paginated with `limit` and `offset` in corpus order, or randomly chosen if `sample` is set"""
+        store = self.stores[text]
+        positions, parts = self.get_matches(query, text)
+        if sample:
+            chosen = np.sort(np.random.default_rng(seed).choice(len(positions), min(limit, len(positions)),
+                                                                replace=False))
+        else:
+            chosen = np.arange(offset, min(offset + limit, len(positions)))
+        query_length = len(query.split())
+        lines = []
+        for position, part in zip(positions[chosen], parts[chosen]):
+            last = position + query_length - 1
+            left = max(store.part_tokens[part], position - window)
+            right = min(store.part_tokens[part + 1] - 1, last + window)
+            url, province, date = self.articles[self.part_articles[part]]
+            lines.append(ConcordanceLine(
+                province, datetime.datetime.strptime(date, DATES_SQL_FORMAT).date(), url,
+                ARTICLE_PARTS[part % len(ARTICLE_PARTS)],
+                store.decode(store.token_starts[left], store.token_starts[position]).rstrip(),
+                store.decode(store.token_starts[position], store.token_ends[last]),
+                store.decode(store.token_ends[last], store.token_ends[right]).lstrip()))
+        return lines
+
+
+def format_line(line, width=WINDOW * 8):
+    """KWIC layout, with the keywords aligned in the same column"""
+    return f'{line.province};{line.date.strftime(DATES_SQL_FORMAT)};{line.url};{line.part};' \
+           f'{line.left[-width:]:>{width}} [{line.keyword}] {line.right[:width]}'
+
+
+if __name__ == '__main__':
+    usage = f'usage: {sys.argv[0]} -q <query> [-d <concordance_dir> -t <text> -w <window> -n <limit> -o <offset> -r]'
+    [query, concordance_dir, text, window, limit, offset, sample] = [None, CONCORDANCE_DIR, 'lemmatized_text', WINDOW,
+                                                                     LIMIT, 0, False]
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], 'hq:d:t:w:n:o:r', ['help', 'query=', 'dir=', 'text=', 'window=',
+                                                                'limit=', 'offset=', 'random'])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(usage)
+            sys.exit()
+        elif opt in ('-q', '--query'):
+            query = arg
+        elif opt in ('-d', '--dir'):
+            concordance_dir = arg
+        elif opt in ('-t', '--text'):
+            text = arg
+        elif opt in ('-w', '--window'):
+            window = int(arg)
+        elif opt in ('-n', '--limit'):
+            limit = int(arg)
+        elif opt in ('-o', '--offset'):
+            offset = int(arg)
+        elif opt in ('-r', '--random'):
+            sample = True
+    if query is None:
+        print(usage)
+        sys.exit(2)
+    concordance = Concordance(concordance_dir)
+    print(f'{concordance.count(query, text)} occurrences of "{query}"')
+    for concordance_line in concordance.get_concordance(query, text, window, limit, offset, sample):
+        print(format_line(concordance_line))
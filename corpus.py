@@ -0,0 +1,240 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Corpus session object for interactive work from the REPL, so exploratory queries don't re-read the whole dump every
+time like the functions of `news_stats.py` do:
+
+* The catalog (province, day and file name of every article) is built on first use by listing the directories,
+  without opening any JSON, and kept as NumPy columns.
+* Articles are tiny `__slots__` records pointing to their row of the catalog.
+* Heavy fields (texts, NEC lists...) are read from disk on first access and kept in an LRU cache bounded by size, so
+  repeated queries over the same slice hit memory instead of disk.
+
+    >>> corpus = Corpus()
+    >>> madrid_2016 = corpus.select(provinces=['MADRID'], start_date=datetime.date(2016, 1, 1),
+    ...                             end_date=datetime.date(2016, 12, 31))
+    >>> for month, articles in madrid_2016.group_by('month').items():
+    ...     print(month, len(articles), sum(len(article.get_text().split()) for article in articles))
+"""
+import datetime
+import json
+import os
+import sys
+
+import numpy as np
+
+from caching import LRUCache
+from calendar_table import CalendarTable
+from entities import ENTITY_TYPES
+from news_stats import (ARTICLE_PARTS, DATES_FILE_FORMAT, DUMP_DIR, get_dates_between, get_dates_from_cfg,
+                        read_categories_from_file)
+
+CACHE_SIZE = 1 << 30
+_MISSING = object()
+
+
+def _get_size(value):
+    """Approximate memory of a field, counting the strings inside NEC lists too"""
+    if isinstance(value, list):
+        return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class Article:
+    """Lightweight record of an article: its fields are read through the corpus, which caches them"""
+    __slots__ = ('corpus', 'index')
+
+    def __init__(self, corpus, index):
+        self.corpus = corpus
+        self.index = index
+
+    def __repr__(self):
+        return f'Article({self.province}, {self.date}, {self.filename})'
+
+    @property
+    def province(self):
+        return self.corpus.provinces[self.corpus.province_codes[self.index]]
+
+    @property
+    def date(self):
+        return self.corpus.calendar.start_date + datetime.timedelta(days=int(self.corpus.days[self.index]))
+
+    @property
+    def filename(self):
+        return self.corpus.filenames[self.index]
+
+    @property
+    def path(self):
+        return f'{self.corpus.dump_dir}/{self.province}/{self.date.strftime(DATES_FILE_FORMAT)}/{self.filename}'
+
+    @property
+    def url(self):
+        return self.corpus.get_url(self.index)
+
+    def get_field(self, part, field):
+        return self.corpus.get_field(self.index, part, field)
+
+    def get_text(self, text='lemmatized_text', parts=ARTICLE_PARTS):
+        return ' '.join(self.get_field(part, text) for part in parts)
+
+    def get_entities(self, entity_types=ENTITY_TYPES, parts=ARTICLE_PARTS):
+        """Returns a list of (class, name) tuples with the named entities of the article"""
+        return [(entity_type, name) for part in parts for entity_type in entity_types
+                for name in self.get_field(part, entity_type)]
+
+
+class Selection:
+    """A subset of the articles of the corpus, stored as an array of catalog rows"""
+    __slots__ = ('corpus', 'indices')
+
+    def __init__(self, corpus, indices):
+        self.corpus = corpus
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        return (Article(self.corpus, int(index)) for index in self.indices)
+
+    def __getitem__(self, position):
+        return Article(self.corpus, int(self.indices[position]))
+
+    def __repr__(self):
+        return f'Selection({len(self)} articles)'
+
+    def select(self, provinces=None, start_date=None, end_date=None):
+        """Vectorised filter by the catalog columns, without reading any article"""
+        keep = np.ones(len(self.indices), dtype=bool)
+        if provinces is not None:
+            codes = [self.corpus.provinces.index(province) for province in provinces]
+            keep &= np.isin(self.corpus.province_codes[self.indices], codes)
+        days = self.corpus.days[self.indices]
+        if start_date is not None:
+            keep &= days >= self.corpus.calendar.get_offset(start_date)
+        if end_date is not None:
+            keep &= days <= self.corpus.calendar.get_offset(end_date)
+        return Selection(self.corpus, self.indices[keep])
+
+    def filter(self, predicate):
+        """Keeps the articles for which `predicate(article)` is true (reading the fields it accesses)"""
+        return Selection(self.corpus, np.array([article.index for article in self if predicate(article)],
+                                               dtype=np.int64))
+
+    def group_by(self, *fields):
+        """Returns a {label: Selection} dict grouping the articles by province and/or any field of `CalendarTable`,
+        e.g. `group_by('province', 'year')` gives labels like 'MADRID-2016'"""
+        columns = [self.corpus.province_codes[self.indices] if field == 'province' else
+                   self.corpus.calendar.get_column(field)[self.corpus.days[self.indices]] for field in fields]
+        if not len(self.indices):
+            return {}
+        groups, inverse = np.unique(np.stack(columns, axis=1), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.cumsum(np.bincount(inverse, minlength=len(groups)))[:-1]
+        return {self._format_group(fields, group): Selection(self.corpus, indices)
+                for group, indices in zip(groups, np.split(self.indices[order], bounds))}
+
+    def _format_group(self, fields, group):
+        return '-'.join(self.corpus.provinces[value] if field == 'province' else
+                        CalendarTable.format_group([field], [int(value)]) for field, value in zip(fields, group))
+
+    def get_texts(self, text='lemmatized_text', parts=ARTICLE_PARTS):
+        return (article.get_text(text, parts) for article in self)
+
+
+class Corpus(Selection):
+    """Every article of the given provinces (those of admitted_categories.txt by default) between both dates (those of
+    config.cfg by default). The catalog is built the first time it is needed"""
+    __slots__ = ('dump_dir', 'calendar', 'cache', 'loads', '_provinces', '_catalog', '_urls')
+
+    def __init__(self, provinces=None, start_date=None, end_date=None, dump_dir=DUMP_DIR, cache_size=CACHE_SIZE):
+        start_cfg_date, end_cfg_date = get_dates_from_cfg()
+        self.dump_dir = dump_dir
+        self.calendar = CalendarTable(start_date or start_cfg_date, end_date or end_cfg_date)
+        self.cache = LRUCache(cache_size, get_size=_get_size)
+        self.loads = 0
+        self._provinces = provinces
+        self._catalog = None
+        self._urls = None
+
+    def __repr__(self):
+        return f'Corpus({len(self)} articles, {len(self.cache)} cached fields)'
+
+    @property
+    def corpus(self):
+        return self
+
+    @property
+    def indices(self):
+        return self._get_catalog()['indices']
+
+    @property
+    def provinces(self):
+        return self._get_catalog()['provinces']
+
+    @property
+    def province_codes(self):
+        return self._get_catalog()['province_codes']
+
+    @property
+    def days(self):
+        return self._get_catalog()['days']
+
+    @property
+    def filenames(self):
+        return self._get_catalog()['filenames']
+
+    def _get_catalog(self):
+        if self._catalog is None:
+            provinces = list(self._provinces or read_categories_from_file())
+            province_codes, days, filenames = [], [], []
+            for code, province in enumerate(provinces):
+                print(f'\tListing {province}\'s articles...', end='\r')
+                for day, date in enumerate(get_dates_between(self.calendar.start_date, self.calendar.end_date)):
+                    try:
+                        day_filenames = os.listdir(f'{self.dump_dir}/{province}/{date.strftime(DATES_FILE_FORMAT)}')
+                    except FileNotFoundError:
+                        continue
+                    filenames += day_filenames
+                    province_codes += [code] * len(day_filenames)
+                    days += [day] * len(day_filenames)
+            print()
+            self._catalog = {'provinces': provinces,
+                             'province_codes': np.array(province_codes, dtype=np.int16),
+                             'days': np.array(days, dtype=np.int32),
+                             'filenames': filenames,
+                             'indices': np.arange(len(filenames), dtype=np.int64)}
+            self._urls = [None] * len(filenames)
+        return self._catalog
+
+    def _load_article(self, index):
+        self.loads += 1
+        with open(Article(self, index).path) as f:
+            article = json.load(f)
+        self._urls[index] = article['url']
+        return article
+
+    def get_url(self, index):
+        if self._urls[index] is None:
+            self._load_article(index)
+        return self._urls[index]
+
+    def get_field(self, index, part, field):
+        """Returns a field of a part of an article, from the cache or from disk. A miss caches the field of every part
+        of the article, since they are usually read together"""
+        value = self.cache.get((index, part, field), _MISSING)
+        if value is _MISSING:
+            article = self._load_article(index)
+            for article_part in ARTICLE_PARTS:
+                self.cache.put((index, article_part, field), article[article_part][field])
+            value = article[part][field]
+        return value
+
+
+if __name__ == '__main__':
+    # Example:
+    corpus = Corpus()
+    for group, articles in corpus.select(provinces=['MADRID']).group_by('year').items():
+        words = [len(text.split()) for text in articles.get_texts('lemmatized_text_reduced')]
+        print(f'{group};{len(articles)};{sum(words) / max(len(words), 1)}')
@@ -0,0 +1,203 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Joins the per-slice `slice;word;count` CSVs generated by `news_stats.py` (`words_count_{year}.csv`, per season, per
+category...) into a single word x slice table, without importing them into a database and without loading them in
+memory: the rows are accumulated up to a memory limit, sorted and written to temporary runs, and the runs are merged
+(k-way, in several passes if there are too many) so the words come out sorted and every word is written at once.
+
+The output can be wide (a column per slice) or long (a `word;slice;count` row per pair), optionally normalised by the
+total amount of words of every slice (occurrences per million words):
+
+    python csv_pivot.py -o words_per_year.csv words_count_20*.csv
+    python csv_pivot.py -f long -n -m 512M -o words_per_province_long.csv words_count_[A-Z]*.csv
+"""
+import getopt
+import heapq
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+
+from spill_counter import DICT_ENTRY_BYTES, parse_memory_limit, read_spill_records, write_spill_record
+
+MEMORY_LIMIT = 256 << 20
+FAN_IN = 64
+# Besides the word, every buffered row has a (word, slice) tuple key
+RUN_ENTRY_BYTES = DICT_ENTRY_BYTES + 64
+PER_MILLION = 1_000_000
+FORMATS = ['wide', 'long']
+
+
+def read_slice_csv(path):
+    """Yields the (slice, word, count) rows of a CSV. The word is everything between the first and the last separator,
+    as raw words may contain semicolons"""
+    with open(path) as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            label, _, rest = line.partition(';')
+            word, _, count = rest.rpartition(';')
+            yield label, word, int(count)
+
+
+class ExternalPivot:
+    """Accumulates (slice, word, count) rows in memory up to `memory_limit` bytes and in sorted runs on disk after"""
+
+    def __init__(self, memory_limit=MEMORY_LIMIT, fan_in=FAN_IN, spill_dir=None):
+        self.memory_limit = memory_limit
+        self.fan_in = fan_in
+        self.spill_dir = spill_dir
+        self.slices = []
+        self.slice_indices = {}
+        self.totals = []
+        self.counts = {}
+        self.memory = 0
+        self.runs = []
+        self._written_runs = 0
+        self._runs_dir = None
+
+    def add(self, label, word, count):
+        if label not in self.slice_indices:
+            self.slice_indices[label] = len(self.slices)
+            self.slices.append(label)
+            self.totals.append(0)
+        slice_index = self.slice_indices[label]
+        self.totals[slice_index] += count
+        key = (word, slice_index)
+        if key in self.counts:
+            self.counts[key] += count
+        else:
+            self.counts[key] = count
+            self.memory += sys.getsizeof(word) + RUN_ENTRY_BYTES
+            if self.memory >= self.memory_limit:
+                self.spill()
+
+    def add_file(self, path):
+        print(f'Reading {path}...')
+        for label, word, count in read_slice_csv(path):
+            self.add(label, word, count)
+
+    def _new_run_path(self):
+        if self._runs_dir is None:
+            self._runs_dir = tempfile.mkdtemp(prefix='csv_pivot_', dir=self.spill_dir)
+        self._written_runs += 1
+        return f'{self._runs_dir}/{self._written_runs}.jsonl'
+
+    def _write_run(self, rows):
+        path = self._new_run_path()
+        with open(path, 'w', encoding='utf8') as f:
+            for word, slice_index, count in rows:
+                write_spill_record(f, word, slice_index, count)
+        self.runs.append(path)
+
+    def spill(self):
+        """Writes the rows in memory, sorted by word and slice, as a new run"""
+        if self.counts:
+            self._write_run((word, slice_index, self.counts[word, slice_index])
+                            for word, slice_index in sorted(self.counts))
+        self.counts = {}
+        self.memory = 0
+
+    def _merge_runs(self):
+        """Yields every (word, slice index, count) row sorted, merging at most `fan_in` runs at a time"""
+        if not self.runs:
+            yield from ((word, slice_index, self.counts[word, slice_index]) for word, slice_index in sorted(self.counts))
+            return
+        self.spill()
+        if len(self.runs) > self.fan_in:
+            while len(self.runs) > self.fan_in:
+                print(f'\tMerging {self.fan_in} of {len(self.runs)} runs...', end='\r')
+                merged, self.runs = self.runs[:self.fan_in], self.runs[self.fan_in:]
+                self._write_run(heapq.merge(*(read_spill_records(path) for path in merged)))
+                for path in merged:
+                    os.remove(path)
+            print()
+        yield from heapq.merge(*(read_spill_records(path) for path in self.runs))
+
+    def rows(self):
+        """Yields a (word, {slice index: count}) tuple for every word, sorted by word. The runs are removed at the end"""
+        try:
+            for word, word_rows in itertools.groupby(self._merge_runs(), key=lambda row: row[0]):
+                counts = {}
+                for _, slice_index, count in word_rows:
+                    counts[slice_index] = counts.get(slice_index, 0) + count
+                yield word, counts
+        finally:
+            if self._runs_dir is not None:
+                shutil.rmtree(self._runs_dir, ignore_errors=True)
+                self._runs_dir = None
+            self.runs = []
+
+    def _get_value(self, counts, slice_index, normalize):
+        count = counts.get(slice_index, 0)
+        if normalize:
+            return count / self.totals[slice_index] * PER_MILLION if self.totals[slice_index] else 0.0
+        return count
+
+    def write_wide(self, path, normalize=False):
+        """Writes a `word;slice_1;...;slice_n` table, with zeros for the slices where the word doesn't appear"""
+        with open(path, 'w') as f:
+            print(';'.join(['word'] + self.slices), file=f)
+            for word, counts in self.rows():
+                print(';'.join([word] + [str(self._get_value(counts, slice_index, normalize))
+                                         for slice_index in range(len(self.slices))]), file=f)
+
+    def write_long(self, path, normalize=False):
+        """Writes a `word;slice;count` row (plus the frequency per million words if normalised) per pair"""
+        with open(path, 'w') as f:
+            print('word;slice;count' + (';per_million' if normalize else ''), file=f)
+            for word, counts in self.rows():
+                for slice_index in sorted(counts):
+                    frequency = f';{self._get_value(counts, slice_index, True)}' if normalize else ''
+                    print(f'{word};{self.slices[slice_index]};{counts[slice_index]}{frequency}', file=f)
+
+
+def pivot_csvs(paths, output_path, output_format='wide', normalize=False, memory_limit=MEMORY_LIMIT, fan_in=FAN_IN,
+               spill_dir=None):
+    if output_format not in FORMATS:
+        raise ValueError(f'unknown format {output_format}, it must be one of {FORMATS}')
+    pivot = ExternalPivot(memory_limit, fan_in, spill_dir)
+    for path in paths:
+        pivot.add_file(path)
+    print(f'{len(pivot.slices)} slices, {len(pivot.runs)} runs written to disk')
+    if output_format == 'wide':
+        pivot.write_wide(output_path, normalize)
+    else:
+        pivot.write_long(output_path, normalize)
+    return pivot
+
+
+if __name__ == '__main__':
+    usage = f'usage: {sys.argv[0]} -o <output_csv> [-f wide|long -n -m <memory_limit> -k <fan_in> -T <tmp_dir>] ' \
+            f'<csv>...'
+    [output_path, output_format, normalize, memory_limit, fan_in, spill_dir] = \
+        [None, 'wide', False, MEMORY_LIMIT, FAN_IN, None]
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'ho:f:nm:k:T:', ['help', 'output=', 'format=', 'normalize',
+                                                                  'memory-limit=', 'fan-in=', 'tmp-dir='])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(usage)
+            sys.exit()
+        elif opt in ('-o', '--output'):
+            output_path = arg
+        elif opt in ('-f', '--format'):
+            output_format = arg
+        elif opt in ('-n', '--normalize'):
+            normalize = True
+        elif opt in ('-m', '--memory-limit'):
+            memory_limit = parse_memory_limit(arg)
+        elif opt in ('-k', '--fan-in'):
+            fan_in = int(arg)
+        elif opt in ('-T', '--tmp-dir'):
+            spill_dir = arg
+    if output_path is None or not args:
+        print(usage)
+        sys.exit(2)
+    pivot_csvs(args, output_path, output_format, normalize, memory_limit, fan_in, spill_dir)
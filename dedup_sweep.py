@@ -0,0 +1,219 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Measures how `duplicates_remover.py` behaves with other settings before changing them. Near-duplicates are planted in a
+sample of the real corpus (or in a synthetic one): a share of the articles gets a copy that is edited (some words
+replaced), truncated or relabelled to another province (same body). Then the same `DuplicateChecker` is run with every
+combination of threshold, number of permutations and LSH bands x rows, reporting:
+
+* Recall: planted duplicates removed (exactly one article of the original and its copy), also per kind of copy.
+* Precision: removed articles that were duplicates (an article is wrongly removed if it wasn't planted, or if both the
+  original and its copy were removed).
+* Articles per second and peak memory (traced with tracemalloc in a second run, as tracing slows it down).
+
+    python dedup_sweep.py -D ~/dump -n 10000 -t 0.5,0.6,0.7,0.8,0.9    # Samples the real corpus (config.cfg dates)
+    python dedup_sweep.py -D ~/dump -b 16x8,32x4,20x5 -p 128 -n 20000
+    python dedup_sweep.py -p 64,128,256               # Synthetic corpus, only to compare speed and memory
+
+The real sample (`-D`) is the one to choose THRESHOLD with. How many unrelated articles are wrongly removed depends on
+how many words they share, and the synthetic articles (words drawn from a bigger vocabulary than the one of
+`synthetic_corpus.py` by default, `SWEEP_VOCABULARY_SIZE`, but without topics or the lengths of real news) don't share
+them as real ones do, so their precision is not reliable. Note that the sampled real corpus may already have
+duplicates of its own, which count as wrong removals.
+"""
+import datetime
+import getopt
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from duplicates_remover import NUM_PERM, THRESHOLD, DuplicateChecker
+from news_stats import get_day_dirs, get_dates_from_cfg
+from synthetic_corpus import ARTICLES_PER_DAY, PROVINCES, START_DATE, SyntheticCorpus
+
+ARTICLES = 5000
+DUPLICATES_RATIO = 0.1
+EDIT_RATIO = 0.1
+TRUNCATE_RATIO = 0.7
+COPY_KINDS = ['edited', 'truncated', 'relabelled']
+THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9]
+NUM_PERMS = [64, NUM_PERM, 256]
+SEED = 2018
+# With the 5,000 words of `synthetic_corpus.py` two unrelated articles share far more words than real news do
+SWEEP_VOCABULARY_SIZE = 200000
+SWEEP_ZIPF_EXPONENT = 1.0
+SWEEP_CSV = 'dedup_sweep.csv'
+
+
+def get_synthetic_bodies(articles, seed=SEED, vocabulary_size=SWEEP_VOCABULARY_SIZE, zipf_exponent=SWEEP_ZIPF_EXPONENT):
+    synthetic_corpus = SyntheticCorpus(seed, vocabulary_size, zipf_exponent)
+    day_articles = len(PROVINCES) * ARTICLES_PER_DAY
+    return [synthetic_corpus.get_article(PROVINCES[number % len(PROVINCES)],
+                                         START_DATE + datetime.timedelta(days=number // day_articles), number,
+                                         raw=True)['body'] for number in range(articles)]
+
+
+def get_sampled_bodies(dump_dir, articles, seed=SEED):
+    """Bodies of a random sample of the articles between the dates of config.cfg (raw or analyzed)"""
+    start_cfg_date, end_cfg_date = get_dates_from_cfg()
+    paths = []
+    for _, _, day_dir in get_day_dirs(start_cfg_date, end_cfg_date, dump_dir=dump_dir):
+        try:
+            paths += [f'{day_dir}/{filename}' for filename in sorted(os.listdir(day_dir))]
+        except FileNotFoundError:
+            pass
+    bodies = []
+    for path in random.Random(seed).sample(paths, min(articles, len(paths))):
+        with open(path) as f:
+            body = json.load(f)['body']
+        body = body['raw_text'] if isinstance(body, dict) else body
+        if body:
+            bodies.append(body)
+    return bodies
+
+
+def plant_duplicates(bodies, duplicates_ratio=DUPLICATES_RATIO, edit_ratio=EDIT_RATIO, truncate_ratio=TRUNCATE_RATIO,
+                     seed=SEED):
+    """Returns the shuffled bodies with the copies added, the group of every body (an original and its copy share it)
+    and the kind of copy of every group (None for the articles without copy)"""
+    rng = random.Random(seed)
+    words = [word for body in bodies for word in body.split(' ')]
+    originals = rng.sample(range(len(bodies)), round(len(bodies) * duplicates_ratio))
+    articles = [(body, group) for group, body in enumerate(bodies)]
+    kinds = [None] * len(bodies)
+    for number, original in enumerate(originals):
+        kind = COPY_KINDS[number % len(COPY_KINDS)]
+        copy = bodies[original].split(' ')
+        if kind == 'edited':
+            for position in rng.sample(range(len(copy)), round(len(copy) * edit_ratio)):
+                copy[position] = rng.choice(words)
+        elif kind == 'truncated':
+            copy = copy[:max(1, round(len(copy) * truncate_ratio))]
+        articles.append((' '.join(copy), original))
+        kinds[original] = kind
+    rng.shuffle(articles)
+    return [body for body, _ in articles], [group for _, group in articles], kinds
+
+
+def run_checker(bodies, threshold, num_perm, params):
+    """Returns the checker and the keys of the articles it would remove"""
+    checker = DuplicateChecker(threshold, num_perm, params)
+    for key, body in enumerate(bodies):
+        checker.add_article(key, body)
+    return checker, set(checker.exact_duplicates) | set(checker.get_similar_articles())
+
+
+def evaluate(removed, groups, kinds):
+    """Returns the recall, precision, wrongly removed articles and recall per kind of copy (a group is only recalled
+    if exactly one of the original and its copy was removed)"""
+    sizes, removed_per_group = [0] * len(kinds), [0] * len(kinds)
+    for key, group in enumerate(groups):
+        sizes[group] += 1
+        removed_per_group[group] += key in removed
+    # Every group should keep exactly one article
+    wrong = sum(removed_per_group[group] - (sizes[group] - 1) for group in range(len(kinds))
+                if removed_per_group[group] > sizes[group] - 1)
+    expected = sum(size - 1 for size in sizes)
+    right = len(removed) - wrong
+    recall_per_kind = {}
+    for kind in COPY_KINDS:
+        kind_groups = [group for group in range(len(kinds)) if kinds[group] == kind]
+        recall_per_kind[kind] = sum(removed_per_group[group] == 1 for group in kind_groups) / len(kind_groups) \
+            if kind_groups else float('nan')
+    return (right / expected if expected else float('nan'), right / len(removed) if removed else 1.0, wrong,
+            recall_per_kind)
+
+
+def get_configurations(thresholds=THRESHOLDS, num_perms=NUM_PERMS, bands_rows=()):
+    """(threshold, num_perm, (bands, rows) or None) tuples: every threshold with datasketch's choice of bands and rows,
+    and every explicit bands x rows that fits in the permutations"""
+    configurations = []
+    for num_perm in num_perms:
+        configurations += [(threshold, num_perm, None) for threshold in thresholds]
+        configurations += [(None, num_perm, (bands, rows)) for bands, rows in bands_rows if bands * rows <= num_perm]
+    return configurations
+
+
+def sweep(bodies, groups, kinds, configurations, measure_memory=True, csv_name=SWEEP_CSV):
+    with open(csv_name, 'w') as csv_out:
+        print('threshold;num_perm;bands;rows;recall;precision;wrongly_removed;'
+              + ';'.join(f'recall_{kind}' for kind in COPY_KINDS) + ';articles_per_second;peak_memory_mb',
+              file=csv_out)
+        for threshold, num_perm, params in configurations:
+            # With explicit bands and rows the threshold isn't used
+            start = time.perf_counter()
+            checker, removed = run_checker(bodies, threshold or THRESHOLD, num_perm, params)
+            articles_per_second = len(bodies) / (time.perf_counter() - start)
+            peak_memory = float('nan')
+            if measure_memory:
+                tracemalloc.start()
+                run_checker(bodies, threshold or THRESHOLD, num_perm, params)
+                peak_memory = tracemalloc.get_traced_memory()[1] / (1 << 20)
+                tracemalloc.stop()
+            recall, precision, wrong, recall_per_kind = evaluate(removed, groups, kinds)
+            bands, rows = checker.lsh.b, checker.lsh.r
+            print(f'threshold {threshold or "-"}, {num_perm} permutations, {bands}x{rows}: recall {recall:.3f}, '
+                  f'precision {precision:.3f} ({wrong} wrongly removed), {articles_per_second:.0f} articles/s, '
+                  f'{peak_memory:.1f} MB')
+            print(f'{threshold or ""};{num_perm};{bands};{rows};{recall};{precision};{wrong};'
+                  + ';'.join(str(recall_per_kind[kind]) for kind in COPY_KINDS)
+                  + f';{articles_per_second};{peak_memory}', file=csv_out)
+
+
+if __name__ == '__main__':
+    usage = f'usage: {sys.argv[0]} [-n <articles> -D <dump_dir> -r <duplicates_ratio> -E <edit_ratio> ' \
+            f'-k <truncate_ratio> -t <thresholds> -p <num_perms> -b <bands>x<rows>,... -S <seed> -o <csv> ' \
+            f'--no-memory]'
+    [articles, dump_dir, duplicates_ratio, edit_ratio, truncate_ratio, thresholds, num_perms, bands_rows, seed,
+     csv_name, measure_memory] = [ARTICLES, None, DUPLICATES_RATIO, EDIT_RATIO, TRUNCATE_RATIO, THRESHOLDS, NUM_PERMS,
+                                  [], SEED, SWEEP_CSV, True]
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], 'hn:D:r:E:k:t:p:b:S:o:',
+                                ['help', 'articles=', 'dump-dir=', 'duplicates-ratio=', 'edit-ratio=',
+                                 'truncate-ratio=', 'thresholds=', 'num-perms=', 'bands-rows=', 'seed=', 'output=',
+                                 'no-memory'])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(usage)
+            sys.exit()
+        elif opt in ('-n', '--articles'):
+            articles = int(arg)
+        elif opt in ('-D', '--dump-dir'):
+            dump_dir = arg
+        elif opt in ('-r', '--duplicates-ratio'):
+            duplicates_ratio = float(arg)
+        elif opt in ('-E', '--edit-ratio'):
+            edit_ratio = float(arg)
+        elif opt in ('-k', '--truncate-ratio'):
+            truncate_ratio = float(arg)
+        elif opt in ('-t', '--thresholds'):
+            thresholds = [float(threshold) for threshold in arg.split(',')]
+        elif opt in ('-p', '--num-perms'):
+            num_perms = [int(num_perm) for num_perm in arg.split(',')]
+        elif opt in ('-b', '--bands-rows'):
+            bands_rows = [tuple(int(value) for value in pair.split('x')) for pair in arg.split(',')]
+            if not any(o in ('-t', '--thresholds') for o, _ in opts):
+                thresholds = []
+        elif opt in ('-S', '--seed'):
+            seed = int(arg)
+        elif opt in ('-o', '--output'):
+            csv_name = arg
+        elif opt == '--no-memory':
+            measure_memory = False
+    if dump_dir:
+        base_bodies = get_sampled_bodies(dump_dir, articles, seed)
+    else:
+        print('Warning: synthetic corpus, its precision is not reliable to choose THRESHOLD (sample the real corpus '
+              'with -D)')
+        base_bodies = get_synthetic_bodies(articles, seed)
+    sweep_bodies, sweep_groups, copy_kinds = plant_duplicates(base_bodies, duplicates_ratio, edit_ratio,
+                                                              truncate_ratio, seed)
+    print(f'{len(sweep_bodies)} articles, {len(sweep_bodies) - len(base_bodies)} planted duplicates')
+    sweep(sweep_bodies, sweep_groups, copy_kinds, get_configurations(thresholds, num_perms, bands_rows),
+          measure_memory, csv_name)
@@ -0,0 +1,163 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Exports a bag-of-words document-term matrix of the corpus for topic models, classifiers, etc., so it doesn't have to be
+rebuilt from the JSONs every time. The articles are streamed and their rows written to disk in blocks, so the matrix
+never has to fit in memory; then the vocabulary is pruned by document frequency (min_df/max_df) rewriting the matrix
+block by block too.
+
+The output directory has the CSR matrix as .npy files (memory-mappable, see `load_document_term_matrix`), the vocabulary
+(one term per line, the line number is the column) and a CSV with the url, province, date and part of every row
+(written with the csv module, as URLs may contain the delimiter).
+"""
+import csv
+import os
+
+import numpy as np
+from scipy import sparse
+
+from news_stats import ARTICLE_PARTS, DATES_SQL_FORMAT, get_dates_from_cfg, read_articles
+from sparse_store import (DATA_SUFFIX, INDICES_SUFFIX, INDPTR_SUFFIX, load_meta, load_rows, load_vocabulary,
+                          save_meta, save_vocabulary)
+
+DTM_DIR = 'document_term_matrix'
+DTM_NAME = 'dtm'
+VOCABULARY_FILE = 'vocabulary.txt'
+ROWS_FILE = 'rows.csv'
+ALL_PARTS = 'all'
+BLOCK_ROWS = 10_000
+INDICES_DTYPE = np.int32
+DATA_DTYPE = np.int32
+
+
+class _RowsWriter:
+    """Appends the rows of the matrix to raw binary files, in blocks"""
+
+    def __init__(self, output_dir):
+        self.indices_path = f'{output_dir}/{DTM_NAME}_{INDICES_SUFFIX}.tmp'
+        self.data_path = f'{output_dir}/{DTM_NAME}_{DATA_SUFFIX}.tmp'
+        self.row_lengths = []
+        self.document_frequencies = np.zeros(0, dtype=np.int64)
+        self._indices_file = open(self.indices_path, 'wb')
+        self._data_file = open(self.data_path, 'wb')
+        self._indices, self._data = [], []
+
+    def add_row(self, term_ids):
+        terms, counts = np.unique(np.asarray(term_ids, dtype=INDICES_DTYPE), return_counts=True)
+        self._indices.append(terms)
+        self._data.append(counts.astype(DATA_DTYPE))
+        self.row_lengths.append(len(terms))
+        if len(self._indices) >= BLOCK_ROWS:
+            self.flush()
+
+    def flush(self):
+        if self._indices:
+            indices = np.concatenate(self._indices)
+            if len(indices) and indices.max() >= len(self.document_frequencies):
+                self.document_frequencies = np.concatenate([
+                    self.document_frequencies,
+                    np.zeros(indices.max() + 1 - len(self.document_frequencies), dtype=np.int64)])
+            self.document_frequencies += np.bincount(indices, minlength=len(self.document_frequencies))
+            indices.tofile(self._indices_file)
+            np.concatenate(self._data).tofile(self._data_file)
+        self._indices, self._data = [], []
+
+    def close(self):
+        self.flush()
+        self._indices_file.close()
+        self._data_file.close()
+
+
+def _get_df_limit(df, rows):
+    """min_df/max_df may be an amount of rows (int) or a proportion of them (float)"""
+    return df if isinstance(df, int) else df * rows
+
+
+def export_document_term_matrix(output_dir=DTM_DIR, text='lemmatized_text_reduced', provinces=None, start_date=None,
+                                end_date=None, min_df=1, max_df=1.0, per_part=False):
+    """Exports the document-term matrix of the articles of the given provinces (those of admitted_categories.txt by
+    default) between both dates (those of config.cfg by default), with a row per article or, if `per_part` is set,
+    per article part (title, lead and body)"""
+    start_cfg_date, end_cfg_date = get_dates_from_cfg()
+    start_date, end_date = start_date or start_cfg_date, end_date or end_cfg_date
+    os.makedirs(output_dir, exist_ok=True)
+
+    vocabulary = {}
+    rows_writer = _RowsWriter(output_dir)
+    with open(f'{output_dir}/{ROWS_FILE}', 'w', newline='') as rows_csv:
+        # URLs may contain the delimiter, so the CSV module quotes them
+        rows_csv_writer = csv.writer(rows_csv, delimiter=';')
+        rows_csv_writer.writerow(['url', 'province', 'date', 'part'])
+        for category, date, article in read_articles(start_date, end_date, provinces):
+            print(f'\tExtracting {category} {date}\'s words...', end='\r')
+            parts = [[part] for part in ARTICLE_PARTS] if per_part else [ARTICLE_PARTS]
+            for row_parts in parts:
+                rows_writer.add_row([vocabulary.setdefault(word, len(vocabulary))
+                                     for part in row_parts for word in article[part][text].split()])
+                part_name = row_parts[0] if per_part else ALL_PARTS
+                rows_csv_writer.writerow([article['url'], category, date.strftime(DATES_SQL_FORMAT), part_name])
+    rows_writer.close()
+    print()
+
+    rows = len(rows_writer.row_lengths)
+    document_frequencies = np.zeros(len(vocabulary), dtype=np.int64)
+    document_frequencies[:len(rows_writer.document_frequencies)] = rows_writer.document_frequencies
+    kept = ((document_frequencies >= _get_df_limit(min_df, rows)) &
+            (document_frequencies <= _get_df_limit(max_df, rows)))
+    _write_pruned_matrix(output_dir, rows_writer, kept, int(document_frequencies[kept].sum()))
+
+    save_vocabulary(f'{output_dir}/{VOCABULARY_FILE}', (word for word, term_id in vocabulary.items() if kept[term_id]))
+    save_meta(output_dir, text=text, rows=rows, columns=int(kept.sum()), per_part=per_part, min_df=min_df,
+              max_df=max_df, start_date=start_date.strftime(DATES_SQL_FORMAT),
+              end_date=end_date.strftime(DATES_SQL_FORMAT))
+
+
+def _write_pruned_matrix(output_dir, rows_writer, kept, nnz):
+    """Rewrites the raw matrix into the final .npy files, block by block, dropping the pruned columns and renumbering
+    the kept ones (keeping their order, so the rows stay sorted). Every term appears once per row, so the amount of
+    non-zeros `nnz` is the sum of the document frequencies of the kept terms"""
+    new_ids = np.where(kept, np.cumsum(kept) - 1, -1)
+    row_lengths = np.array(rows_writer.row_lengths, dtype=np.int64)
+    raw_indptr = np.concatenate([[0], np.cumsum(row_lengths)])
+    raw_indices = np.memmap(rows_writer.indices_path, dtype=INDICES_DTYPE, mode='r') if raw_indptr[-1] else \
+        np.zeros(0, dtype=INDICES_DTYPE)
+    raw_data = np.memmap(rows_writer.data_path, dtype=DATA_DTYPE, mode='r') if raw_indptr[-1] else \
+        np.zeros(0, dtype=DATA_DTYPE)
+
+    indptr = np.zeros(len(row_lengths) + 1, dtype=np.int64)
+    indices = np.lib.format.open_memmap(f'{output_dir}/{DTM_NAME}_{INDICES_SUFFIX}.npy', mode='w+',
+                                        dtype=INDICES_DTYPE, shape=(nnz,))
+    data = np.lib.format.open_memmap(f'{output_dir}/{DTM_NAME}_{DATA_SUFFIX}.npy', mode='w+', dtype=DATA_DTYPE,
+                                     shape=(nnz,))
+    written = 0
+    for block_start in range(0, len(row_lengths), BLOCK_ROWS):
+        block_end = min(block_start + BLOCK_ROWS, len(row_lengths))
+        start, end = raw_indptr[block_start], raw_indptr[block_end]
+        block_ids = new_ids[raw_indices[start:end]]
+        mask = block_ids >= 0
+        block_rows = np.repeat(np.arange(block_end - block_start), row_lengths[block_start:block_end])
+        indptr[block_start + 1:block_end + 1] = np.bincount(block_rows[mask], minlength=block_end - block_start)
+        indices[written:written + mask.sum()] = block_ids[mask]
+        data[written:written + mask.sum()] = raw_data[start:end][mask]
+        written += int(mask.sum())
+    np.cumsum(indptr, out=indptr)
+    np.save(f'{output_dir}/{DTM_NAME}_{INDPTR_SUFFIX}.npy', indptr)
+    indices.flush()
+    data.flush()
+    del raw_indices, raw_data
+    os.remove(rows_writer.indices_path)
+    os.remove(rows_writer.data_path)
+
+
+def load_document_term_matrix(output_dir=DTM_DIR, mmap_mode='r'):
+    """Returns the CSR matrix (backed by the memory-mapped arrays), the vocabulary list and the path of the rows CSV"""
+    meta = load_meta(output_dir)
+    indptr, indices, data = load_rows(output_dir, DTM_NAME, mmap_mode)
+    matrix = sparse.csr_matrix((data, indices, indptr), shape=(meta['rows'], meta['columns']), copy=False)
+    return matrix, list(load_vocabulary(f'{output_dir}/{VOCABULARY_FILE}')), f'{output_dir}/{ROWS_FILE}'
+
+
+if __name__ == '__main__':
+    # Example:
+    export_document_term_matrix(text='lemmatized_text_reduced', provinces=['MADRID', 'BARCELONA'], min_df=5,
+                                max_df=0.5)
@@ -1,11 +1,16 @@
 """
 Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
 
-This script eliminates the duplicate news from the original corpus we get with Scrapy
+This script eliminates the duplicate news from the original corpus we get with Scrapy.
+
+Many duplicates are the very same body republished under several provinces, so before computing any MinHash the bodies
+are normalised (case and whitespace) and hashed: exact duplicates are removed right away and only the distinct bodies
+go through the MinHash/LSH stage.
 """
 import configparser
 import contextlib
 import datetime
+import hashlib
 import json
 import os
 import pathlib
@@ -13,12 +18,18 @@ from collections import namedtuple
 
 from datasketch import MinHash, MinHashLSH, LeanMinHash
 
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
 ADMITTED_CATEGORIES_TXT = 'admitted_categories.txt'
 CFG_FILE = 'config.cfg'
 DATES_CFG_GROUP = 'dates'
 DATES_CFG_FORMAT = '%d/%m/%Y'
 DUMP_DIR = f'{pathlib.Path.home()}/dump'
 THRESHOLD = 0.7
+NUM_PERM = 128
 REGULAR_INTERVAL_DAYS = 60
 EDGES_INTERVAL_DAYS = 3
 
@@ -34,11 +45,31 @@ def get_dates_between(start_date, end_date):
     return [start_date + datetime.timedelta(days=x) for x in range(0, (end_date - start_date).days + 1)]
 
 
+def get_body_digest(body):
+    """Hash of the body ignoring case and whitespace differences (xxHash if it is installed, BLAKE2 otherwise)"""
+    normalised = ' '.join(body.lower().split()).encode('utf8')
+    if xxhash is not None:
+        return xxhash.xxh3_128_digest(normalised)
+    return hashlib.blake2b(normalised, digest_size=16).digest()
+
+
+def get_minhash(body, num_perm=NUM_PERM):
+    minhash = MinHash(num_perm=num_perm)
+    for word in body.split(' '):
+        minhash.update(word.encode('utf8'))
+    return LeanMinHash(minhash)
+
+
 class DuplicateChecker:
 
-    def __init__(self):
+    def __init__(self, threshold=THRESHOLD, num_perm=NUM_PERM, params=None):
+        """`params` are the (bands, rows) of the LSH index, chosen by datasketch from the threshold if None"""
+        self.num_perm = num_perm
         self.minhashes = {}
-        self.lsh = MinHashLSH(threshold=THRESHOLD)
+        self.lsh = MinHashLSH(threshold=threshold, num_perm=num_perm, params=params)
+        self.body_digests = {}
+        self.exact_duplicates = []
+        self.articles = 0
 
     def create_minhashes_reading_articles(self, start_date, end_date):
         """Fills the minhashes dict with the files paths as the keys and the minhashes from the articles bodies as
@@ -60,24 +91,50 @@ class DuplicateChecker:
             if not article.body:
                 os.remove(file_path)
                 return
-
-            minhash = MinHash()
-            for word in article.body.split(' '):
-                minhash.update(word.encode('utf8'))
-            lean_minhash = LeanMinHash(minhash)
-            self.minhashes[file_path] = lean_minhash
-            self.lsh.insert(file_path, lean_minhash)
+            self.add_article(file_path, article.body)
+
+    def add_article(self, key, body):
+        """Adds the body of an article to the LSH index, unless it is an exact duplicate of one already added"""
+        self.articles += 1
+        digest = get_body_digest(body)
+        if digest in self.body_digests:
+            # Same body as an article already read, so there is no need to compute its MinHash
+            self.exact_duplicates.append(key)
+            return
+        self.body_digests[digest] = key
+
+        lean_minhash = get_minhash(body, self.num_perm)
+        self.minhashes[key] = lean_minhash
+        self.lsh.insert(key, lean_minhash)
+
+    def get_similar_articles(self):
+        """Yields every similar article found in the LSH index, removing it from the index itself"""
+        removed = set()
+        for key, minhash in self.minhashes.items():
+            # A removed article would find (and remove) the one it is similar to, leaving none of them
+            if key in removed:
+                continue
+            # The LSH will find at least the article itself, so we need to filter it
+            for similar_key in [x for x in self.lsh.query(minhash) if x != key]:
+                self.lsh.remove(similar_key)
+                removed.add(similar_key)
+                yield similar_key
 
     def find_similar_articles(self):
         """Finds every similar article from the LSH index, and removes it from the index itself as well as the file from
-        the disk"""
-        for path, minhash in self.minhashes.items():
-            # The LSH will find at least the path itself, so we need to filter it
-            for similar_article_path in [x for x in self.lsh.query(minhash) if x is not path]:
-                print(f'\tremoving similar article from {similar_article_path}')
-                self.lsh.remove(similar_article_path)
-                with contextlib.suppress(FileNotFoundError):
-                    os.remove(similar_article_path)
+        the disk. The exact duplicates found while reading are removed first"""
+        for exact_duplicate_path in self.exact_duplicates:
+            print(f'\tremoving exact duplicate article from {exact_duplicate_path}')
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(exact_duplicate_path)
+        for similar_article_path in self.get_similar_articles():
+            print(f'\tremoving similar article from {similar_article_path}')
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(similar_article_path)
+
+    def get_avoided_minhashes_ratio(self):
+        """Fraction of the articles read whose MinHash was skipped for being exact duplicates"""
+        return len(self.exact_duplicates) / self.articles if self.articles else 0.0
 
 
 if __name__ == '__main__':
@@ -88,6 +145,7 @@ if __name__ == '__main__':
 
     interval_step = datetime.timedelta(days=REGULAR_INTERVAL_DAYS)
     interval_edge_range = datetime.timedelta(days=EDGES_INTERVAL_DAYS)
+    [articles, exact_duplicates] = [0, 0]
 
     while start_cfg_date < end_cfg_date:
         next_interval = start_cfg_date + interval_step
@@ -96,11 +154,20 @@ if __name__ == '__main__':
         duplicate_checker = DuplicateChecker()
         duplicate_checker.create_minhashes_reading_articles(start_cfg_date, next_interval)
         duplicate_checker.find_similar_articles()
+        print(f'{len(duplicate_checker.exact_duplicates)} exact duplicates out of {duplicate_checker.articles} articles'
+              f' ({duplicate_checker.get_avoided_minhashes_ratio():.1%} of MinHashes avoided)')
+        articles += duplicate_checker.articles
+        exact_duplicates += len(duplicate_checker.exact_duplicates)
 
         print(f'Checking range articles from edges')
         duplicate_checker = DuplicateChecker()
         duplicate_checker.create_minhashes_reading_articles(next_interval - interval_edge_range,
                                                             next_interval + interval_edge_range)
         duplicate_checker.find_similar_articles()
+        articles += duplicate_checker.articles
+        exact_duplicates += len(duplicate_checker.exact_duplicates)
 
         start_cfg_date += interval_step
+
+    print(f'In total, {exact_duplicates / articles if articles else 0.0:.1%} of the MinHashes were avoided '
+          f'({exact_duplicates} exact duplicates out of {articles} articles read)')
@@ -0,0 +1,156 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Named entities index built in a single pass over the processed corpus. Unlike `get_necs_count_per_year` and
+`get_necs_count_per_category`, it keeps the class of every entity (persons, locations, organizations, others) and the
+day it appeared:
+
+* The daily counts of every entity per province, with the same layout as the trends cube, so entity trend lines are
+  queried like any term of `TrendsCube`.
+* A sparse entity-entity co-occurrence matrix per year (scipy.sparse CSR, memory-mapped when loaded), where two
+  entities co-occur if they appear in the same article.
+"""
+import itertools
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+from news_stats import ARTICLE_PARTS, get_dates_from_cfg, read_articles, read_categories_from_file
+from sparse_store import get_row, load_meta, load_rows, save_csr
+from trends_cube import CubeWriter, TrendsCube
+
+ENTITY_TYPES = ['persons', 'locations', 'organizations', 'others']
+ENTITY_INDEX_DIR = 'entity_index'
+COOCCURRENCES_NAME = 'cooccurrences_{year}'
+ENTITY_KEY_SEPARATOR = '\t'
+# Amount of pending co-occurrence pairs before adding them up into the sparse matrix of the year
+PAIRS_CHUNK_SIZE = 10_000_000
+
+
+def get_entity_key(entity_type, name):
+    return f'{entity_type}{ENTITY_KEY_SEPARATOR}{name}'
+
+
+def split_entity_key(key):
+    return tuple(key.split(ENTITY_KEY_SEPARATOR, 1))
+
+
+class _CooccurrencesAccumulator:
+    """Collects the co-occurring pairs of a year in chunks, adding them up into a CSR matrix when they grow too much"""
+
+    def __init__(self):
+        self.matrix = None
+        self.pending = 0
+        self._rows_chunks, self._columns_chunks = [], []
+
+    def add_article(self, entity_ids):
+        entity_ids = np.unique(entity_ids)
+        rows, columns = np.triu_indices(len(entity_ids), 1)
+        if len(rows):
+            self._rows_chunks.append(entity_ids[rows])
+            self._columns_chunks.append(entity_ids[columns])
+            self.pending += len(rows)
+        if self.pending >= PAIRS_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self, size=0):
+        """Adds up the pending pairs into the matrix, growing it to at least size x size, and returns it"""
+        rows = np.concatenate(self._rows_chunks) if self._rows_chunks else np.zeros(0, dtype=np.int64)
+        columns = np.concatenate(self._columns_chunks) if self._columns_chunks else np.zeros(0, dtype=np.int64)
+        size = max(size, int(columns.max(initial=-1)) + 1, 0 if self.matrix is None else self.matrix.shape[0])
+        # Symmetric, so all the co-occurrences of an entity are in its row
+        chunk = sparse.coo_matrix((np.ones(2 * len(rows), dtype=np.int32),
+                                   (np.concatenate([rows, columns]), np.concatenate([columns, rows]))),
+                                  shape=(size, size)).tocsr()
+        if self.matrix is not None:
+            self.matrix.resize((size, size))
+            chunk = chunk + self.matrix
+        self.matrix = chunk
+        self._rows_chunks, self._columns_chunks, self.pending = [], [], 0
+        return self.matrix
+
+
+def build_entity_index(index_dir=ENTITY_INDEX_DIR):
+    """Reads the corpus once and saves the daily counts per province and the yearly co-occurrences of the entities"""
+    start_cfg_date, end_cfg_date = get_dates_from_cfg()
+    provinces = read_categories_from_file()
+    cube_writer = CubeWriter(start_cfg_date, (end_cfg_date - start_cfg_date).days + 1, provinces)
+
+    entities = {}
+    cooccurrences = {}
+    articles = read_articles(start_cfg_date, end_cfg_date, provinces)
+    for (category, date), day_articles in itertools.groupby(articles, key=lambda x: (x[0], x[1])):
+        print(f'\tExtracting {category} {date}\'s entities...', end='\r')
+        counts = Counter()
+        for _, _, article in day_articles:
+            article_entities = [entities.setdefault(get_entity_key(entity_type, name), len(entities))
+                                for part in ARTICLE_PARTS
+                                for entity_type in ENTITY_TYPES
+                                for name in article[part][entity_type]]
+            counts.update(article_entities)
+            cooccurrences.setdefault(date.year, _CooccurrencesAccumulator()).add_article(
+                np.array(article_entities, dtype=np.int64))
+        cube_writer.add_counts(category, date, counts)
+    print()
+
+    years = sorted(cooccurrences)
+    for year in years:
+        save_csr(index_dir, COOCCURRENCES_NAME.format(year=year),
+                 cooccurrences[year].flush(len(entities)))
+    cube_writer.save(index_dir, entities, years=years)
+
+
+class EntityIndex(TrendsCube):
+    """Query API over an index built with `build_entity_index`. The entities are the terms of the underlying cube, so
+    the trend methods of `TrendsCube` accept entity keys (see `get_entity_key`)"""
+
+    def __init__(self, index_dir=ENTITY_INDEX_DIR):
+        super().__init__(index_dir)
+        self.years = load_meta(index_dir)['years']
+        self.cooccurrences = {year: load_rows(index_dir, COOCCURRENCES_NAME.format(year=year)) for year in self.years}
+        self.keys = list(self.vocabulary)
+        self.entity_types = np.array([ENTITY_TYPES.index(split_entity_key(key)[0]) for key in self.keys],
+                                     dtype=np.int8)
+
+    def get_entity_keys(self, name, entity_type=None):
+        """Returns the keys of the entities with that name (of the given class, or of any class)"""
+        entity_types = ENTITY_TYPES if entity_type is None else [entity_type]
+        return [key for key in (get_entity_key(t, name) for t in entity_types) if key in self.vocabulary]
+
+    def get_trend(self, name, entity_type=None, bucket='month', provinces=None, normalize=False):
+        """Returns the labels of the buckets and the occurrences of the entity in each one of them (adding up every
+        class if `entity_type` is not given)"""
+        _, labels = self.get_buckets(bucket)
+        trend = np.zeros(len(labels))
+        for key in self.get_entity_keys(name, entity_type):
+            trend = trend + self.get_series(key, bucket, provinces, normalize)[1]
+        return labels, trend
+
+    def get_cooccurrence_counts(self, name, entity_type=None, years=None):
+        """Returns a dense array with the amount of articles where every entity co-occurs with the given one"""
+        counts = np.zeros(len(self.vocabulary), dtype=np.int64)
+        for key in self.get_entity_keys(name, entity_type):
+            for year in self.years if years is None else years:
+                if year in self.cooccurrences:
+                    columns, values = get_row(self.cooccurrences[year], self.vocabulary[key])
+                    np.add.at(counts, columns, values)
+        return counts
+
+    def get_top_cooccurring(self, name, entity_type=None, years=None, top=10, cooccurring_type=None):
+        """Returns a list of (class, name, articles) tuples with the entities that co-occur the most with the given one,
+        optionally restricted to some years and to a class of co-occurring entities"""
+        counts = self.get_cooccurrence_counts(name, entity_type, years)
+        if cooccurring_type is not None:
+            counts[self.entity_types != ENTITY_TYPES.index(cooccurring_type)] = 0
+        candidates = np.nonzero(counts)[0]
+        best = candidates[np.argsort(-counts[candidates], kind='stable')[:top]]
+        return [(*split_entity_key(self.keys[index]), int(counts[index])) for index in best]
+
+
+if __name__ == '__main__':
+    # Example:
+    build_entity_index()
+    entity_index = EntityIndex()
+    for entity_type, entity, articles in entity_index.get_top_cooccurring('Mariano_Rajoy', 'persons', years=[2016]):
+        print(f'{entity_type};{entity};{articles}')
@@ -7,6 +7,7 @@
 #include <fstream>
 #include <iostream>
 #include <string>
+#include <vector>
 
 #include "rapidjson/document.h"
 #include "rapidjson/prettywriter.h"
@@ -236,6 +237,64 @@ Value analyze_json_value(const document& doc, const wstring& raw_text, MemoryPoo
     return analyzed;
 }
 
+/// Analyzes the JSON of the path and overwrites it with the results. Returns false if it couldn't be read or parsed
+bool analyze_json_file(const analyzer& analyzer, const string& file_path) {
+    ifstream json_file(file_path);
+    if (!json_file) {
+        return false;
+    }
+    const string json_str((istreambuf_iterator<char>(json_file)),
+                          (istreambuf_iterator<char>()));
+    json_file.close();
+    Document json_doc,
+        analyzed_json_doc(kObjectType);
+    json_doc.Parse(json_str.c_str());
+    if (json_doc.HasParseError() || !json_doc.IsObject()) {
+        return false;
+    }
+    auto& alloc = json_doc.GetAllocator();
+
+    /// Copy non-analyzed members
+    assert(json_doc.HasMember("date"));
+    assert(json_doc.HasMember("province"));
+    assert(json_doc.HasMember("url"));
+    analyzed_json_doc.AddMember("province", json_doc["province"], alloc);
+    analyzed_json_doc.AddMember("date", json_doc["date"], alloc);
+    analyzed_json_doc.AddMember("url", json_doc["url"], alloc);
+
+    /// Analyze and copy results
+    const char* original_json_members[] = {"title", "lead", "body"};
+    for (auto&& member : original_json_members) {
+        assert(json_doc.HasMember(member));
+        const wstring raw_text = utf8_to_wstring(json_doc[member].GetString());
+        /// analyze text, leave result in doc
+        document doc;
+        analyzer.analyze(raw_text, doc);
+        Value analyzed = analyze_json_value(doc, raw_text, alloc);
+        analyzed_json_doc.AddMember(StringRef(member), analyzed, alloc);
+    }
+
+    /// Write JSON to its origin file
+    StringBuffer buffer;
+    PrettyWriter<StringBuffer> writer(buffer);
+    analyzed_json_doc.Accept(writer);
+    const char* output = buffer.GetString();
+    ofstream output_json_file(file_path);
+    output_json_file << output << endl;
+    output_json_file.close();
+    return true;
+}
+
+/// Analyzes a file and prints a "DONE|FAILED <tab> path <tab> milliseconds" line, read by freeling_orchestrator.py
+void analyze_and_report(const analyzer& analyzer, const string& file_path) {
+    const auto start = chrono::steady_clock::now();
+    const bool done = analyze_json_file(analyzer, file_path);
+    const auto diff = chrono::steady_clock::now() - start;
+#pragma omp critical
+    cout << (done ? "DONE" : "FAILED") << "\t" << file_path << "\t"
+         << chrono::duration<double, milli>(diff).count() << endl;
+}
+
 void analyze_all_jsons(const analyzer& analyzer) {
     set<string> processed_files;
     fstream processed_files_txt("processed_files.txt", ios_base::in | ios_base::out | ios_base::app);
@@ -260,43 +319,7 @@ void analyze_all_jsons(const analyzer& analyzer) {
 #pragma omp critical
         cout << "Analyzing " << file_path << endl;
 
-        ifstream json_file(file_path);
-        const string json_str((istreambuf_iterator<char>(json_file)),
-                              (istreambuf_iterator<char>()));
-        json_file.close();
-        Document json_doc,
-            analyzed_json_doc(kObjectType);
-        json_doc.Parse(json_str.c_str());
-        auto& alloc = json_doc.GetAllocator();
-
-        /// Copy non-analyzed members
-        assert(json_doc.HasMember("date"));
-        assert(json_doc.HasMember("province"));
-        assert(json_doc.HasMember("url"));
-        analyzed_json_doc.AddMember("province", json_doc["province"], alloc);
-        analyzed_json_doc.AddMember("date", json_doc["date"], alloc);
-        analyzed_json_doc.AddMember("url", json_doc["url"], alloc);
-
-        /// Analyze and copy results
-        const char* original_json_members[] = {"title", "lead", "body"};
-        for (auto&& member : original_json_members) {
-            assert(json_doc.HasMember(member));
-            const wstring raw_text = utf8_to_wstring(json_doc[member].GetString());
-            /// analyze text, leave result in doc
-            document doc;
-            analyzer.analyze(raw_text, doc);
-            Value analyzed = analyze_json_value(doc, raw_text, alloc);
-            analyzed_json_doc.AddMember(StringRef(member), analyzed, alloc);
-        }
-
-        /// Write JSON to its origin file
-        StringBuffer buffer;
-        PrettyWriter<StringBuffer> writer(buffer);
-        analyzed_json_doc.Accept(writer);
-        const char* output = buffer.GetString();
-        ofstream output_json_file(file_path);
-        output_json_file << output << endl;
-        output_json_file.close();
+        analyze_json_file(analyzer, file_path);
 
         /// Write to processed files
 #pragma omp critical
@@ -304,6 +327,30 @@ void analyze_all_jsons(const analyzer& analyzer) {
     }
 }
 
+/// Analyzes the paths listed (one per line) in a file, in parallel
+void analyze_list_file(const analyzer& analyzer, const string& list_path) {
+    ifstream list_file(list_path);
+    vector<string> file_paths;
+    for (string line; getline(list_file, line);) {
+        if (!trim(line).empty()) {
+            file_paths.push_back(line);
+        }
+    }
+#pragma omp parallel for
+    for (auto iter = file_paths.begin(); iter < file_paths.end(); ++iter) {
+        analyze_and_report(analyzer, *iter);
+    }
+}
+
+/// Analyzes the paths read from stdin as they arrive, so the orchestrator can keep the process fed with batches
+void analyze_stdin(const analyzer& analyzer) {
+    for (string line; getline(cin, line);) {
+        if (!trim(line).empty()) {
+            analyze_and_report(analyzer, line);
+        }
+    }
+}
+
 int main(int argc, char** argv) {
     /// set locale to an UTF8 compatible locale
     util::init_locale(L"default");
@@ -319,7 +366,14 @@ int main(int argc, char** argv) {
 
     /// perform the analysis and measure execution time
     const auto start = chrono::steady_clock::now();
-    analyze_all_jsons(analyzer);
+    if (argc < 2) {
+        /// Whole ~/dump, skipping the files of processed_files.txt
+        analyze_all_jsons(analyzer);
+    } else if (string(argv[1]) == "-") {
+        analyze_stdin(analyzer);
+    } else {
+        analyze_list_file(analyzer, argv[1]);
+    }
     const auto end = chrono::steady_clock::now();
     const auto diff = end - start;
     wcout << L"Time: " << chrono::duration<double, milli>(diff).count() << " ms" << endl;
@@ -0,0 +1,282 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Driver for the FreeLing analysis stage. Instead of letting `freeling_analyzer` walk the whole `~/dump` and load
+`processed_files.txt` on every start, the state of every file (pending, done or failed, with its analysis time) is kept
+in a SQLite checkpoint database, so restarts only query the pending files and any province/date subset can be targeted.
+
+The pending files are fed in batches through stdin to several analyzer processes in parallel (`freeling_analyzer -`),
+which answer a "DONE|FAILED <tab> path <tab> milliseconds" line per file. The per-file latency and the throughput are
+reported at the end. Any other command speaking the same protocol can be used as analyzer, e.g. the stand-in of this
+same script (`--stand-in`), which doesn't touch the files, to try the pipeline without FreeLing:
+
+    python freeling_orchestrator.py -c MADRID,BARCELONA -s 01/01/2016 -e 31/12/2016 -p 4
+    python freeling_orchestrator.py -a "python freeling_orchestrator.py --stand-in" -p 2
+    python freeling_orchestrator.py -i freeling_analyzer/processed_files.txt  # Imports the old progress file
+"""
+import datetime
+import getopt
+import os
+import queue
+import shlex
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from accumulators import StatsAccumulator
+from news_stats import (DATES_CFG_FORMAT, DATES_FILE_FORMAT, DATES_SQL_FORMAT, get_day_dirs, get_dates_from_cfg,
+                        read_categories_from_file)
+
+RAW_DUMP_DIR = f'{str(Path.home())}/dump'
+CHECKPOINT_DB = 'freeling_checkpoint.db'
+ANALYZER = ['freeling_analyzer/freeling_analyzer']
+PROCESSES = 4
+BATCH_SIZE = 50
+DONE, FAILED, PENDING = 'done', 'failed', 'pending'
+STAND_IN_LATENCY = 0.01
+# Seconds without results before checking that the analyzers are still alive
+RESULTS_TIMEOUT = 30
+
+
+def open_checkpoint_db(db_path=CHECKPOINT_DB):
+    db = sqlite3.connect(db_path)
+    db.execute('CREATE TABLE IF NOT EXISTS files ('
+               'path TEXT PRIMARY KEY, province TEXT, date TEXT, status TEXT, attempts INTEGER DEFAULT 0, '
+               'latency_ms REAL, updated_at REAL)')
+    db.execute('CREATE INDEX IF NOT EXISTS files_status ON files (status, province, date)')
+    db.execute('CREATE TABLE IF NOT EXISTS listed_days (province TEXT, date TEXT, PRIMARY KEY (province, date))')
+    return db
+
+
+def add_files(db, start_date, end_date, categories=None, dump_dir=RAW_DUMP_DIR, rescan=False):
+    """Adds the files of the day directories between both dates as pending (keeping the state of the known ones).
+    Unless `rescan` is set, the directories listed by a previous run are skipped, except the ones from the last listed
+    day of every province onwards, which the spider may still be writing"""
+    listed_days = set() if rescan else set(db.execute(
+        'SELECT province, date FROM listed_days AS listed '
+        'WHERE date < (SELECT MAX(date) FROM listed_days WHERE province = listed.province)'))
+    added = 0
+    for category, date, path in get_day_dirs(start_date, end_date, categories, dump_dir):
+        day = (category, date.strftime(DATES_SQL_FORMAT))
+        if day in listed_days:
+            continue
+        try:
+            filenames = os.listdir(path)
+        except FileNotFoundError:
+            continue
+        added += db.executemany('INSERT OR IGNORE INTO files (path, province, date, status) VALUES (?, ?, ?, ?)',
+                                [(f'{path}/{filename}', *day, PENDING) for filename in filenames]).rowcount
+        db.execute('INSERT OR IGNORE INTO listed_days (province, date) VALUES (?, ?)', day)
+    db.commit()
+    return added
+
+
+def import_processed_files(db, processed_files_txt):
+    """Marks as done the files of the progress file written by `freeling_analyzer` when run without arguments"""
+    with open(processed_files_txt) as f:
+        paths = [line.strip() for line in f if line.strip()]
+    db.executemany('INSERT INTO files (path, province, date, status, updated_at) VALUES (?, ?, ?, ?, ?) '
+                   'ON CONFLICT (path) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at',
+                   [(path, *_get_province_and_date(path), DONE, time.time()) for path in paths])
+    db.commit()
+    return len(paths)
+
+
+def _get_province_and_date(path):
+    """Province and date of a `dump/province/yyyy/mm/dd/file` path, or Nones if it doesn't follow that layout"""
+    parts = path.split('/')
+    try:
+        date = datetime.datetime.strptime('/'.join(parts[-4:-1]), DATES_FILE_FORMAT)
+    except ValueError:
+        return None, None
+    return parts[-5], date.strftime(DATES_SQL_FORMAT)
+
+
+def get_pending_files(db, start_date, end_date, categories=None, retry_failed=False):
+    statuses = (PENDING, FAILED) if retry_failed else (PENDING,)
+    query = f'SELECT path FROM files WHERE status IN ({",".join("?" * len(statuses))}) AND date BETWEEN ? AND ?'
+    params = [*statuses, start_date.strftime(DATES_SQL_FORMAT), end_date.strftime(DATES_SQL_FORMAT)]
+    if categories:
+        query += f' AND province IN ({",".join("?" * len(categories))})'
+        params += categories
+    return [path for path, in db.execute(query + ' ORDER BY province, date, path', params)]
+
+
+def _run_analyzer(analyzer, batches, results):
+    """Feeds batches to an analyzer process through its stdin, putting a (path, status, latency_ms) tuple in `results`
+    for every file and None when there are no batches left. If the process dies or answers something unexpected, the
+    rest of its batch fails and a new process is started"""
+    env = dict(os.environ, OMP_NUM_THREADS=os.environ.get('OMP_NUM_THREADS', '1'))
+    process = None
+    pending = set()
+    try:
+        while True:
+            try:
+                batch = batches.get_nowait()
+            except queue.Empty:
+                break
+            if process is None or process.poll() is not None:
+                try:
+                    process = subprocess.Popen(analyzer + ['-'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                               text=True, bufsize=1, env=env)
+                except OSError as e:
+                    print(f'Cannot run the analyzer: {e}')
+                    process = None
+                    for path in batch:
+                        results.put((path, FAILED, None))
+                    continue
+            pending = set(batch)
+            try:
+                process.stdin.write(''.join(f'{path}\n' for path in batch))
+                process.stdin.flush()
+                while pending:
+                    line = process.stdout.readline()
+                    if not line:
+                        break
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) == 3 and fields[0] in ('DONE', 'FAILED') and fields[1] in pending:
+                        latency_ms = float(fields[2])
+                        pending.discard(fields[1])
+                        results.put((fields[1], fields[0].lower(), latency_ms))
+            except BrokenPipeError:
+                pass
+            except (OSError, ValueError) as e:
+                print(f'Unexpected answer from the analyzer, restarting it: {e}')
+                process.kill()
+                process.wait()
+            for path in pending:
+                results.put((path, FAILED, None))
+            pending = set()
+    except Exception as e:
+        print(f'Analyzer worker stopped: {e}')
+        for path in pending:
+            results.put((path, FAILED, None))
+        if process is not None:
+            process.kill()
+    finally:
+        if process is not None and process.poll() is None:
+            process.stdin.close()
+            process.wait()
+        results.put(None)
+
+
+def run_analysis(db, analyzer=ANALYZER, processes=PROCESSES, batch_size=BATCH_SIZE, start_date=None, end_date=None,
+                 categories=None, retry_failed=False, dump_dir=RAW_DUMP_DIR, rescan=False):
+    """Analyzes the pending files of the provinces and dates in `processes` parallel analyzers, checkpointing the
+    result of every file. Returns the latency accumulator of the analyzed files"""
+    start_cfg_date, end_cfg_date = get_dates_from_cfg()
+    start_date, end_date = start_date or start_cfg_date, end_date or end_cfg_date
+    categories = categories or read_categories_from_file()
+    print(f'{add_files(db, start_date, end_date, categories, dump_dir, rescan)} new files found')
+    paths = get_pending_files(db, start_date, end_date, categories, retry_failed)
+    print(f'{len(paths)} files to analyze')
+
+    batches = queue.Queue()
+    for i in range(0, len(paths), batch_size):
+        batches.put(paths[i:i + batch_size])
+    results = queue.Queue()
+    workers = [threading.Thread(target=_run_analyzer, args=(analyzer, batches, results), daemon=True)
+               for _ in range(min(processes, batches.qsize()))]
+    for worker in workers:
+        worker.start()
+
+    latencies = StatsAccumulator()
+    statuses = {DONE: 0, FAILED: 0}
+    start = time.perf_counter()
+    analyzed, finished_workers = 0, 0
+    # Every worker puts None when it stops, after the results of all its files
+    while analyzed < len(paths) and finished_workers < len(workers):
+        try:
+            result = results.get(timeout=RESULTS_TIMEOUT)
+        except queue.Empty:
+            if not any(worker.is_alive() for worker in workers):
+                break
+            continue
+        if result is None:
+            finished_workers += 1
+            continue
+        path, status, latency_ms = result
+        analyzed += 1
+        db.execute('UPDATE files SET status = ?, latency_ms = ?, attempts = attempts + 1, updated_at = ? '
+                   'WHERE path = ?', (status, latency_ms, time.time(), path))
+        statuses[status] += 1
+        if latency_ms is not None:
+            latencies.update(latency_ms)
+        if analyzed % batch_size == 0 or analyzed == len(paths):
+            db.commit()
+            elapsed = time.perf_counter() - start
+            print(f'\t{analyzed}/{len(paths)} files ({statuses[FAILED]} failed), '
+                  f'{analyzed / elapsed:.1f} files/s', end='\r')
+    db.commit()
+    for worker in workers:
+        worker.join()
+    print()
+    if analyzed < len(paths):
+        print(f'The analyzers stopped before answering {len(paths) - analyzed} files, which are still pending')
+    if latencies.count:
+        summary = latencies.summary()
+        print(f'Latency per file: mean {summary.mean:.1f} ms, median {summary.median:.1f} ms, '
+              f'p95 {summary.p95:.1f} ms, max {summary.maximum:.1f} ms')
+    return latencies
+
+
+def stand_in_analyzer(latency=STAND_IN_LATENCY):
+    """Speaks the protocol of `freeling_analyzer -` without analyzing anything: the files that exist are DONE"""
+    for line in sys.stdin:
+        path = line.strip()
+        if path:
+            start = time.perf_counter()
+            time.sleep(latency)
+            status = 'DONE' if os.path.isfile(path) else 'FAILED'
+            print(f'{status}\t{path}\t{(time.perf_counter() - start) * 1000}', flush=True)
+
+
+if __name__ == '__main__':
+    usage = f'usage: {sys.argv[0]} [-a <analyzer_command> -p <processes> -b <batch_size> -d <db> ' \
+            f'-c <categories> -s <start_date> -e <end_date> -r -R -i <processed_files_txt> --stand-in]'
+    [analyzer, processes, batch_size, db_path, categories, start_date, end_date, retry_failed, rescan,
+     processed_files_txt] = [ANALYZER, PROCESSES, BATCH_SIZE, CHECKPOINT_DB, None, None, None, False, False, None]
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], 'ha:p:b:d:c:s:e:rRi:',
+                                ['help', 'analyzer=', 'processes=', 'batch-size=', 'db=', 'categories=',
+                                 'start-date=', 'end-date=', 'retry-failed', 'rescan', 'import=', 'stand-in'])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(usage)
+            sys.exit()
+        elif opt == '--stand-in':
+            stand_in_analyzer()
+            sys.exit()
+        elif opt in ('-a', '--analyzer'):
+            analyzer = shlex.split(arg)
+        elif opt in ('-p', '--processes'):
+            processes = int(arg)
+        elif opt in ('-b', '--batch-size'):
+            batch_size = int(arg)
+        elif opt in ('-d', '--db'):
+            db_path = arg
+        elif opt in ('-c', '--categories'):
+            categories = arg.split(',')
+        elif opt in ('-s', '--start-date'):
+            start_date = datetime.datetime.strptime(arg, DATES_CFG_FORMAT)
+        elif opt in ('-e', '--end-date'):
+            end_date = datetime.datetime.strptime(arg, DATES_CFG_FORMAT)
+        elif opt in ('-r', '--retry-failed'):
+            retry_failed = True
+        elif opt in ('-R', '--rescan'):
+            rescan = True
+        elif opt in ('-i', '--import'):
+            processed_files_txt = arg
+    checkpoint_db = open_checkpoint_db(db_path)
+    if processed_files_txt:
+        print(f'{import_processed_files(checkpoint_db, processed_files_txt)} files marked as done')
+    else:
+        run_analysis(checkpoint_db, analyzer, processes, batch_size, start_date, end_date, categories, retry_failed,
+                     rescan=rescan)
+    checkpoint_db.close()
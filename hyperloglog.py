@@ -0,0 +1,143 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+HyperLogLog sketches to estimate the amount of distinct words (vocabulary size) of the corpus slices without keeping
+every distinct word in memory. One sketch (a few KB) is built per (year, province, season) slice in a single pass, and
+any grouping of slices is estimated by the union (register-wise maximum) of their sketches.
+"""
+import hashlib
+import os
+
+import numpy as np
+
+from calendar_table import SEASONS, CalendarTable
+from news_stats import ARTICLE_PARTS, get_dates_from_cfg, read_articles
+from sparse_store import load_meta, save_meta
+
+PRECISION = 14
+HASH_BITS = 64
+SKETCHES_DIR = 'vocabulary_sketches'
+REGISTERS_FILE = 'registers.npy'
+
+
+def hash_words(words):
+    """Stable 64 bits hashes of the words (Python's `hash` changes between processes, so it can't be persisted)"""
+    return np.fromiter((int.from_bytes(hashlib.blake2b(word.encode('utf8'), digest_size=8).digest(), 'little')
+                        for word in words), dtype=np.uint64)
+
+
+class HyperLogLog:
+    """HyperLogLog cardinality estimator (Flajolet et al., 2007) with 2^precision registers, whose relative standard
+    error is about 1.04 / sqrt(2^precision) (0.8% with the default precision)"""
+
+    def __init__(self, precision=PRECISION, registers=None):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    def update(self, words):
+        self.update_hashes(hash_words(words))
+
+    def update_hashes(self, hashes):
+        remaining_bits = HASH_BITS - self.precision
+        indexes = (hashes >> np.uint64(remaining_bits)).astype(np.int64)
+        remaining = hashes & np.uint64((1 << remaining_bits) - 1)
+        # Position of the leftmost 1 bit in the remaining bits (frexp is exact, unlike log2, as they fit in 53 bits)
+        _, exponents = np.frexp(remaining.astype(np.float64))
+        ranks = np.where(remaining > 0, remaining_bits - exponents + 1, remaining_bits + 1).astype(np.uint8)
+        np.maximum.at(self.registers, indexes, ranks)
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError('only sketches with the same precision can be merged')
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        return estimate_registers(self.registers)
+
+
+def estimate_registers(registers):
+    """Cardinality estimate of a registers array, with the small range (linear counting) correction"""
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw_estimate = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = np.count_nonzero(registers == 0)
+    if raw_estimate <= 2.5 * m and zeros:
+        return float(m * np.log(m / zeros))
+    return float(raw_estimate)
+
+
+def build_vocabulary_sketches(sketches_dir=SKETCHES_DIR, text='lemmatized_text', precision=PRECISION):
+    """Reads the corpus once and saves a sketch, and the amount of words, of every (year, province, season) slice"""
+    start_cfg_date, end_cfg_date = get_dates_from_cfg()
+    calendar = CalendarTable(start_cfg_date, end_cfg_date)
+    years, seasons = calendar.get_column('year'), calendar.get_column('season')
+
+    sketches, tokens = {}, {}
+    for category, date, article in read_articles(start_cfg_date, end_cfg_date):
+        print(f'\tExtracting {category} {date}\'s words...', end='\r')
+        offset = calendar.get_offset(date)
+        key = (int(years[offset]), category, SEASONS[seasons[offset]].name)
+        words = [word for part in ARTICLE_PARTS for word in article[part][text].split(' ')]
+        sketches.setdefault(key, HyperLogLog(precision)).update(words)
+        tokens[key] = tokens.get(key, 0) + len(words)
+    print()
+    save_vocabulary_sketches(sketches_dir, sketches, tokens, text)
+
+
+def save_vocabulary_sketches(sketches_dir, sketches, tokens, text):
+    os.makedirs(sketches_dir, exist_ok=True)
+    keys = list(sketches)
+    precision = sketches[keys[0]].precision if keys else PRECISION
+    registers = np.zeros((len(keys), 1 << precision), dtype=np.uint8)
+    for row, key in enumerate(keys):
+        registers[row] = sketches[key].registers
+    np.save(f'{sketches_dir}/{REGISTERS_FILE}', registers)
+    save_meta(sketches_dir, text=text, precision=precision, slices=[list(key) for key in keys],
+              tokens=[tokens[key] for key in keys])
+
+
+class VocabularySketches:
+    """Estimates the vocabulary size and TTR of any grouping of the slices saved by `build_vocabulary_sketches`"""
+
+    def __init__(self, sketches_dir=SKETCHES_DIR):
+        meta = load_meta(sketches_dir)
+        self.text = meta['text']
+        self.precision = meta['precision']
+        self.slices = [tuple(key) for key in meta['slices']]
+        self.tokens = np.array(meta['tokens'], dtype=np.int64)
+        self.registers = np.load(f'{sketches_dir}/{REGISTERS_FILE}', mmap_mode='r')
+
+    def _select(self, years=None, provinces=None, seasons=None):
+        return np.array([(years is None or year in years) and (provinces is None or province in provinces) and
+                         (seasons is None or season in seasons) for year, province, season in self.slices],
+                        dtype=bool)
+
+    def get_sketch(self, years=None, provinces=None, seasons=None):
+        """Union of the sketches of the slices matching the filters (None means any)"""
+        selected = self._select(years, provinces, seasons)
+        registers = np.zeros(1 << self.precision, dtype=np.uint8)
+        if selected.any():
+            registers = np.max(self.registers[selected], axis=0)
+        return HyperLogLog(self.precision, registers)
+
+    def estimate(self, years=None, provinces=None, seasons=None):
+        """Returns the estimated vocabulary size, the amount of words and the estimated TTR of the matching slices"""
+        distinct = self.get_sketch(years, provinces, seasons).estimate()
+        tokens = int(self.tokens[self._select(years, provinces, seasons)].sum())
+        return distinct, tokens, distinct / tokens if tokens else float('nan')
+
+    def get_estimates_per(self, dimension):
+        """Returns a {value: (vocabulary, tokens, ttr)} dict for every year, province or season"""
+        position = ['year', 'province', 'season'].index(dimension)
+        values = sorted({key[position] for key in self.slices}, key=str)
+        return {value: self.estimate(**{f'{dimension}s': {value}}) for value in values}
+
+
+if __name__ == '__main__':
+    # Example:
+    build_vocabulary_sketches()
+    vocabulary_sketches = VocabularySketches()
+    with open('vocabulary_per_year.csv', 'w') as csv_out:
+        for year, (vocabulary, words, ttr) in vocabulary_sketches.get_estimates_per('year').items():
+            print(f'{year};{round(vocabulary)};{words};{ttr}', file=csv_out)
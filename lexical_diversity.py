@@ -0,0 +1,183 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Lexical diversity metrics (TTR, MATTR, MTLD and Yule's K) computed with NumPy over batches of articles. A batch is a
+single array with the token ids of all its articles one after the other, plus an array with the offset where every
+article starts (and a last one with the total length), so no per-article Python dict is built.
+
+Raw TTR depends heavily on the length of the article, so for diachronic or diatopic comparisons MATTR, MTLD or Yule's K
+should be preferred.
+"""
+import itertools
+
+import numpy as np
+
+from accumulators import StatsAccumulator, format_summary
+from news_stats import get_article_words, get_dates_from_cfg, read_articles
+
+METRICS = ['ttr', 'mattr', 'mtld', 'yules_k']
+GROUP_BY = ['year', 'province', 'total']
+MATTR_WINDOW = 50
+MTLD_THRESHOLD = 0.72
+BATCH_SIZE = 1000
+
+
+def encode_batch(texts, vocabulary):
+    """Converts a list of texts (lists of words) into a (tokens, offsets) batch, adding the unseen words to the
+    vocabulary dict"""
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum([len(words) for words in texts], out=offsets[1:])
+    tokens = np.fromiter((vocabulary.setdefault(word, len(vocabulary)) for words in texts for word in words),
+                         dtype=np.int64, count=offsets[-1])
+    return tokens, offsets
+
+
+def _get_documents(offsets):
+    lengths = np.diff(offsets)
+    return lengths, np.repeat(np.arange(len(lengths)), lengths)
+
+
+def _get_frequencies(tokens, offsets):
+    """Returns the document and the frequency of every (document, type) pair of the batch"""
+    _, documents = _get_documents(offsets)
+    types = int(tokens.max(initial=0)) + 1
+    unique_pairs, frequencies = np.unique(documents * types + tokens, return_counts=True)
+    return unique_pairs // types, frequencies
+
+
+def _get_previous_and_next(tokens, offsets):
+    """Returns, for every position, the position of the previous and the next occurrence of the same token in the same
+    document (-1 and len(tokens) if there is not any)"""
+    _, documents = _get_documents(offsets)
+    positions = np.arange(len(tokens))
+    order = np.lexsort((positions, tokens, documents))
+    same = (tokens[order][1:] == tokens[order][:-1]) & (documents[order][1:] == documents[order][:-1])
+    previous = np.full(len(tokens), -1, dtype=np.int64)
+    following = np.full(len(tokens), len(tokens), dtype=np.int64)
+    previous[order[1:][same]] = order[:-1][same]
+    following[order[:-1][same]] = order[1:][same]
+    return previous, following
+
+
+def get_ttrs(tokens, offsets):
+    """Type-Token Ratio of every article of the batch"""
+    lengths, _ = _get_documents(offsets)
+    documents, _ = _get_frequencies(tokens, offsets)
+    types = np.bincount(documents, minlength=len(lengths))
+    return np.divide(types, lengths, out=np.full(len(lengths), np.nan), where=lengths > 0)
+
+
+def get_mattrs(tokens, offsets, window=MATTR_WINDOW):
+    """Moving-Average TTR of every article of the batch: the mean of the TTRs of all the windows of `window` tokens.
+    Articles shorter than the window get their plain TTR.
+
+    The amount of types of the window starting at s is kept updated while sliding: it loses the token at s, and gains
+    the next occurrence of that token if it is still inside the window plus the new token if it was not seen since s.
+    """
+    lengths, documents = _get_documents(offsets)
+    previous, following = _get_previous_and_next(tokens, offsets)
+    positions = np.arange(len(tokens))
+    relative_positions = positions - offsets[:-1][documents]
+
+    first_window = (previous < 0) & (relative_positions < window)
+    initial_types = np.bincount(documents[first_window], minlength=len(lengths))
+    windows = np.maximum(lengths - window + 1, 0)
+
+    steps = positions[relative_positions < lengths[documents] - window]
+    deltas = (-1 + (following[steps] <= steps + window - 1) + (previous[steps + window] <= steps)).astype(np.float64)
+    # The delta of the j-th step is added to the (windows - 1 - j) windows after it
+    step_weights = windows[documents[steps]] - 1 - relative_positions[steps]
+    types_sum = windows * initial_types + np.bincount(documents[steps], weights=deltas * step_weights,
+                                                      minlength=len(lengths))
+    mattrs = np.divide(types_sum, windows * window, out=np.zeros(len(lengths)), where=windows > 0)
+    return np.where(windows > 0, mattrs, get_ttrs(tokens, offsets))
+
+
+def _get_mtld_factors(tokens, offsets, threshold):
+    """Counts the MTLD factors of every article, advancing all of them one token at a time"""
+    lengths, _ = _get_documents(offsets)
+    previous, _ = _get_previous_and_next(tokens, offsets)
+    segment_starts = offsets[:-1].copy()
+    types = np.zeros(len(lengths), dtype=np.int64)
+    segment_tokens = np.zeros(len(lengths), dtype=np.int64)
+    factors = np.zeros(len(lengths))
+    for step in range(int(lengths.max(initial=0))):
+        active = np.nonzero(lengths > step)[0]
+        positions = offsets[active] + step
+        types[active] += previous[positions] < segment_starts[active]
+        segment_tokens[active] += 1
+        finished = active[types[active] / segment_tokens[active] < threshold]
+        factors[finished] += 1
+        segment_starts[finished] = offsets[finished] + step + 1
+        types[finished] = 0
+        segment_tokens[finished] = 0
+    # The last (incomplete) segment adds a partial factor
+    pending = segment_tokens > 0
+    ttrs = np.divide(types, segment_tokens, out=np.ones(len(lengths)), where=pending)
+    factors += np.where(pending, (1 - ttrs) / (1 - threshold), 0)
+    return factors
+
+
+def get_mtlds(tokens, offsets, threshold=MTLD_THRESHOLD):
+    """Measure of Textual Lexical Diversity of every article (mean of the forward and backward passes). It is NaN for
+    the articles where no factor could be completed nor started (e.g. all their words are different)"""
+    lengths, _ = _get_documents(offsets)
+    forward = _get_mtld_factors(tokens, offsets, threshold)
+    # Reversing the whole batch reverses every article, and the order of the articles too
+    backward = _get_mtld_factors(tokens[::-1].copy(), len(tokens) - offsets[::-1], threshold)[::-1]
+    forward_mtlds = np.divide(lengths, forward, out=np.full(len(lengths), np.nan), where=forward > 0)
+    backward_mtlds = np.divide(lengths, backward, out=np.full(len(lengths), np.nan), where=backward > 0)
+    return (forward_mtlds + backward_mtlds) / 2
+
+
+def get_yules_ks(tokens, offsets):
+    """Yule's K of every article, from its frequency spectrum: 10^4 * (sum(m^2 * V(m)) - N) / N^2"""
+    lengths, _ = _get_documents(offsets)
+    documents, frequencies = _get_frequencies(tokens, offsets)
+    squares = np.bincount(documents, weights=frequencies.astype(np.float64) ** 2, minlength=len(lengths))
+    return np.divide(1e4 * (squares - lengths), lengths.astype(np.float64) ** 2, out=np.full(len(lengths), np.nan),
+                     where=lengths > 0)
+
+
+def get_metrics(tokens, offsets, window=MATTR_WINDOW, threshold=MTLD_THRESHOLD):
+    """Returns a {metric: values} dict with all the metrics of every article of the batch"""
+    return {'ttr': get_ttrs(tokens, offsets),
+            'mattr': get_mattrs(tokens, offsets, window),
+            'mtld': get_mtlds(tokens, offsets, threshold),
+            'yules_k': get_yules_ks(tokens, offsets)}
+
+
+def get_lexical_diversity(group_by='year', text='lemmatized_text', csv_suffix='', batch_size=BATCH_SIZE,
+                          window=MATTR_WINDOW, threshold=MTLD_THRESHOLD):
+    """Generates a CSV with the summary of every lexical diversity metric of all the articles per year, per province
+    or in total. Each line has the group, the metric and the summary fields (mean first)"""
+    if group_by not in GROUP_BY:
+        raise ValueError(f'unknown grouping {group_by}, it must be one of {GROUP_BY}')
+    start_cfg_date, end_cfg_date = get_dates_from_cfg()
+
+    vocabulary = {}
+    stats = {}
+    articles = read_articles(start_cfg_date, end_cfg_date)
+    while True:
+        batch = list(itertools.islice(articles, batch_size))
+        if not batch:
+            break
+        print(f'\tExtracting {batch[-1][0]} {batch[-1][1]}\'s news...', end='\r')
+        # Same words as `news_stats.py`, so the TTR of an article is the one of the ttrs_*.csv summaries
+        texts = [get_article_words(article, text) for _, _, article in batch]
+        metrics = get_metrics(*encode_batch(texts, vocabulary), window, threshold)
+        for index, (category, date, _) in enumerate(batch):
+            group = {'year': date.year, 'province': category, 'total': 'total'}[group_by]
+            for metric in METRICS:
+                value = metrics[metric][index]
+                if np.isfinite(value):
+                    stats.setdefault((group, metric), StatsAccumulator()).update(float(value))
+    print()
+    with open(f'lexical_diversity_per_{group_by}{csv_suffix}.csv', 'w') as csv_out:
+        for (group, metric), accumulator in stats.items():
+            print(f'{group};{metric};{format_summary(accumulator.summary())}', file=csv_out)
+
+
+if __name__ == '__main__':
+    # Example:
+    get_lexical_diversity(group_by='province', text='lemmatized_text_reduced', csv_suffix='_reduced')
@@ -10,11 +10,19 @@ with an ad-hoc intention (that is, to be used only once).
 import configparser
 import datetime
 import fnmatch
+import itertools
 import json
 import os
 from collections import namedtuple
 from pathlib import Path
 
+import numpy as np
+
+from accumulators import StatsAccumulator, format_summary
+from calendar_table import CalendarTable
+from prefetch_reader import PrefetchingReader
+from spill_counter import SpillingCounter
+
 ADMITTED_CATEGORIES_TXT = 'admitted_categories.txt'
 CFG_FILE = 'config.cfg'
 DATES_CFG_GROUP = 'dates'
@@ -23,6 +31,10 @@ DATES_FILE_FORMAT = '%Y/%m/%d'
 DATES_SQL_FORMAT = '%Y-%m-%d'
 DUMP_DIR = f'{str(Path.home())}/dump-processed'
 JSON_FILE_PATTERN = '*.json'
+ARTICLE_PARTS = ['title', 'lead', 'body']
+NEC_TYPES = ['persons', 'locations', 'organizations', 'others']
+# Read ahead the next day directories in background threads (useful when the dump is on NFS or spinning disks)
+PREFETCH = False
 
 Article = namedtuple('Article', ['title', 'lead', 'body', 'date', 'province', 'url'])
 
@@ -46,6 +58,98 @@ def get_dates_from_cfg():
     return start_cfg_date, end_cfg_date
 
 
+def get_day_dirs(start_date, end_date, categories=None, dump_dir=None, by_date=False):
+    """Yields a (category, date, path) tuple for every day directory between both dates, in category -> date order (or
+    date -> category order if `by_date` is set). The dump is `DUMP_DIR` by default"""
+    categories = categories or read_categories_from_file()
+    dump_dir = dump_dir or DUMP_DIR
+    if by_date:
+        for date_between in get_dates_between(start_date, end_date):
+            for category in categories:
+                yield category, date_between, f'{dump_dir}/{category}/{date_between.strftime(DATES_FILE_FORMAT)}'
+        return
+    for category in categories:
+        for date_between in get_dates_between(start_date, end_date):
+            yield category, date_between, f'{dump_dir}/{category}/{date_between.strftime(DATES_FILE_FORMAT)}'
+
+
+def read_articles(start_date, end_date, categories=None, dump_dir=None, prefetch=None, by_date=False, shard=None):
+    """Yields a (category, date, article) tuple for every article (JSON file) of the dump between both dates, walking
+    it in the same category -> date order as the rest of the scripts (or date -> category order if `by_date` is set). If
+    `prefetch` is set (`PREFETCH` by default), the next day directories are read in background threads (see
+    `prefetch_reader.py`). If `shard` is given (see `sharding.ShardSpec`), only the articles whose path relative to
+    the dump it `contains` are read"""
+    dump_dir = dump_dir or DUMP_DIR
+    day_dirs = get_day_dirs(start_date, end_date, categories, dump_dir, by_date)
+
+    def select_files(path, filenames):
+        filenames = fnmatch.filter(filenames, JSON_FILE_PATTERN)
+        if shard is None:
+            return filenames
+        relative_dir = os.path.relpath(path, dump_dir)
+        return [filename for filename in filenames if shard.contains(f'{relative_dir}/{filename}')]
+
+    if prefetch is None:
+        prefetch = PREFETCH
+    if prefetch:
+        reader = PrefetchingReader(day_dirs, select_files=select_files)
+        yield from reader
+        print(f'\n{reader.format_report()}')
+        return
+    for category, date_between, current_dir_path in day_dirs:
+        try:
+            filenames = select_files(current_dir_path, os.listdir(current_dir_path))
+        except FileNotFoundError:
+            continue
+        for filename in filenames:
+            with open(f'{current_dir_path}/{filename}') as f:
+                yield category, date_between, json.load(f)
+
+
+def scan_articles(what, categories=None, by_date=False, shard=None, dump_dir=None):
+    """Yields a (category, date, article) tuple for every article between the dates of config.cfg, or the provinces
+    and dates of the `shard` if given (see `read_articles`, so the scan is prefetched if `PREFETCH` is set), printing
+    the progress of the scan"""
+    if shard is None:
+        start_date, end_date = get_dates_from_cfg()
+    else:
+        start_date, end_date, categories = shard.start_date, shard.end_date, shard.provinces
+    current_category, current_date = None, None
+    for category, date_between, article in read_articles(start_date, end_date, categories, dump_dir, by_date=by_date,
+                                                         shard=shard):
+        if category != current_category and not by_date:
+            if current_category is not None:
+                print()
+            print(f'Extracting {category}\'s {what}...')
+        if date_between != current_date:
+            print(f'\tExtracting {date_between}\'s {what}...', end='\r')
+        current_category, current_date = category, date_between
+        yield category, date_between, article
+    print()
+
+
+def split_words(text):
+    """Splits the text of an article part into words as the counts of this module do: by single spaces, the separator
+    of the lemmatized texts"""
+    return text.split(' ')
+
+
+def get_article_words(article, text='lemmatized_text'):
+    """Returns the words of the title, lead and body of the article, taken from the `text` field"""
+    return [word for part in ARTICLE_PARTS for word in split_words(article[part][text])]
+
+
+def get_article_necs(article):
+    """Returns the Named Entities (of every type) of the title, lead and body of the article"""
+    return [nec for part in ARTICLE_PARTS for nec_type in NEC_TYPES for nec in article[part][nec_type]]
+
+
+def get_article_ttr(article, text='lemmatized_text'):
+    """Returns the TTR (Type-Token Ratio) of the article: different words / words"""
+    words = get_article_words(article, text)
+    return len(set(words)) / len(words)
+
+
 def get_news_count():
     """Generates a CSV with the amount of news by category per year"""
     start_cfg_date, end_cfg_date = get_dates_from_cfg()
@@ -66,207 +170,127 @@ def get_news_count():
     print('Total: ', total)
 
 
-def get_words_count_per_year(text='lemmatized_text', csv_suffix=''):
-    """Generates a CSV with the amount of total words per year"""
+def count_per_calendar(fields, get_items, csv_prefix, csv_suffix=''):
+    """Counts the items returned by `get_items(article)` per calendar group (any combination of the fields of
+    `CalendarTable`, like year, season, month or week) reading the corpus only once, in date order, and writes the CSV
+    of every group as soon as the scan leaves its last day, so only the counts of the groups in progress are kept in
+    memory. Every group declared by `CalendarTable.get_declared_groups` gets its CSV, even if it is empty"""
     start_cfg_date, end_cfg_date = get_dates_from_cfg()
+    calendar = CalendarTable(start_cfg_date, end_cfg_date)
+    day_groups, groups = calendar.get_groups(fields)
+    last_offsets = np.zeros(len(groups), dtype=np.int64)
+    np.maximum.at(last_offsets, day_groups, np.arange(calendar.days))
+    # Groups in the order their last day is reached
+    pending = sorted(range(len(groups)), key=lambda group: last_offsets[group], reverse=True)
+    counts_per_group = {}
+
+    def write_finished_groups(offset):
+        while pending and last_offsets[pending[-1]] < offset:
+            group = pending.pop()
+            label = calendar.format_group(fields, groups[group])
+            with open(f'{csv_prefix}_{label}{csv_suffix}.csv', 'w') as csv_out:
+                for item, count in counts_per_group.pop(group, {}).items():
+                    print(f'{label};{item};{count}', file=csv_out)
+
+    current_date = None
+    for _, date_between, article in scan_articles('articles', by_date=True):
+        if date_between != current_date:
+            current_date = date_between
+            offset = calendar.get_offset(date_between)
+            write_finished_groups(offset)
+            counts = counts_per_group.setdefault(day_groups[offset], {})
+        for item in get_items(article):
+            if item in counts:
+                counts[item] += 1
+            else:
+                counts[item] = 1
+    write_finished_groups(calendar.days)
+    # The groups without days in the range (e.g. the seasons not reached) get an empty CSV, as the original scripts did
+    for group in set(calendar.get_declared_groups(fields)) - set(groups):
+        open(f'{csv_prefix}_{calendar.format_group(fields, group)}{csv_suffix}.csv', 'w').close()
+
+
+def get_words_count_per_calendar(fields=('year',), text='lemmatized_text', csv_suffix=''):
+    """Generates a CSV with the amount of total words per calendar group (see `count_per_calendar`)"""
+    count_per_calendar(fields, lambda article: get_article_words(article, text), 'words_count', csv_suffix)
 
-    for year in range(start_cfg_date.year, end_cfg_date.year + 1):
-        counts = {}
-        for category in read_categories_from_file():
-            print(f'Extracting {category}\'s words...')
-            for date_between in get_dates_between(start_cfg_date, end_cfg_date):
-                if date_between.year == year:
-                    print(f'\tExtracting {date_between}\'s words...', end='\r')
-                    try:
-                        current_dir_path = f'{DUMP_DIR}/{category}/{date_between.strftime(DATES_FILE_FORMAT)}'
-                        for filename in os.listdir(current_dir_path):
-                            file_path = f'{current_dir_path}/{filename}'
-                            with open(file_path) as f:
-                                article = json.load(f)
-                                for part in ['title', 'lead', 'body']:
-                                    for word in article[part][text].split(' '):
-                                        if word in counts:
-                                            counts[word] += 1
-                                        else:
-                                            counts[word] = 1
-                    except FileNotFoundError:
-                        pass
-            print()
-        with open(f'words_count_{year}{csv_suffix}.csv', 'w') as f:
-            for word, count in counts.items():
-                print(f'{year};{word};{count}', file=f)
+
+def get_words_count_per_year(text='lemmatized_text', csv_suffix=''):
+    """Generates a CSV with the amount of total words per year"""
+    get_words_count_per_calendar(('year',), text, csv_suffix)
 
 
 def get_words_count_per_season(text='lemmatized_text', csv_suffix=''):
     """Generates a CSV with the amount of total words per season"""
-    Season = namedtuple("Season", ['name', 'start_date', 'end_date'])
-    dummy_leap_year = 2000
-    seasons = [Season('winter', datetime.date(dummy_leap_year, 1, 1), datetime.date(dummy_leap_year, 3, 20)),
-               Season('spring', datetime.date(dummy_leap_year, 3, 21), datetime.date(dummy_leap_year, 6, 20)),
-               Season('summer', datetime.date(dummy_leap_year, 6, 21), datetime.date(dummy_leap_year, 9, 20)),
-               Season('autumn', datetime.date(dummy_leap_year, 9, 21), datetime.date(dummy_leap_year, 12, 20)),
-               Season('winter2', datetime.date(dummy_leap_year, 12, 21), datetime.date(dummy_leap_year, 12, 31))]
-
-    def get_season(now):
-        if isinstance(now, datetime.datetime):
-            now = now.date()
-        now = now.replace(year=dummy_leap_year)
-        return next(s for s in seasons if s.start_date <= now <= s.end_date)
-
-    start_cfg_date, end_cfg_date = get_dates_from_cfg()
-
-    for season in seasons:
-        counts = {}
-        for category in read_categories_from_file():
-            print(f'Extracting {category}\'s words...')
-            for date_between in get_dates_between(start_cfg_date, end_cfg_date):
-                current_season = get_season(date_between)
-                if current_season.name == season.name:
-                    print(f'\tExtracting {date_between}\'s words...', end='\r')
-                    try:
-                        current_dir_path = f'{DUMP_DIR}/{category}/{date_between.strftime(DATES_FILE_FORMAT)}'
-                        for filename in os.listdir(current_dir_path):
-                            file_path = f'{current_dir_path}/{filename}'
-                            with open(file_path) as f:
-                                article = json.load(f)
-                                for part in ['title', 'lead', 'body']:
-                                    for word in article[part][text].split(' '):
-                                        if word in counts:
-                                            counts[word] += 1
-                                        else:
-                                            counts[word] = 1
-                    except FileNotFoundError:
-                        pass
-            print()
-        with open(f'words_count_{season.name}{csv_suffix}.csv', 'w') as f:
-            for word, count in counts.items():
-                print(f'{season.name};{word};{count}', file=f)
+    get_words_count_per_calendar(('season',), text, csv_suffix)
 
 
-def get_words_count_per_category():
-    """Generates a CSV with the amount of total words per category"""
-    start_cfg_date, end_cfg_date = get_dates_from_cfg()
+def get_words_count_per_category(text='lemmatized_text', csv_suffix='', memory_limit=None):
+    """Generates a CSV with the amount of total words per category (and another one with the reduced words if `text`
+    is lemmatized_text)
 
+    Args:
+        :param text: JSON field where you extract the text to analyze from (raw_text, lemmatized_text,
+                     lemmatized_text_reduced)
+        :param csv_suffix: if you want to add a suffix to the generated CSV files
+        :param memory_limit: approximate bytes of words kept in memory before spilling the counts to disk (see
+                             `SpillingCounter`). Unlimited by default
+    """
+    with_reduced = text == 'lemmatized_text'
     for category in read_categories_from_file():
-        counts = {}
-        counts_reduced = {}
-        print(f'Extracting {category}\'s words...')
-        for date_between in get_dates_between(start_cfg_date, end_cfg_date):
-            print(f'\tExtracting {date_between}\'s words...', end='\r')
-            try:
-                current_dir_path = f'{DUMP_DIR}/{category}/{date_between.strftime(DATES_FILE_FORMAT)}'
-                for filename in os.listdir(current_dir_path):
-                    file_path = f'{current_dir_path}/{filename}'
-                    with open(file_path) as f:
-                        article = json.load(f)
-                        for part in ['title', 'lead', 'body']:
-                            for word in article[part]['lemmatized_text'].split(' '):
-                                if word in counts:
-                                    counts[word] += 1
-                                else:
-                                    counts[word] = 1
-                            for word in article[part]['lemmatized_text_reduced'].split(' '):
-                                if word in counts_reduced:
-                                    counts_reduced[word] += 1
-                                else:
-                                    counts_reduced[word] = 1
-            except FileNotFoundError:
-                pass
-        print()
-        with open(f'words_count_{category}.csv', 'w') as csv_out, \
-                open(f'words_count_{category}_reduced.csv', 'w') as csv_reduced:
+        counts = SpillingCounter(memory_limit)
+        counts_reduced = SpillingCounter(memory_limit)
+        for _, _, article in scan_articles('words', [category]):
+            counts.update(get_article_words(article, text))
+            if with_reduced:
+                counts_reduced.update(get_article_words(article, 'lemmatized_text_reduced'))
+        with open(f'words_count_{category}{csv_suffix}.csv', 'w') as csv_out:
             for word, count in counts.items():
                 print(f'{category};{word};{count}', file=csv_out)
-            for word, count in counts_reduced.items():
-                print(f'{category};{word};{count}', file=csv_reduced)
+        if with_reduced:
+            with open(f'words_count_{category}{csv_suffix}_reduced.csv', 'w') as csv_reduced:
+                for word, count in counts_reduced.items():
+                    print(f'{category};{word};{count}', file=csv_reduced)
 
 
-def get_words_count_total(text='lemmatized_text', csv_suffix=''):
-    """Generates a CSV with the amount of total words"""
-    start_cfg_date, end_cfg_date = get_dates_from_cfg()
+def get_words_count_total(text='lemmatized_text', csv_suffix='', memory_limit=None):
+    """Generates a CSV with the amount of total words
 
-    counts = {}
-    for category in read_categories_from_file():
-        print(f'Extracting {category}\'s words...')
-        for date_between in get_dates_between(start_cfg_date, end_cfg_date):
-            print(f'\tExtracting {date_between}\'s words...', end='\r')
-            try:
-                current_dir_path = f'{DUMP_DIR}/{category}/{date_between.strftime(DATES_FILE_FORMAT)}'
-                for filename in os.listdir(current_dir_path):
-                    file_path = f'{current_dir_path}/{filename}'
-                    with open(file_path) as f:
-                        article = json.load(f)
-                        for part in ['title', 'lead', 'body']:
-                            for word in article[part][text].split(' '):
-                                if word in counts:
-                                    counts[word] += 1
-                                else:
-                                    counts[word] = 1
-            except FileNotFoundError:
-                pass
-        print()
+    Args:
+        :param text: JSON field where you extract the text to analyze from (raw_text, lemmatized_text,
+                     lemmatized_text_reduced)
+        :param csv_suffix: if you want to add a suffix to the generated CSV file
+        :param memory_limit: approximate bytes of words kept in memory before spilling the counts to disk (see
+                             `SpillingCounter`). Unlimited by default
+    """
+    counts = SpillingCounter(memory_limit)
+    for _, _, article in scan_articles('words'):
+        counts.update(get_article_words(article, text))
     with open(f'words_count_total{csv_suffix}.csv', 'w') as f:
         for word, count in counts.items():
             print(f'total;{word};{count}', file=f)
 
 
+def get_necs_count_per_calendar(fields=('year',)):
+    """Generates a CSV with the amount of Named Entities per calendar group (see `count_per_calendar`)"""
+    count_per_calendar(fields, get_article_necs, 'necs_count')
+
+
 def get_necs_count_per_year():
     """Generates a CSV with the amount of Named Entities per year"""
-    start_cfg_date, end_cfg_date = get_dates_from_cfg()
-
-    for year in range(start_cfg_date.year, end_cfg_date.year + 1):
-        counts = {}
-        for category in read_categories_from_file():
-            print(f'Extracting {category}\'s words...')
-            for date_between in get_dates_between(start_cfg_date, end_cfg_date):
-                if date_between.year == year:
-                    print(f'\tExtracting {date_between}\'s words...', end='\r')
-                    try:
-                        current_dir_path = f'{DUMP_DIR}/{category}/{date_between.strftime(DATES_FILE_FORMAT)}'
-                        for filename in os.listdir(current_dir_path):
-                            file_path = f'{current_dir_path}/{filename}'
-                            with open(file_path) as f:
-                                article = json.load(f)
-                                for part in ['title', 'lead', 'body']:
-                                    for text in ['persons', 'locations', 'organizations', 'others']:
-                                        for nec in article[part][text]:
-                                            if nec in counts:
-                                                counts[nec] += 1
-                                            else:
-                                                counts[nec] = 1
-                    except FileNotFoundError:
-                        pass
-            print()
-        with open(f'necs_count_{year}.csv', 'w') as csv_out:
-            for nec, ocurrences in counts.items():
-                print(f'{year};{nec};{ocurrences}', file=csv_out)
+    get_necs_count_per_calendar(('year',))
 
 
 def get_necs_count_per_category():
     """Generates a CSV with the amount of Named Entities per category"""
-    start_cfg_date, end_cfg_date = get_dates_from_cfg()
-
     for category in read_categories_from_file():
         counts = {}
-        print(f'Extracting {category}\'s words...')
-        for date_between in get_dates_between(start_cfg_date, end_cfg_date):
-            print(f'\tExtracting {date_between}\'s words...', end='\r')
-            try:
-                current_dir_path = f'{DUMP_DIR}/{category}/{date_between.strftime(DATES_FILE_FORMAT)}'
-                for filename in os.listdir(current_dir_path):
-                    file_path = f'{current_dir_path}/{filename}'
-                    with open(file_path) as f:
-                        article = json.load(f)
-                        for part in ['title', 'lead', 'body']:
-                            for text in ['persons', 'locations', 'organizations', 'others']:
-                                for nec in article[part][text]:
-                                    if nec in counts:
-                                        counts[nec] += 1
-                                    else:
-                                        counts[nec] = 1
-            except FileNotFoundError:
-                pass
-        print()
+        for _, _, article in scan_articles('words', [category]):
+            for nec in get_article_necs(article):
+                if nec in counts:
+                    counts[nec] += 1
+                else:
+                    counts[nec] = 1
         with open(f'necs_count_{category}.csv', 'w') as csv_out:
             for nec, ocurrences in counts.items():
                 print(f'{category};{nec};{ocurrences}', file=csv_out)
@@ -284,25 +308,12 @@ def get_news_from_topics(text='lemmatized_text', csv_suffix='', topics=set(), fu
                      if AT LEAST ONE were.
     """
     Appereance = namedtuple("Appereance", ["date", "province", "article"])
-    start_cfg_date, end_cfg_date = get_dates_from_cfg()
 
     appereances = set()
-    for category in read_categories_from_file():
-        print(f'Extracting {category}\'s news...')
-        for date_between in get_dates_between(start_cfg_date, end_cfg_date):
-            print(f'\tExtracting {date_between}\'s news...', end='\r')
-            try:
-                current_dir_path = f'{DUMP_DIR}/{category}/{date_between.strftime(DATES_FILE_FORMAT)}'
-                for filename in os.listdir(current_dir_path):
-                    file_path = f'{current_dir_path}/{filename}'
-                    with open(file_path) as f:
-                        article = json.load(f)
-                        for part in ['title', 'lead', 'body']:
-                            if func(topic in article[part][text] for topic in topics):
-                                appereances.add(Appereance(date_between, category, article['url']))
-            except FileNotFoundError:
-                pass
-        print()
+    for category, date_between, article in scan_articles('news'):
+        for part in ARTICLE_PARTS:
+            if func(topic in article[part][text] for topic in topics):
+                appereances.add(Appereance(date_between, category, article['url']))
     with open(f'news_appereances{csv_suffix}.csv', 'w') as f:
         for appereance in appereances:
             print(f'{appereance.province};{appereance.date.strftime(DATES_SQL_FORMAT)};{appereance.article}', file=f)
@@ -319,38 +330,21 @@ def get_news_from_topics_with_count(text='lemmatized_text', csv_suffix='', topic
         :param raw_topics: set of topics to look for, but exclusively for the raw_text
     """
     Appereance = namedtuple("Appereance", ["date", "province", "article", "counts", "ratio_per_day"])
-    start_cfg_date, end_cfg_date = get_dates_from_cfg()
 
     appereances = set()
-    for category in read_categories_from_file():
-        print(f'Extracting {category}\'s news...')
-        for date_between in get_dates_between(start_cfg_date, end_cfg_date):
-            print(f'\tExtracting {date_between}\'s news...', end='\r')
-            try:
-                current_dir_path = f'{DUMP_DIR}/{category}/{date_between.strftime(DATES_FILE_FORMAT)}'
-                words_per_day = 0
-                for filename in os.listdir(current_dir_path):
-                    file_path = f'{current_dir_path}/{filename}'
-                    with open(file_path) as f:
-                        article = json.load(f)
-                        for part in ['title', 'lead', 'body']:
-                            words_per_day += len(article[part][text].split(' '))
-                for filename in os.listdir(current_dir_path):
-                    file_path = f'{current_dir_path}/{filename}'
-                    with open(file_path) as f:
-                        article = json.load(f)
-                        counts = 0
-                        for part in ['title', 'lead', 'body']:
-                            for topic in topics:
-                                counts += article[part][text].count(topic)
-                            for raw_topic in raw_topics:
-                                counts += article[part]['raw_text'].lower().count(raw_topic)
-                        if counts > 0:
-                            appereances.add(
-                                Appereance(date_between, category, article['url'], counts, counts / words_per_day))
-            except FileNotFoundError:
-                pass
-        print()
+    # The ratio needs the words of the whole day, so the articles of every day are read before counting the topics
+    for (category, date_between), day_articles in itertools.groupby(scan_articles('news'), key=lambda x: x[:2]):
+        day_articles = [article for _, _, article in day_articles]
+        words_per_day = sum(len(article[part][text].split(' ')) for article in day_articles for part in ARTICLE_PARTS)
+        for article in day_articles:
+            counts = 0
+            for part in ARTICLE_PARTS:
+                for topic in topics:
+                    counts += article[part][text].count(topic)
+                for raw_topic in raw_topics:
+                    counts += article[part]['raw_text'].lower().count(raw_topic)
+            if counts > 0:
+                appereances.add(Appereance(date_between, category, article['url'], counts, counts / words_per_day))
     with open(f'news_appereances{csv_suffix}.csv', 'w') as f:
         for appereance in appereances:
             print(f'{appereance.province};{appereance.date.strftime(DATES_SQL_FORMAT)};'
@@ -358,282 +352,147 @@ def get_news_from_topics_with_count(text='lemmatized_text', csv_suffix='', topic
 
 
 def get_ttrs_from_articles_per_year():
-    """Generates a CSV which gives the TTR (Type-Token Ratio) mean of all the articles per year"""
+    """Generates a CSV which gives the TTR (Type-Token Ratio) summary (mean, variance, confidence interval of the mean
+    and percentiles) of all the articles per year"""
     start_cfg_date, end_cfg_date = get_dates_from_cfg()
-
-    ttrs_mean = {}
-    ttrs_mean_reduced = {}
-    for year in range(start_cfg_date.year, end_cfg_date.year + 1):
-        ttrs = []
-        ttrs_reduced = []
-        articles_readen = 0
-        for category in read_categories_from_file():
-            print(f'Extracting {category}\'s news...')
-            for date_between in get_dates_between(start_cfg_date, end_cfg_date):
-                if date_between.year == year:
-                    print(f'\tExtracting {date_between}\'s news...', end='\r')
-                    try:
-                        current_dir_path = f'{DUMP_DIR}/{category}/{date_between.strftime(DATES_FILE_FORMAT)}'
-                        for filename in os.listdir(current_dir_path):
-                            file_path = f'{current_dir_path}/{filename}'
-                            with open(file_path) as f:
-                                article = json.load(f)
-                                counts = {}
-                                counts_reduced = {}
-                                for part in ['title', 'lead', 'body']:
-                                    for word in article[part]['lemmatized_text'].split(' '):
-                                        if word in counts:
-                                            counts[word] += 1
-                                        else:
-                                            counts[word] = 1
-                                    for word in article[part]['lemmatized_text_reduced'].split(' '):
-                                        if word in counts_reduced:
-                                            counts_reduced[word] += 1
-                                        else:
-                                            counts_reduced[word] = 1
-                                ttrs.append(len(counts) / sum(counts.values()))
-                                ttrs_reduced.append(len(counts_reduced) / sum(counts_reduced.values()))
-                                articles_readen += 1
-                    except FileNotFoundError:
-                        pass
-            print()
-        ttrs_mean[year] = (sum(ttrs) / articles_readen)
-        ttrs_mean_reduced[year] = (sum(ttrs_reduced) / articles_readen)
+    calendar = CalendarTable(start_cfg_date, end_cfg_date)
+    day_groups, groups = calendar.get_groups(('year',))
+
+    ttrs = [StatsAccumulator() for _ in groups]
+    ttrs_reduced = [StatsAccumulator() for _ in groups]
+    for _, date_between, article in scan_articles('news'):
+        group = day_groups[calendar.get_offset(date_between)]
+        ttrs[group].update(get_article_ttr(article))
+        ttrs_reduced[group].update(get_article_ttr(article, 'lemmatized_text_reduced'))
     with open('ttrs_per_year.csv', 'w') as csv_out, open('ttrs_per_year_reduced.csv', 'w') as csv_reduced:
-        for year, ttr_mean in ttrs_mean.items():
-            print(f'{year};{ttr_mean}', file=csv_out)
-        for year, ttr_mean_reduced in ttrs_mean_reduced.items():
-            print(f'{year};{ttr_mean_reduced}', file=csv_reduced)
+        for (year,), ttr, ttr_reduced in zip(groups, ttrs, ttrs_reduced):
+            print(f'{year};{format_summary(ttr.summary())}', file=csv_out)
+            print(f'{year};{format_summary(ttr_reduced.summary())}', file=csv_reduced)
 
 
 def get_ttrs_from_articles_per_province():
-    """Generates a CSV which gives the TTR (Type-Token Ratio) mean of all the articles per province"""
-    start_cfg_date, end_cfg_date = get_dates_from_cfg()
-
-    ttrs_mean = {}
-    ttrs_mean_reduced = {}
+    """Generates a CSV which gives the TTR (Type-Token Ratio) summary (mean, variance, confidence interval of the mean
+    and percentiles) of all the articles per province"""
+    ttrs_per_category = {}
+    ttrs_reduced_per_category = {}
     for category in read_categories_from_file():
-        print(f'Extracting {category}\'s news...')
-        ttrs = []
-        ttrs_reduced = []
-        articles_readen = 0
-        for date_between in get_dates_between(start_cfg_date, end_cfg_date):
-            print(f'\tExtracting {date_between}\'s news...', end='\r')
-            try:
-                current_dir_path = f'{DUMP_DIR}/{category}/{date_between.strftime(DATES_FILE_FORMAT)}'
-                for filename in os.listdir(current_dir_path):
-                    file_path = f'{current_dir_path}/{filename}'
-                    with open(file_path) as f:
-                        article = json.load(f)
-                        counts = {}
-                        counts_reduced = {}
-                        for part in ['title', 'lead', 'body']:
-                            for word in article[part]['lemmatized_text'].split(' '):
-                                if word in counts:
-                                    counts[word] += 1
-                                else:
-                                    counts[word] = 1
-                            for word in article[part]['lemmatized_text_reduced'].split(' '):
-                                if word in counts_reduced:
-                                    counts_reduced[word] += 1
-                                else:
-                                    counts_reduced[word] = 1
-                        ttrs.append(len(counts) / sum(counts.values()))
-                        ttrs_reduced.append(len(counts_reduced) / sum(counts_reduced.values()))
-                        articles_readen += 1
-            except FileNotFoundError:
-                pass
-        print()
-        ttrs_mean[category] = (sum(ttrs) / articles_readen)
-        ttrs_mean_reduced[category] = (sum(ttrs_reduced) / articles_readen)
+        ttrs = ttrs_per_category[category] = StatsAccumulator()
+        ttrs_reduced = ttrs_reduced_per_category[category] = StatsAccumulator()
+        for _, _, article in scan_articles('news', [category]):
+            ttrs.update(get_article_ttr(article))
+            ttrs_reduced.update(get_article_ttr(article, 'lemmatized_text_reduced'))
     with open('ttrs_per_category.csv', 'w') as csv_out, open('ttrs_per_category_reduced.csv', 'w') as csv_reduced:
-        for year, ttr_mean in ttrs_mean.items():
-            print(f'{year};{ttr_mean}', file=csv_out)
-        for year, ttr_mean_reduced in ttrs_mean_reduced.items():
-            print(f'{year};{ttr_mean_reduced}', file=csv_reduced)
+        for category, ttrs in ttrs_per_category.items():
+            print(f'{category};{format_summary(ttrs.summary())}', file=csv_out)
+        for category, ttrs_reduced in ttrs_reduced_per_category.items():
+            print(f'{category};{format_summary(ttrs_reduced.summary())}', file=csv_reduced)
 
 
 def get_ttrs_from_articles_total():
-    """Prints the TTR (Type-Token Ratio) mean of all the articles"""
-    start_cfg_date, end_cfg_date = get_dates_from_cfg()
-
-    ttrs = []
-    ttrs_reduced = []
-    articles_readen = 0
-    for category in read_categories_from_file():
-        print(f'Extracting {category}\'s news...')
-        for date_between in get_dates_between(start_cfg_date, end_cfg_date):
-            print(f'\tExtracting {date_between}\'s news...', end='\r')
-            try:
-                current_dir_path = f'{DUMP_DIR}/{category}/{date_between.strftime(DATES_FILE_FORMAT)}'
-                for filename in os.listdir(current_dir_path):
-                    file_path = f'{current_dir_path}/{filename}'
-                    with open(file_path) as f:
-                        article = json.load(f)
-                        counts = {}
-                        counts_reduced = {}
-                        for part in ['title', 'lead', 'body']:
-                            for word in article[part]['lemmatized_text'].split(' '):
-                                if word in counts:
-                                    counts[word] += 1
-                                else:
-                                    counts[word] = 1
-                            for word in article[part]['lemmatized_text_reduced'].split(' '):
-                                if word in counts_reduced:
-                                    counts_reduced[word] += 1
-                                else:
-                                    counts_reduced[word] = 1
-                        ttrs.append(len(counts) / sum(counts.values()))
-                        ttrs_reduced.append(len(counts_reduced) / sum(counts_reduced.values()))
-                        articles_readen += 1
-            except FileNotFoundError:
-                pass
-        print()
-    print('normal: ', sum(ttrs) / articles_readen)
-    print('reduced: ', sum(ttrs_reduced) / articles_readen)
+    """Prints the TTR (Type-Token Ratio) summary (mean, variance, confidence interval of the mean and percentiles) of
+    all the articles"""
+    ttrs = StatsAccumulator()
+    ttrs_reduced = StatsAccumulator()
+    for _, _, article in scan_articles('news'):
+        ttrs.update(get_article_ttr(article))
+        ttrs_reduced.update(get_article_ttr(article, 'lemmatized_text_reduced'))
+    print('normal: ', ttrs.summary())
+    print('reduced: ', ttrs_reduced.summary())
 
 
 def get_anglicisms_from_articles_per_year():
-    """Generates a CSV which gives the anglicisms usage percentage of all the articles per year"""
+    """Generates a CSV which gives the anglicisms usage percentage summary (mean, variance, confidence interval of the
+    mean and percentiles) of all the articles per year"""
     start_cfg_date, end_cfg_date = get_dates_from_cfg()
+    calendar = CalendarTable(start_cfg_date, end_cfg_date)
+    day_groups, groups = calendar.get_groups(('year',))
 
-    anglicisms_mean = {}
-    anglicisms_mean_reduced = {}
+    anglicisms = [StatsAccumulator() for _ in groups]
+    anglicisms_reduced = [StatsAccumulator() for _ in groups]
     with open("anglicisms.txt") as anglicisms_file:
         anglicisms_list = [line.strip() for line in anglicisms_file.readlines()]
-        for year in range(start_cfg_date.year, end_cfg_date.year + 1):
-            anglicisms = []
-            anglicisms_reduced = []
-            articles_readen = 0
-            for category in read_categories_from_file():
-                print(f'Extracting {category}\'s news...')
-                for date_between in get_dates_between(start_cfg_date, end_cfg_date):
-                    if date_between.year == year:
-                        print(f'\tExtracting {date_between}\'s news...', end='\r')
-                        try:
-                            current_dir_path = f'{DUMP_DIR}/{category}/{date_between.strftime(DATES_FILE_FORMAT)}'
-                            for filename in os.listdir(current_dir_path):
-                                file_path = f'{current_dir_path}/{filename}'
-                                with open(file_path) as f:
-                                    article = json.load(f)
-                                    anglicisms_count = 0
-                                    total_words_count = 0
-                                    anglicisms_count_reduced = 0
-                                    total_words_count_reduced = 0
-                                    for part in ['title', 'lead', 'body']:
-                                        for word in article[part]['lemmatized_text'].split(' '):
-                                            total_words_count += 1
-                                            if word in anglicisms_list:
-                                                anglicisms_count += 1
-                                        for word in article[part]['lemmatized_text_reduced'].split(' '):
-                                            total_words_count_reduced += 1
-                                            if word in anglicisms_list:
-                                                anglicisms_count_reduced += 1
-                                    anglicisms.append(anglicisms_count / total_words_count)
-                                    anglicisms_reduced.append(anglicisms_count_reduced / total_words_count_reduced)
-                                    articles_readen += 1
-                        except FileNotFoundError:
-                            pass
-                print()
-            anglicisms_mean[year] = (sum(anglicisms) / articles_readen)
-            anglicisms_mean_reduced[year] = (sum(anglicisms_reduced) / articles_readen)
+        for _, date_between, article in scan_articles('news'):
+            group = day_groups[calendar.get_offset(date_between)]
+            anglicisms_count = 0
+            total_words_count = 0
+            anglicisms_count_reduced = 0
+            total_words_count_reduced = 0
+            for part in ARTICLE_PARTS:
+                for word in article[part]['lemmatized_text'].split(' '):
+                    total_words_count += 1
+                    if word in anglicisms_list:
+                        anglicisms_count += 1
+                for word in article[part]['lemmatized_text_reduced'].split(' '):
+                    total_words_count_reduced += 1
+                    if word in anglicisms_list:
+                        anglicisms_count_reduced += 1
+            anglicisms[group].update(anglicisms_count / total_words_count)
+            anglicisms_reduced[group].update(anglicisms_count_reduced / total_words_count_reduced)
     with open('anglicisms_per_year.csv', 'w') as csv_out, open('anglicisms_per_year_reduced.csv', 'w') as csv_reduced:
-        for year, anglicism_mean in anglicisms_mean.items():
-            print(f'{year};{anglicism_mean}', file=csv_out)
-        for year, anglicism_mean_reduced in anglicisms_mean_reduced.items():
-            print(f'{year};{anglicism_mean_reduced}', file=csv_reduced)
+        for (year,), anglicism, anglicism_reduced in zip(groups, anglicisms, anglicisms_reduced):
+            print(f'{year};{format_summary(anglicism.summary())}', file=csv_out)
+            print(f'{year};{format_summary(anglicism_reduced.summary())}', file=csv_reduced)
 
 
 def get_anglicisms_from_articles_per_province():
-    """Generates a CSV which gives the anglicisms usage percentage of all the articles per province"""
-    start_cfg_date, end_cfg_date = get_dates_from_cfg()
-
-    anglicisms_mean = {}
-    anglicisms_mean_reduced = {}
+    """Generates a CSV which gives the anglicisms usage percentage summary (mean, variance, confidence interval of the
+    mean and percentiles) of all the articles per province"""
+    anglicisms_per_category = {}
+    anglicisms_reduced_per_category = {}
     with open("anglicisms.txt") as anglicisms_file:
         anglicisms_list = [line.strip() for line in anglicisms_file.readlines()]
         for category in read_categories_from_file():
-            print(f'Extracting {category}\'s news...')
-            anglicisms = []
-            anglicisms_reduced = []
-            articles_readen = 0
-            for date_between in get_dates_between(start_cfg_date, end_cfg_date):
-                print(f'\tExtracting {date_between}\'s news...', end='\r')
-                try:
-                    current_dir_path = f'{DUMP_DIR}/{category}/{date_between.strftime(DATES_FILE_FORMAT)}'
-                    for filename in os.listdir(current_dir_path):
-                        file_path = f'{current_dir_path}/{filename}'
-                        with open(file_path) as f:
-                            article = json.load(f)
-                            anglicisms_count = 0
-                            total_words_count = 0
-                            anglicisms_count_reduced = 0
-                            total_words_count_reduced = 0
-                            for part in ['title', 'lead', 'body']:
-                                for word in article[part]['lemmatized_text'].split(' '):
-                                    total_words_count += 1
-                                    if word in anglicisms_list:
-                                        anglicisms_count += 1
-                                for word in article[part]['lemmatized_text_reduced'].split(' '):
-                                    total_words_count_reduced += 1
-                                    if word in anglicisms_list:
-                                        anglicisms_count_reduced += 1
-                            anglicisms.append(anglicisms_count / total_words_count)
-                            anglicisms_reduced.append(anglicisms_count_reduced / total_words_count_reduced)
-                            articles_readen += 1
-                except FileNotFoundError:
-                    pass
-            print()
-            anglicisms_mean[category] = (sum(anglicisms) / articles_readen)
-            anglicisms_mean_reduced[category] = (sum(anglicisms_reduced) / articles_readen)
+            anglicisms = anglicisms_per_category[category] = StatsAccumulator()
+            anglicisms_reduced = anglicisms_reduced_per_category[category] = StatsAccumulator()
+            for _, _, article in scan_articles('news', [category]):
+                anglicisms_count = 0
+                total_words_count = 0
+                anglicisms_count_reduced = 0
+                total_words_count_reduced = 0
+                for part in ARTICLE_PARTS:
+                    for word in article[part]['lemmatized_text'].split(' '):
+                        total_words_count += 1
+                        if word in anglicisms_list:
+                            anglicisms_count += 1
+                    for word in article[part]['lemmatized_text_reduced'].split(' '):
+                        total_words_count_reduced += 1
+                        if word in anglicisms_list:
+                            anglicisms_count_reduced += 1
+                anglicisms.update(anglicisms_count / total_words_count)
+                anglicisms_reduced.update(anglicisms_count_reduced / total_words_count_reduced)
     with open('anglicisms_per_province.csv', 'w') as csv_out, \
             open('anglicisms_per_province_reduced.csv', 'w') as csv_reduced:
-        for year, anglicism_mean in anglicisms_mean.items():
-            print(f'{year};{anglicism_mean}', file=csv_out)
-        for year, anglicism_mean_reduced in anglicisms_mean_reduced.items():
-            print(f'{year};{anglicism_mean_reduced}', file=csv_reduced)
+        for category, anglicisms in anglicisms_per_category.items():
+            print(f'{category};{format_summary(anglicisms.summary())}', file=csv_out)
+        for category, anglicisms_reduced in anglicisms_reduced_per_category.items():
+            print(f'{category};{format_summary(anglicisms_reduced.summary())}', file=csv_reduced)
 
 
 def get_anglicisms_from_articles_total():
-    """Generates a CSV which gives the anglicisms usage percentage of all the articles"""
-    start_cfg_date, end_cfg_date = get_dates_from_cfg()
-
-    anglicisms = []
-    anglicisms_reduced = []
-    articles_readen = 0
+    """Prints the anglicisms usage percentage summary (mean, variance, confidence interval of the mean and percentiles)
+    of all the articles"""
+    anglicisms = StatsAccumulator()
+    anglicisms_reduced = StatsAccumulator()
     with open("anglicisms.txt") as anglicisms_file:
         anglicisms_list = [line.strip() for line in anglicisms_file.readlines()]
-        for category in read_categories_from_file():
-            print(f'Extracting {category}\'s news...')
-            for date_between in get_dates_between(start_cfg_date, end_cfg_date):
-                print(f'\tExtracting {date_between}\'s news...', end='\r')
-                try:
-                    current_dir_path = f'{DUMP_DIR}/{category}/{date_between.strftime(DATES_FILE_FORMAT)}'
-                    for filename in os.listdir(current_dir_path):
-                        file_path = f'{current_dir_path}/{filename}'
-                        with open(file_path) as f:
-                            article = json.load(f)
-                            anglicisms_count = 0
-                            total_words_count = 0
-                            anglicisms_count_reduced = 0
-                            total_words_count_reduced = 0
-                            for part in ['title', 'lead', 'body']:
-                                for word in article[part]['lemmatized_text'].split(' '):
-                                    total_words_count += 1
-                                    if word in anglicisms_list:
-                                        anglicisms_count += 1
-                                for word in article[part]['lemmatized_text_reduced'].split(' '):
-                                    total_words_count_reduced += 1
-                                    if word in anglicisms_list:
-                                        anglicisms_count_reduced += 1
-                            anglicisms.append(anglicisms_count / total_words_count)
-                            anglicisms_reduced.append(anglicisms_count_reduced / total_words_count_reduced)
-                            articles_readen += 1
-                except FileNotFoundError:
-                    pass
-            print()
-    print('normal: ', sum(anglicisms) / articles_readen)
-    print('reduced: ', sum(anglicisms_reduced) / articles_readen)
+        for _, _, article in scan_articles('news'):
+            anglicisms_count = 0
+            total_words_count = 0
+            anglicisms_count_reduced = 0
+            total_words_count_reduced = 0
+            for part in ARTICLE_PARTS:
+                for word in article[part]['lemmatized_text'].split(' '):
+                    total_words_count += 1
+                    if word in anglicisms_list:
+                        anglicisms_count += 1
+                for word in article[part]['lemmatized_text_reduced'].split(' '):
+                    total_words_count_reduced += 1
+                    if word in anglicisms_list:
+                        anglicisms_count_reduced += 1
+            anglicisms.update(anglicisms_count / total_words_count)
+            anglicisms_reduced.update(anglicisms_count_reduced / total_words_count_reduced)
+    print('normal: ', anglicisms.summary())
+    print('reduced: ', anglicisms_reduced.summary())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,283 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Local HTTP server that opens the precomputed indexes of the corpus once and keeps answering queries against them, so
+interactive analysis doesn't pay the startup and loading costs (or a full scan of the corpus) on every question.
+
+Every index is optional: the server loads the ones that have been built (see `INDEXES`) and the endpoints of the
+missing ones answer 404. The queries run in a thread pool, so a slow query doesn't block the rest, and their JSON
+results are kept in an LRU cache bounded by size. Simultaneous identical queries are computed only once.
+
+    python query_server.py [-H localhost -p 8000 -c 256M]
+    curl 'http://localhost:8000/words?term=corrupción&bucket=year&provinces=MADRID,BARCELONA&normalize=1'
+
+Endpoints (lists are comma separated):
+
+* /words?term=&bucket=&provinces=&normalize=          Occurrences of a term per bucket (trends cube)
+* /necs?name=&type=&bucket=&provinces=&normalize=     Occurrences of a named entity per bucket (entity index)
+* /necs/cooccurring?name=&type=&years=&top=&cooccurring_type=
+* /ttr?years=&provinces=&seasons=                    Vocabulary size, words and TTR estimates (vocabulary sketches)
+* /topics?topics=&func=all|any&limit=                Articles with all/any of the topics (document-term matrix)
+* /collocates?word=&slice=&measure=&top=&min_count=   (collocations)
+* /concordance?q=&text=&window=&limit=&offset=&sample=  (concordance)
+* /stats                                              Loaded indexes and cache usage
+"""
+import asyncio
+import csv
+import getopt
+import json
+import os
+import sys
+import traceback
+import urllib.parse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from caching import LRUCache
+from spill_counter import parse_memory_limit
+
+HOST = 'localhost'
+PORT = 8000
+CACHE_SIZE = 256 << 20
+WORKERS = 4
+TOPICS_LIMIT = 100
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                500: 'Internal Server Error'}
+
+
+def _load_cube(directory):
+    from trends_cube import TrendsCube
+    return TrendsCube(directory)
+
+
+def _load_entities(directory):
+    from entities import EntityIndex
+    return EntityIndex(directory)
+
+
+def _load_sketches(directory):
+    from hyperloglog import VocabularySketches
+    return VocabularySketches(directory)
+
+
+def _load_document_term_matrix(directory):
+    from dtm_export import load_document_term_matrix
+    matrix, vocabulary, rows_csv = load_document_term_matrix(directory)
+    with open(rows_csv, newline='') as f:
+        rows_reader = csv.reader(f, delimiter=';')
+        next(rows_reader)
+        rows = list(rows_reader)
+    return matrix, {term: column for column, term in enumerate(vocabulary)}, rows
+
+
+def _load_collocations(directory):
+    from collocations import Collocations
+    return Collocations(directory)
+
+
+def _load_concordance(directory):
+    from concordance import Concordance
+    return Concordance(directory)
+
+
+# Index name -> (default directory, loader)
+INDEXES = {'cube': ('trends_cube', _load_cube),
+           'entities': ('entity_index', _load_entities),
+           'sketches': ('vocabulary_sketches', _load_sketches),
+           'dtm': ('document_term_matrix', _load_document_term_matrix),
+           'collocations': ('collocations', _load_collocations),
+           'concordance': ('concordance', _load_concordance)}
+
+
+class QueryError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _get_list(params, name, cast=str):
+    return [cast(value) for value in params[name].split(',')] if params.get(name) else None
+
+
+def _get_bool(params, name):
+    return params.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+def _get_required(params, name):
+    if not params.get(name):
+        raise QueryError(400, f'missing parameter {name}')
+    return params[name]
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+class QueryServer:
+    """Answers the queries of the endpoints with the indexes found in `directories` ({index name: directory})"""
+
+    def __init__(self, directories=None, cache_size=CACHE_SIZE, workers=WORKERS):
+        self.indexes = {}
+        for name, (directory, loader) in INDEXES.items():
+            directory = (directories or {}).get(name, directory)
+            if os.path.isdir(directory):
+                print(f'Loading {name} from {directory}...')
+                self.indexes[name] = loader(directory)
+        self.cache = LRUCache(cache_size, get_size=len)
+        self.executor = ThreadPoolExecutor(workers)
+        self.handlers = {'/words': self.get_words, '/necs': self.get_necs,
+                         '/necs/cooccurring': self.get_cooccurring_necs, '/ttr': self.get_ttr,
+                         '/topics': self.get_topics, '/collocates': self.get_collocates,
+                         '/concordance': self.get_concordance}
+        self._pending = {}
+
+    def _get_index(self, name):
+        if name not in self.indexes:
+            raise QueryError(404, f'the {name} index is not loaded')
+        return self.indexes[name]
+
+    def get_words(self, params):
+        labels, series = self._get_index('cube').get_series(
+            _get_required(params, 'term'), params.get('bucket', 'month'), _get_list(params, 'provinces'),
+            _get_bool(params, 'normalize'))
+        return {'labels': labels, 'series': series}
+
+    def get_necs(self, params):
+        entity_index = self._get_index('entities')
+        name, entity_type = _get_required(params, 'name'), params.get('type')
+        labels, series = entity_index.get_trend(name, entity_type, params.get('bucket', 'month'),
+                                                _get_list(params, 'provinces'), _get_bool(params, 'normalize'))
+        return {'keys': entity_index.get_entity_keys(name, entity_type), 'labels': labels, 'series': series}
+
+    def get_cooccurring_necs(self, params):
+        cooccurring = self._get_index('entities').get_top_cooccurring(
+            _get_required(params, 'name'), params.get('type'), _get_list(params, 'years', int),
+            int(params.get('top', 10)), params.get('cooccurring_type'))
+        return [{'type': entity_type, 'name': name, 'articles': articles}
+                for entity_type, name, articles in cooccurring]
+
+    def get_ttr(self, params):
+        vocabulary, words, ttr = self._get_index('sketches').estimate(
+            _get_list(params, 'years', int), _get_list(params, 'provinces'), _get_list(params, 'seasons'))
+        return {'vocabulary': vocabulary, 'words': words, 'ttr': ttr}
+
+    def get_topics(self, params):
+        matrix, columns, rows = self._get_index('dtm')
+        topics = _get_required(params, 'topics').split(',')
+        func = params.get('func', 'all')
+        if func not in ('all', 'any'):
+            raise QueryError(400, 'func must be all or any')
+        if func == 'all' and any(topic not in columns for topic in topics):
+            matches = np.zeros(0, dtype=np.int64)
+        else:
+            present = [columns[topic] for topic in topics if topic in columns]
+            topics_per_row = (matrix[:, present] > 0).sum(axis=1).A.ravel()
+            matches = np.nonzero(topics_per_row == len(present) if func == 'all' else topics_per_row > 0)[0]
+        articles = [dict(zip(('url', 'province', 'date', 'part'), rows[row])) for row in matches]
+        return {'count': len(articles), 'per_province': Counter(article['province'] for article in articles),
+                'articles': articles[:int(params.get('limit', TOPICS_LIMIT))]}
+
+    def get_collocates(self, params):
+        collocates = self._get_index('collocations').get_collocates(
+            _get_required(params, 'word'), _get_required(params, 'slice'), params.get('measure', 'pmi'),
+            int(params.get('top', 20)), int(params.get('min_count', 5)))
+        return [{'collocate': collocate, 'score': score, 'count': count} for collocate, score, count in collocates]
+
+    def get_concordance(self, params):
+        concordance = self._get_index('concordance')
+        query, text = _get_required(params, 'q'), params.get('text', 'lemmatized_text')
+        lines = concordance.get_concordance(query, text, int(params.get('window', 10)), int(params.get('limit', 20)),
+                                            int(params.get('offset', 0)), _get_bool(params, 'sample'))
+        return {'count': concordance.count(query, text), 'lines': [line._asdict() for line in lines]}
+
+    def _answer(self, path, params):
+        """Runs the handler of the endpoint and returns its result as JSON bytes"""
+        if path == '/stats':
+            return json.dumps({'indexes': list(self.indexes), 'cache': self.cache.get_stats()}).encode('utf8')
+        if path not in self.handlers:
+            raise QueryError(404, f'unknown endpoint {path}')
+        try:
+            result = self.handlers[path](params)
+        except (KeyError, ValueError) as e:
+            raise QueryError(400, str(e))
+        return json.dumps(result, ensure_ascii=False, default=_to_json).encode('utf8')
+
+    async def query(self, path, params):
+        """Returns the (cached) JSON bytes of the query, computing it in the thread pool if needed"""
+        key = (path, tuple(sorted(params.items())))
+        body = self.cache.get(key)
+        if body is not None:
+            return body
+        if key not in self._pending:
+            loop = asyncio.get_running_loop()
+            self._pending[key] = loop.run_in_executor(self.executor, self._answer, path, params)
+        try:
+            body = await asyncio.shield(self._pending[key])
+        finally:
+            self._pending.pop(key, None)
+        if path != '/stats':
+            self.cache.put(key, body)
+        return body
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode('latin1').split()
+            while (await reader.readline()).strip():
+                pass
+            if len(request_line) < 2:
+                return
+            if request_line[0] != 'GET':
+                status, body = 405, json.dumps({'error': 'only GET is supported'}).encode('utf8')
+            else:
+                url = urllib.parse.urlsplit(request_line[1])
+                params = dict(urllib.parse.parse_qsl(url.query))
+                try:
+                    status, body = 200, await self.query(url.path.rstrip('/') or '/', params)
+                except QueryError as e:
+                    status, body = e.status, json.dumps({'error': str(e)}, ensure_ascii=False).encode('utf8')
+                except Exception as e:
+                    # Any other error is a bug of the query: it is logged and the client still gets an answer
+                    print(f'Error answering {request_line[1]}:', file=sys.stderr)
+                    traceback.print_exc()
+                    status, body = 500, json.dumps({'error': f'{type(e).__name__}: {e}'},
+                                                   ensure_ascii=False).encode('utf8')
+            writer.write(f'HTTP/1.1 {status} {HTTP_REASONS[status]}\r\nContent-Type: application/json; charset=utf-8'
+                         f'\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode('latin1') + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host=HOST, port=PORT):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f'Listening on http://{host}:{port}/ with {", ".join(self.indexes) or "no indexes"}')
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    usage = f'usage: {sys.argv[0]} [-H <host> -p <port> -c <cache_size> -w <workers>]'
+    [host, port, cache_size, workers] = [HOST, PORT, CACHE_SIZE, WORKERS]
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], 'hH:p:c:w:', ['help', 'host=', 'port=', 'cache-size=', 'workers='])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(usage)
+            sys.exit()
+        elif opt in ('-H', '--host'):
+            host = arg
+        elif opt in ('-p', '--port'):
+            port = int(arg)
+        elif opt in ('-c', '--cache-size'):
+            cache_size = parse_memory_limit(arg)
+        elif opt in ('-w', '--workers'):
+            workers = int(arg)
+    asyncio.run(QueryServer(cache_size=cache_size, workers=workers).serve(host, port))
@@ -0,0 +1,220 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Approximate statistics from a stratified random sample of the corpus, for exploratory runs that don't need to read
+every article (the exact functions of `news_stats.py` are still the ones for the final numbers).
+
+The strata are province x year. The articles of every stratum are shuffled with a permutation seeded by the seed and
+the stratum, so samples are reproducible and a bigger sample always contains the smaller ones. The size of the sample
+can be given:
+
+* As a target amount of articles, allocated proportionally to the size of every stratum.
+* As an error bound (half-width of the 95% confidence interval) of every reported mean: a pilot sample estimates the
+  deviation of every stratum and Neyman allocation gives the amount of articles needed (repeating it with the
+  deviations of the articles read so far until it doesn't change).
+
+The means are estimated with the stratified estimator, and their confidence intervals take into account the finite
+population correction of every stratum. For shares of articles (0/1 measures), the variance of a stratum is never taken
+below the one of its Laplace-smoothed share, so a rare topic that doesn't appear in the pilot still gets articles
+allocated and a confidence interval that isn't zero-width.
+"""
+import math
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+from accumulators import Z_95, MomentsAccumulator
+from corpus import Corpus
+from news_stats import ARTICLE_PARTS
+
+SEED = 2018
+SAMPLE_SIZE = 10_000
+PILOT_SIZE = 30
+# At least two articles per stratum (if it has them) so its variance can be estimated
+MIN_STRATUM_SIZE = 2
+ALLOCATION_ROUNDS = 5
+GROUP_BY = ['year', 'province', 'total']
+
+Estimate = namedtuple('Estimate', ['mean', 'ci_low', 'ci_high', 'sample_size', 'population'])
+# `key` identifies the measure (the values read are cached by it in the sampler), `function` computes it for an article
+# and `proportion` tells whether it is a 0/1 measure
+Measure = namedtuple('Measure', ['key', 'function', 'proportion'])
+
+
+def get_ttr(article, text='lemmatized_text'):
+    """Same TTR of an article as `get_ttrs_from_articles_per_year`"""
+    words = [word for part in ARTICLE_PARTS for word in article.get_field(part, text).split(' ')]
+    return len(set(words)) / len(words)
+
+
+def get_anglicisms_ratio(article, anglicisms, text='lemmatized_text'):
+    """Same anglicisms usage of an article as `get_anglicisms_from_articles_per_year`"""
+    words = [word for part in ARTICLE_PARTS for word in article.get_field(part, text).split(' ')]
+    return sum(word in anglicisms for word in words) / len(words)
+
+
+def has_topics(article, topics, func=all, text='lemmatized_text'):
+    """1 if any part of the article has all (or any, depending on `func`) of the topics, like `get_news_from_topics`"""
+    return float(any(func(topic in article.get_field(part, text) for topic in topics) for part in ARTICLE_PARTS))
+
+
+class StratifiedSampler:
+    """Province x year strata of the corpus, each one with its own seeded permutation of articles"""
+
+    def __init__(self, corpus=None, seed=SEED):
+        self.corpus = corpus or Corpus()
+        self.seed = seed
+        self.strata = {}
+        for label, selection in self.corpus.group_by('province', 'year').items():
+            province, year = label.rsplit('-', 1)
+            # Sorted by file name first, so the permutation doesn't depend on the order of the directory listings
+            indices = sorted(selection.indices, key=lambda index: self.corpus.filenames[index])
+            rng = np.random.default_rng([seed, zlib.crc32(label.encode('utf8'))])
+            self.strata[(province, int(year))] = rng.permutation(np.array(indices, dtype=np.int64))
+        self._values = {}
+
+    def get_domains(self, group_by='year'):
+        """Returns a {group: [strata]} dict. Every group (year, province or the whole corpus) is a union of strata"""
+        if group_by not in GROUP_BY:
+            raise ValueError(f'unknown grouping {group_by}, it must be one of {GROUP_BY}')
+        domains = {}
+        for stratum in sorted(self.strata):
+            group = {'year': stratum[1], 'province': stratum[0], 'total': 'total'}[group_by]
+            domains.setdefault(group, []).append(stratum)
+        return domains
+
+    def _get_moments(self, measure, stratum, size):
+        """Moments of the measure over the first `size` articles of the permutation of the stratum"""
+        values = self._values.setdefault((measure.key, stratum), [])
+        for index in self.strata[stratum][len(values):size]:
+            values.append(measure.function(self.corpus[int(index)]))
+        moments = MomentsAccumulator()
+        for value in values[:size]:
+            moments.update(value)
+        return moments
+
+    def _get_variance(self, measure, stratum, size):
+        """Sample variance of the measure in the stratum. For proportions, at least the one of the Laplace-smoothed
+        share (successes + 1) / (size + 2)"""
+        moments = self._get_moments(measure, stratum, size)
+        if not measure.proportion:
+            return moments.variance
+        smoothed = (moments.mean * moments.count + 1) / (moments.count + 2)
+        return max(moments.variance, smoothed * (1 - smoothed))
+
+    def get_sample_sizes(self, sample_size=None, error=None, measure=None, group_by='year', pilot_size=PILOT_SIZE,
+                         z=Z_95):
+        """Returns a {stratum: articles} dict, either allocating `sample_size` articles proportionally or the ones
+        needed for a confidence interval of half-width `error` for the mean of the measure (a `Measure`) in every
+        group"""
+        populations = {stratum: len(indices) for stratum, indices in self.strata.items()}
+        if error is None:
+            total = sum(populations.values())
+            sample_size = SAMPLE_SIZE if sample_size is None else sample_size
+            return {stratum: min(population, max(MIN_STRATUM_SIZE, round(sample_size * population / total)))
+                    for stratum, population in populations.items()}
+
+        sizes = {}
+        for strata in self.get_domains(group_by).values():
+            # The deviations are estimated again with the articles read so far until the allocation is stable
+            domain_sizes = {stratum: min(pilot_size, populations[stratum]) for stratum in strata}
+            for _ in range(ALLOCATION_ROUNDS):
+                allocation = self._allocate(measure, domain_sizes, populations, error, z)
+                if allocation == domain_sizes:
+                    break
+                domain_sizes = allocation
+            sizes.update(domain_sizes)
+        return sizes
+
+    def _allocate(self, measure, sizes, populations, error, z):
+        """Neyman allocation of the articles of a domain, n = (sum W_h S_h)^2 / ((e / z)^2 + sum W_h S_h^2 / N),
+        never reducing the given sizes (those articles are already read)"""
+        deviations = {stratum: math.sqrt(self._get_variance(measure, stratum, size))
+                      for stratum, size in sizes.items()}
+        population = sum(populations[stratum] for stratum in sizes)
+        weighted_deviations = sum(populations[stratum] * deviations[stratum] for stratum in sizes)
+        needed = (weighted_deviations / population) ** 2 / (
+            (error / z) ** 2 + sum(populations[stratum] * deviations[stratum] ** 2 for stratum in sizes) /
+            population ** 2)
+        allocation = {}
+        for stratum, size in sizes.items():
+            share = populations[stratum] * deviations[stratum] / weighted_deviations if weighted_deviations else 0
+            allocation[stratum] = min(populations[stratum], max(size, math.ceil(needed * share)))
+        return allocation
+
+    def estimate(self, measure, sample_sizes, group_by='year', z=Z_95):
+        """Returns a {group: Estimate} dict with the stratified estimate of the mean of the measure in every group"""
+        estimates = {}
+        for group, strata in self.get_domains(group_by).items():
+            population = sum(len(self.strata[stratum]) for stratum in strata)
+            mean, variance, sample_size = 0.0, 0.0, 0
+            for stratum in strata:
+                size = sample_sizes.get(stratum, 0)
+                if not size:
+                    continue
+                moments = self._get_moments(measure, stratum, size)
+                weight = len(self.strata[stratum]) / population
+                mean += weight * moments.mean
+                variance += weight ** 2 * (1 - size / len(self.strata[stratum])) * \
+                    self._get_variance(measure, stratum, size) / size
+                sample_size += size
+            margin = z * math.sqrt(variance)
+            estimates[group] = Estimate(mean, mean - margin, mean + margin, sample_size, population)
+        return estimates
+
+    def get_estimates(self, measure, group_by='year', sample_size=None, error=None, pilot_size=PILOT_SIZE):
+        sample_sizes = self.get_sample_sizes(sample_size, error, measure, group_by, pilot_size)
+        return self.estimate(measure, sample_sizes, group_by)
+
+
+def _write_estimates(csv_name, estimates):
+    with open(csv_name, 'w') as csv_out:
+        print('group;mean;ci_low;ci_high;sample_size;population', file=csv_out)
+        for group, estimate in estimates.items():
+            print(f'{group};{estimate.mean};{estimate.ci_low};{estimate.ci_high};{estimate.sample_size};'
+                  f'{estimate.population}', file=csv_out)
+
+
+def get_ttrs_sampled(text='lemmatized_text', group_by='year', sample_size=None, error=None, seed=SEED,
+                     csv_suffix='', sampler=None):
+    """Generates a CSV with the estimated mean TTR of the articles per year, province or in total"""
+    sampler = sampler or StratifiedSampler(seed=seed)
+    estimates = sampler.get_estimates(Measure(('ttr', text), lambda article: get_ttr(article, text), False), group_by,
+                                      sample_size, error)
+    _write_estimates(f'ttrs_per_{group_by}_sampled{csv_suffix}.csv', estimates)
+    return estimates
+
+
+def get_anglicisms_sampled(text='lemmatized_text', group_by='year', sample_size=None, error=None, seed=SEED,
+                           csv_suffix='', sampler=None):
+    """Generates a CSV with the estimated mean anglicisms usage of the articles per year, province or in total"""
+    with open('anglicisms.txt') as anglicisms_file:
+        anglicisms = {line.strip() for line in anglicisms_file}
+    sampler = sampler or StratifiedSampler(seed=seed)
+    measure = Measure(('anglicisms', text, frozenset(anglicisms)),
+                      lambda article: get_anglicisms_ratio(article, anglicisms, text), False)
+    estimates = sampler.get_estimates(measure, group_by, sample_size, error)
+    _write_estimates(f'anglicisms_per_{group_by}_sampled{csv_suffix}.csv', estimates)
+    return estimates
+
+
+def get_topics_share_sampled(topics, func=all, text='lemmatized_text', group_by='year', sample_size=None, error=None,
+                             seed=SEED, csv_suffix='', sampler=None):
+    """Generates a CSV with the estimated share of articles with all (or any) of the topics per year, province or in
+    total"""
+    sampler = sampler or StratifiedSampler(seed=seed)
+    measure = Measure(('topics', frozenset(topics), func.__name__, text),
+                      lambda article: has_topics(article, topics, func, text), True)
+    estimates = sampler.get_estimates(measure, group_by, sample_size, error)
+    _write_estimates(f'topics_share_per_{group_by}_sampled{csv_suffix}.csv', estimates)
+    return estimates
+
+
+if __name__ == '__main__':
+    # Example: the sampler (and the articles it has read) is shared between the estimates
+    stratified_sampler = StratifiedSampler()
+    get_ttrs_sampled(group_by='province', error=0.005, sampler=stratified_sampler)
+    get_anglicisms_sampled(group_by='year', sample_size=20_000, sampler=stratified_sampler)
+    get_topics_share_sampled({'corrupción', 'trama'}, func=any, text='lemmatized_text_reduced', group_by='year',
+                             error=0.01, csv_suffix='_corrupción', sampler=stratified_sampler)
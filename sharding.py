@@ -0,0 +1,339 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Runs the scans of `news_stats.py` split among several hosts. Every host reads a shard of a shared (or replicated)
+`dump-processed` (with `news_stats.scan_articles(..., shard=...)`) and writes a partial result file with mergeable
+statistics, counted with the same per-article functions as `news_stats.py` (counts, HyperLogLog sketches and TTR
+accumulators) per year and per province; the `merge` command combines the partial files into the final CSVs: the ones
+of `get_news_count`, `get_words_count_per_year`, `get_words_count_per_category`, `get_words_count_total`,
+`get_necs_count_per_year`, `get_necs_count_per_category`, `get_ttrs_from_articles_per_year` and
+`get_ttrs_from_articles_per_province`, and vocabulary_per_year.csv of `hyperloglog.py`.
+
+A shard is a subset of provinces and/or a date range, optionally split again by the hash of the path of every article
+modulo N (`-n 2/4` is the third of four shards), so the shards of a run must not overlap:
+
+    python sharding.py run -n 0/2 -o partial_0.json.gz     # On host A
+    python sharding.py run -n 1/2 -o partial_1.json.gz     # On host B
+    python sharding.py merge -d merged partial_*.json.gz
+    python sharding.py compare merged news_stats_output    # Checks the result against the CSVs of news_stats.py
+
+The merged CSVs have the same lines as the ones of `news_stats.py` (sorted), except for the rounding of the means and
+the percentiles, which are approximate in both cases. The words and NECs of the whole shard are kept in memory.
+"""
+import datetime
+import getopt
+import gzip
+import json
+import math
+import os
+import sys
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from accumulators import StatsAccumulator, format_summary
+from hyperloglog import PRECISION, HyperLogLog
+from news_stats import (DATES_CFG_FORMAT, DATES_SQL_FORMAT, DUMP_DIR, get_article_necs, get_article_ttr,
+                        get_article_words, get_day_dirs, get_dates_from_cfg, read_categories_from_file, scan_articles)
+
+TTR_TEXTS = {'': 'lemmatized_text', '_reduced': 'lemmatized_text_reduced'}
+# Counts of the partial results -> CSV of every year or province, named as the ones of `news_stats.py`
+COUNTS_CSVS = {'words_per_year': 'words_count_{group}.csv', 'words_per_category': 'words_count_{group}.csv',
+               'words_per_category_reduced': 'words_count_{group}_reduced.csv',
+               'necs_per_year': 'necs_count_{group}.csv', 'necs_per_category': 'necs_count_{group}.csv'}
+TTRS_CSVS = {f'ttrs_per_{grouping}{suffix}': f'ttrs_per_{grouping}{suffix}.csv'
+             for grouping in ('year', 'category') for suffix in TTR_TEXTS}
+PARTIAL_FILE = 'partial.json.gz'
+RELATIVE_TOLERANCE = 1e-9
+# The percentiles of the TTR summaries (KLL sketches) depend on the order of the values, so they are compared loosely
+APPROXIMATE_COLUMNS = {filename: range(6, 11) for filename in TTRS_CSVS.values()}
+APPROXIMATE_TOLERANCE = 0.05
+
+
+class ShardSpec:
+    """Provinces (None for all), date range (None for the one of config.cfg) and hash shard `index` of `count`"""
+
+    def __init__(self, provinces=None, start_date=None, end_date=None, index=0, count=1):
+        if not 0 <= index < count:
+            raise ValueError(f'the shard index must be between 0 and {count - 1}')
+        start_cfg_date, end_cfg_date = get_dates_from_cfg()
+        self.provinces = provinces or read_categories_from_file()
+        self.start_date = start_date or start_cfg_date
+        self.end_date = end_date or end_cfg_date
+        self.index = index
+        self.count = count
+
+    def __repr__(self):
+        return f'ShardSpec({",".join(self.provinces)}, {self.start_date.strftime(DATES_CFG_FORMAT)}-' \
+               f'{self.end_date.strftime(DATES_CFG_FORMAT)}, {self.index}/{self.count})'
+
+    def contains(self, relative_path):
+        """Whether an article (by its path relative to the dump, the same on every host) belongs to the hash shard"""
+        return self.count == 1 or zlib.crc32(relative_path.encode('utf8')) % self.count == self.index
+
+    def to_dict(self):
+        return {'provinces': self.provinces, 'start_date': self.start_date.strftime(DATES_SQL_FORMAT),
+                'end_date': self.end_date.strftime(DATES_SQL_FORMAT), 'index': self.index, 'count': self.count}
+
+
+class PartialStats:
+    """Mergeable statistics of a shard, counted with the same per-article functions as `news_stats.py`: news per
+    (province, day), words and NECs per year and per province (also the reduced words per province), vocabulary
+    sketches and words per year and TTR accumulators per year and per province"""
+
+    def __init__(self, precision=PRECISION):
+        self.precision = precision
+        self.news_counts = Counter()
+        self.counts = {name: {} for name in COUNTS_CSVS}
+        self.sketches = {}
+        self.tokens = Counter()
+        self.ttrs = {name: {} for name in TTRS_CSVS}
+        self.specs = []
+
+    def add_article(self, category, year, article):
+        words, necs = get_article_words(article), get_article_necs(article)
+        for name, group, items in (('words_per_year', year, words), ('words_per_category', category, words),
+                                   ('words_per_category_reduced', category,
+                                    get_article_words(article, 'lemmatized_text_reduced')),
+                                   ('necs_per_year', year, necs), ('necs_per_category', category, necs)):
+            self.counts[name].setdefault(group, Counter()).update(items)
+        self.sketches.setdefault(year, HyperLogLog(self.precision)).update(words)
+        self.tokens[year] += len(words)
+        for suffix, text in TTR_TEXTS.items():
+            ttr = get_article_ttr(article, text)
+            self.ttrs[f'ttrs_per_year{suffix}'].setdefault(year, StatsAccumulator()).update(ttr)
+            self.ttrs[f'ttrs_per_category{suffix}'].setdefault(category, StatsAccumulator()).update(ttr)
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError('only partial results with the same sketch precision can be merged')
+        self.news_counts.update(other.news_counts)
+        for name, counts in other.counts.items():
+            for group, group_counts in counts.items():
+                self.counts[name].setdefault(group, Counter()).update(group_counts)
+        for year, sketch in other.sketches.items():
+            self.sketches.setdefault(year, HyperLogLog(self.precision)).merge(sketch)
+        self.tokens.update(other.tokens)
+        for name, ttrs in other.ttrs.items():
+            for group, accumulator in ttrs.items():
+                self.ttrs[name].setdefault(group, StatsAccumulator()).merge(accumulator)
+        self.specs += other.specs
+        return self
+
+    def save(self, path):
+        partial = {'precision': self.precision, 'specs': self.specs,
+                   'news_counts': [[province, date, count] for (province, date), count in self.news_counts.items()],
+                   'counts': self.counts,
+                   'sketches': {year: sketch.registers.tolist() for year, sketch in self.sketches.items()},
+                   'tokens': self.tokens,
+                   'ttrs': {name: {group: _dump_accumulator(accumulator) for group, accumulator in ttrs.items()}
+                            for name, ttrs in self.ttrs.items()}}
+        with gzip.open(path, 'wt', encoding='utf8') as f:
+            json.dump(partial, f, ensure_ascii=False)
+
+    @staticmethod
+    def load(path):
+        with gzip.open(path, 'rt', encoding='utf8') as f:
+            partial = json.load(f)
+        stats = PartialStats(partial['precision'])
+        stats.specs = partial['specs']
+        stats.news_counts = Counter({(province, date): count for province, date, count in partial['news_counts']})
+        # JSON keys are strings, the years are put back as integers
+        stats.counts = {name: {_load_group(name, group): Counter(counts) for group, counts in groups.items()}
+                        for name, groups in partial['counts'].items()}
+        stats.sketches = {int(year): HyperLogLog(stats.precision, np.array(registers, dtype=np.uint8))
+                          for year, registers in partial['sketches'].items()}
+        stats.tokens = Counter({int(year): tokens for year, tokens in partial['tokens'].items()})
+        stats.ttrs = {name: {_load_group(name, group): _load_accumulator(state) for group, state in ttrs.items()}
+                      for name, ttrs in partial['ttrs'].items()}
+        return stats
+
+
+def _load_group(name, group):
+    return int(group) if '_per_year' in name else group
+
+
+def _dump_accumulator(accumulator):
+    moments, quantiles = accumulator.moments, accumulator.quantiles
+    return {'count': moments.count, 'mean': moments.mean, 'm2': moments.m2,
+            'minimum': moments.minimum if moments.count else None,
+            'maximum': moments.maximum if moments.count else None,
+            'k': quantiles.k, 'compactors': quantiles.compactors}
+
+
+def _load_accumulator(state):
+    accumulator = StatsAccumulator(state['k'])
+    moments, quantiles = accumulator.moments, accumulator.quantiles
+    moments.count, moments.mean, moments.m2 = state['count'], state['mean'], state['m2']
+    if state['count']:
+        moments.minimum, moments.maximum = state['minimum'], state['maximum']
+    while len(quantiles.compactors) < len(state['compactors']):
+        quantiles._grow()
+    quantiles.compactors = state['compactors']
+    quantiles.size = sum(len(items) for items in quantiles.compactors)
+    return accumulator
+
+
+def run_shard(shard_spec, dump_dir=DUMP_DIR, precision=PRECISION):
+    """Reads the articles of the shard (through `news_stats.scan_articles`) and returns their partial statistics"""
+    stats = PartialStats(precision)
+    stats.specs.append(shard_spec.to_dict())
+    # Every existing day directory is in news_count.csv, even with no articles in this shard, as `get_news_count` does
+    for category, date, day_dir in get_day_dirs(shard_spec.start_date, shard_spec.end_date, shard_spec.provinces,
+                                                dump_dir):
+        if os.path.isdir(day_dir):
+            stats.news_counts[category, date.strftime(DATES_SQL_FORMAT)] += 0
+    for category, date, article in scan_articles('news', shard=shard_spec, dump_dir=dump_dir):
+        stats.news_counts[category, date.strftime(DATES_SQL_FORMAT)] += 1
+        stats.add_article(category, date.year, article)
+    return stats
+
+
+def check_shards(specs):
+    """Raises ValueError if two partial results come from the same shard, and warns about missing hash shards"""
+    seen = set()
+    for spec in specs:
+        key = json.dumps(spec, sort_keys=True)
+        if key in seen:
+            raise ValueError(f'the shard {spec} has been given twice')
+        seen.add(key)
+    groups = {}
+    for spec in specs:
+        key = json.dumps({name: value for name, value in spec.items() if name != 'index'}, sort_keys=True)
+        groups.setdefault(key, set()).add(spec['index'])
+    for key, indices in groups.items():
+        spec = json.loads(key)
+        missing = sorted(set(range(spec['count'])) - indices)
+        if missing:
+            print(f'Warning: hash shards {missing} of {spec["count"]} are missing for {spec["provinces"]} between '
+                  f'{spec["start_date"]} and {spec["end_date"]}')
+
+
+def merge_partials(paths):
+    stats = None
+    for path in paths:
+        print(f'Merging {path}...')
+        partial = PartialStats.load(path)
+        stats = partial if stats is None else stats.merge(partial)
+    check_shards(stats.specs)
+    return stats
+
+
+def write_csvs(stats, output_dir='.'):
+    """Writes the same CSVs as `news_stats.py` (and `hyperloglog.py` for the vocabulary), sorted"""
+    os.makedirs(output_dir, exist_ok=True)
+    with open(f'{output_dir}/news_count.csv', 'w') as csv_out:
+        print('category;date;news_count', file=csv_out)
+        for (province, date), count in sorted(stats.news_counts.items()):
+            print(f'{province};{date};{count}', file=csv_out)
+    for name, counts in stats.counts.items():
+        for group, group_counts in sorted(counts.items()):
+            with open(f'{output_dir}/{COUNTS_CSVS[name].format(group=group)}', 'w') as csv_out:
+                for key, count in sorted(group_counts.items()):
+                    print(f'{group};{key};{count}', file=csv_out)
+    total = Counter()
+    for year_counts in stats.counts['words_per_year'].values():
+        total.update(year_counts)
+    with open(f'{output_dir}/words_count_total.csv', 'w') as csv_out:
+        for word, count in sorted(total.items()):
+            print(f'total;{word};{count}', file=csv_out)
+    for name, ttrs in stats.ttrs.items():
+        with open(f'{output_dir}/{TTRS_CSVS[name]}', 'w') as csv_out:
+            for group, accumulator in sorted(ttrs.items()):
+                print(f'{group};{format_summary(accumulator.summary())}', file=csv_out)
+    with open(f'{output_dir}/vocabulary_per_year.csv', 'w') as csv_out:
+        for year, sketch in sorted(stats.sketches.items()):
+            vocabulary, words = sketch.estimate(), stats.tokens[year]
+            print(f'{year};{round(vocabulary)};{words};{vocabulary / words}', file=csv_out)
+
+
+def _equal_values(value, other_value, rel_tol):
+    try:
+        number, other_number = float(value), float(other_value)
+    except ValueError:
+        return value == other_value
+    return number == other_number or math.isclose(number, other_number, rel_tol=rel_tol) or (
+        math.isnan(number) and math.isnan(other_number))
+
+
+def compare_outputs(dir_a, dir_b, rel_tol=RELATIVE_TOLERANCE, approximate_tol=APPROXIMATE_TOLERANCE):
+    """Returns the differences between the CSVs that both directories have, e.g. the merged ones and the ones written
+    by `news_stats.py` (the lines are compared sorted, as `news_stats.py` doesn't sort them, and the numbers with a
+    relative tolerance, bigger for the approximate columns). The CSVs of only one directory are listed, not compared"""
+    differences = []
+    filenames_a = {filename for filename in os.listdir(dir_a) if filename.endswith('.csv')}
+    filenames_b = {filename for filename in os.listdir(dir_b) if filename.endswith('.csv')}
+    for filename in sorted(filenames_a ^ filenames_b):
+        print(f'{filename} only in {dir_a if filename in filenames_a else dir_b}, not compared')
+    for filename in sorted(filenames_a & filenames_b):
+        with open(f'{dir_a}/{filename}') as f, open(f'{dir_b}/{filename}') as other_f:
+            lines, other_lines = sorted(f.read().splitlines()), sorted(other_f.read().splitlines())
+        if len(lines) != len(other_lines):
+            differences.append(f'{filename}: {len(lines)} lines in {dir_a}, {len(other_lines)} in {dir_b}')
+            continue
+        approximate = APPROXIMATE_COLUMNS.get(filename, ())
+        for number, (line, other_line) in enumerate(zip(lines, other_lines), 1):
+            values, other_values = line.split(';'), other_line.split(';')
+            if len(values) != len(other_values) or not all(
+                    _equal_values(value, other_value, approximate_tol if column in approximate else rel_tol)
+                    for column, (value, other_value) in enumerate(zip(values, other_values))):
+                differences.append(f'{filename}:{number}: {line} != {other_line}')
+    return differences
+
+
+if __name__ == '__main__':
+    usage = f'usage: {sys.argv[0]} run [-c <provinces> -s <start_date> -e <end_date> -n <index>/<count> ' \
+            f'-D <dump_dir> -o <partial_file>]\n' \
+            f'       {sys.argv[0]} merge [-d <output_dir>] <partial_file>...\n' \
+            f'       {sys.argv[0]} compare <output_dir> <other_output_dir>'
+    if len(sys.argv) < 2 or sys.argv[1] not in ('run', 'merge', 'compare'):
+        print(usage)
+        sys.exit(2)
+    command = sys.argv[1]
+    [provinces, start_date, end_date, index, count, dump_dir, partial_file, output_dir] = \
+        [None, None, None, 0, 1, DUMP_DIR, PARTIAL_FILE, '.']
+    try:
+        opts, args = getopt.getopt(sys.argv[2:], 'hc:s:e:n:D:o:d:',
+                                   ['help', 'provinces=', 'start-date=', 'end-date=', 'shard=', 'dump-dir=',
+                                    'output=', 'output-dir='])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(usage)
+            sys.exit()
+        elif opt in ('-c', '--provinces'):
+            provinces = arg.split(',')
+        elif opt in ('-s', '--start-date'):
+            start_date = datetime.datetime.strptime(arg, DATES_CFG_FORMAT)
+        elif opt in ('-e', '--end-date'):
+            end_date = datetime.datetime.strptime(arg, DATES_CFG_FORMAT)
+        elif opt in ('-n', '--shard'):
+            index, count = (int(value) for value in arg.split('/'))
+        elif opt in ('-D', '--dump-dir'):
+            dump_dir = arg
+        elif opt in ('-o', '--output'):
+            partial_file = arg
+        elif opt in ('-d', '--output-dir'):
+            output_dir = arg
+
+    if command == 'run':
+        spec = ShardSpec(provinces, start_date, end_date, index, count)
+        print(f'Running {spec}')
+        run_shard(spec, dump_dir).save(partial_file)
+    elif command == 'merge':
+        if not args:
+            print(usage)
+            sys.exit(2)
+        write_csvs(merge_partials(args), output_dir)
+    else:
+        if len(args) != 2:
+            print(usage)
+            sys.exit(2)
+        found_differences = compare_outputs(*args)
+        for difference in found_differences[:20]:
+            print(difference)
+        print(f'{len(found_differences)} differences')
+        sys.exit(1 if found_differences else 0)
@@ -0,0 +1,75 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Helpers to store row-indexed sparse matrices (CSR layout) and vocabularies on disk as plain NumPy files, so that the
+indexes built from the corpus can be memory-mapped afterwards and sliced row by row without loading them entirely.
+"""
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+
+INDPTR_SUFFIX = 'indptr'
+INDICES_SUFFIX = 'indices'
+DATA_SUFFIX = 'data'
+META_FILE = 'meta.json'
+
+SparseRows = namedtuple('SparseRows', ['indptr', 'indices', 'data'])
+
+
+def save_rows(directory, name, rows, columns, values, n_rows):
+    """Saves the (rows, columns, values) triplets as a CSR matrix, sorting them by row. Duplicated (row, column) pairs
+    are kept as they are, so the caller is expected to have them already aggregated"""
+    os.makedirs(directory, exist_ok=True)
+    rows = np.asarray(rows, dtype=np.int64)
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    np.save(f'{directory}/{name}_{INDPTR_SUFFIX}.npy', indptr)
+    np.save(f'{directory}/{name}_{INDICES_SUFFIX}.npy', np.asarray(columns)[order])
+    np.save(f'{directory}/{name}_{DATA_SUFFIX}.npy', np.asarray(values)[order])
+
+
+def save_csr(directory, name, matrix):
+    """Saves a scipy.sparse CSR matrix with the same layout as `save_rows`"""
+    os.makedirs(directory, exist_ok=True)
+    np.save(f'{directory}/{name}_{INDPTR_SUFFIX}.npy', matrix.indptr.astype(np.int64))
+    np.save(f'{directory}/{name}_{INDICES_SUFFIX}.npy', matrix.indices)
+    np.save(f'{directory}/{name}_{DATA_SUFFIX}.npy', matrix.data)
+
+
+def load_rows(directory, name, mmap_mode='r'):
+    """Loads a CSR matrix saved with `save_rows`, memory-mapped by default"""
+    return SparseRows(*(np.load(f'{directory}/{name}_{suffix}.npy', mmap_mode=mmap_mode)
+                        for suffix in (INDPTR_SUFFIX, INDICES_SUFFIX, DATA_SUFFIX)))
+
+
+def get_row(sparse_rows, row):
+    """Returns the (columns, values) arrays of a single row (zero-copy if the matrix is memory-mapped)"""
+    start, end = sparse_rows.indptr[row], sparse_rows.indptr[row + 1]
+    return sparse_rows.indices[start:end], sparse_rows.data[start:end]
+
+
+def save_vocabulary(path, terms):
+    """Saves the terms one per line, so the line number is the term id. Every term is written as a JSON string, as raw
+    terms may contain line breaks"""
+    with open(path, 'w') as f:
+        for term in terms:
+            print(json.dumps(term, ensure_ascii=False), file=f)
+
+
+def load_vocabulary(path):
+    """Returns a {term: id} dict from a file written by `save_vocabulary`"""
+    with open(path) as f:
+        return {json.loads(line): term_id for term_id, line in enumerate(f)}
+
+
+def save_meta(directory, **meta):
+    with open(f'{directory}/{META_FILE}', 'w') as f:
+        json.dump(meta, f, indent=4, ensure_ascii=False)
+
+
+def load_meta(directory):
+    with open(f'{directory}/{META_FILE}') as f:
+        return json.load(f)
@@ -0,0 +1,137 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Exact words counter for vocabularies that don't fit in memory (e.g. the raw_text, full of numbers, typos and URLs).
+Words are counted in a dict until its estimated size reaches the memory limit; then it is spilled to disk, splitting
+the words into N partition files by a stable hash. At the end every partition is merged on its own, so it gives the
+same counts as the in-memory dict while only a partition has to fit in memory at a time.
+
+It can be run from the command line to generate the same CSVs as `get_words_count_total` and
+`get_words_count_per_category`:
+
+    python spill_counter.py -t raw_text -m 4G [-p] [-s _raw]
+"""
+import getopt
+import json
+import os
+import shutil
+import sys
+import tempfile
+import zlib
+
+PARTITIONS = 64
+# Rough size of a dict entry plus its int value, apart from the word itself
+DICT_ENTRY_BYTES = 100
+SIZE_UNITS = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+
+def parse_memory_limit(memory_limit):
+    """Parses sizes like '512M' or '4G' into bytes"""
+    memory_limit = memory_limit.strip().upper().rstrip('B')
+    if memory_limit and memory_limit[-1] in SIZE_UNITS:
+        return int(float(memory_limit[:-1]) * SIZE_UNITS[memory_limit[-1]])
+    return int(memory_limit)
+
+
+def write_spill_record(f, *values):
+    """Writes the values as a JSON line, so words with line breaks or tabs (raw text) are kept in a single record"""
+    print(json.dumps(values, ensure_ascii=False), file=f)
+
+
+def read_spill_records(path):
+    """Yields the tuples written with `write_spill_record`"""
+    with open(path, encoding='utf8') as f:
+        for line in f:
+            yield tuple(json.loads(line))
+
+
+class SpillingCounter:
+    """Counts words in memory up to `memory_limit` bytes (never spilling if it is None), and on disk afterwards"""
+
+    def __init__(self, memory_limit=None, partitions=PARTITIONS, spill_dir=None):
+        self.memory_limit = memory_limit
+        self.partitions = partitions
+        self.spill_dir = spill_dir
+        self.counts = {}
+        self.memory = 0
+        self.spills = 0
+        self._partitions_dir = None
+
+    def add(self, word, count=1):
+        if word in self.counts:
+            self.counts[word] += count
+        else:
+            self.counts[word] = count
+            self.memory += sys.getsizeof(word) + DICT_ENTRY_BYTES
+            if self.memory_limit is not None and self.memory >= self.memory_limit:
+                self.spill()
+
+    def update(self, words):
+        for word in words:
+            self.add(word)
+
+    def _get_partition_path(self, partition):
+        return f'{self._partitions_dir}/{partition}.jsonl'
+
+    def spill(self):
+        """Appends the counts in memory to their partition files and empties the dict"""
+        if self._partitions_dir is None:
+            self._partitions_dir = tempfile.mkdtemp(prefix='words_count_', dir=self.spill_dir)
+        partition_files = [open(self._get_partition_path(partition), 'a', encoding='utf8') for partition in range(self.partitions)]
+        try:
+            for word, count in self.counts.items():
+                partition = zlib.crc32(word.encode('utf8')) % self.partitions
+                write_spill_record(partition_files[partition], word, count)
+        finally:
+            for partition_file in partition_files:
+                partition_file.close()
+        self.counts = {}
+        self.memory = 0
+        self.spills += 1
+
+    def items(self):
+        """Yields every (word, count) pair. If the counter was spilled, the partitions are merged one by one and
+        removed from disk"""
+        if self._partitions_dir is None:
+            yield from self.counts.items()
+            return
+        self.spill()
+        try:
+            for partition in range(self.partitions):
+                counts = {}
+                for word, count in read_spill_records(self._get_partition_path(partition)):
+                    counts[word] = counts.get(word, 0) + count
+                yield from counts.items()
+                os.remove(self._get_partition_path(partition))
+        finally:
+            shutil.rmtree(self._partitions_dir, ignore_errors=True)
+            self._partitions_dir = None
+
+
+if __name__ == '__main__':
+    from news_stats import get_words_count_per_category, get_words_count_total
+
+    usage = f'usage: {sys.argv[0]} -m <memory_limit> [-t <text> -s <csv_suffix> -p]'
+    [memory_limit, text, csv_suffix, per_category] = [None, 'lemmatized_text', '', False]
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], 'hm:t:s:p', ['help', 'memory-limit=', 'text=', 'csv_suffix=',
+                                                          'per-category'])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(usage)
+            sys.exit()
+        elif opt in ('-m', '--memory-limit'):
+            memory_limit = parse_memory_limit(arg)
+        elif opt in ('-t', '--text'):
+            text = arg
+        elif opt in ('-s', '--csv_suffix'):
+            csv_suffix = arg
+        elif opt in ('-p', '--per-category'):
+            per_category = True
+    if per_category:
+        get_words_count_per_category(text, csv_suffix, memory_limit=memory_limit)
+    else:
+        get_words_count_total(text, csv_suffix, memory_limit=memory_limit)
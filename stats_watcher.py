@@ -0,0 +1,418 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Keeps the word, NEC and topic counts of the corpus up to date while the spider and FreeLing write into `~/dump`, instead
+of re-running `duplicates_remover.py` and the full scans of `news_stats.py` every day.
+
+Every new or changed file (once it has been quiet for a few seconds) is checked against the articles of the last days
+with the same exact hash + MinHash/LSH of `duplicates_remover.py`, and duplicates are removed. The counts of the rest are
+stored per file in a SQLite database and added to the aggregates (per province and year), so when a file changes or is
+deleted its old counts are subtracted. Raw articles only take part in the deduplication; their counts are added when
+FreeLing rewrites them analyzed.
+
+The changes are received from watchdog (inotify) if it is installed, or by polling the day directories of the last days:
+
+    python stats_watcher.py -t corrupción,trama           # Watches ~/dump until Ctrl+C
+    python stats_watcher.py --catch-up                   # Updates the counts with the dates of config.cfg and exits
+    python stats_watcher.py -x year                      # Writes words_count_2016_watch.csv, necs_count_...
+"""
+import contextlib
+import datetime
+import getopt
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from datasketch import LeanMinHash, MinHashLSH
+
+from duplicates_remover import THRESHOLD, get_body_digest, get_minhash
+from news_stats import (ARTICLE_PARTS, DATES_CFG_FORMAT, DATES_SQL_FORMAT, get_day_dirs, get_dates_from_cfg,
+                        read_categories_from_file)
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler, Observer = object, None
+
+RAW_DUMP_DIR = f'{str(Path.home())}/dump'
+WATCH_DB = 'stats_watcher.db'
+WINDOW_DAYS = 7
+DEBOUNCE_SECONDS = 5
+POLL_INTERVAL = 60
+POLL_DAYS = 2
+NEC_TYPES = ['persons', 'locations', 'organizations', 'others']
+KINDS = ['words', 'necs', 'topics']
+GROUP_BY = ['year', 'province', 'total']
+ADDED, UPDATED, DUPLICATE, RETRACTED = 'added', 'updated', 'duplicate', 'retracted'
+
+
+def _get_body(article):
+    """Raw body of an article, either as written by the spider or already analyzed by FreeLing"""
+    return article['body']['raw_text'] if isinstance(article['body'], dict) else article['body']
+
+
+class _LshWindow:
+    """MinHash LSH of the articles of some days: path -> (day ordinal, digest), and digest -> path for the exact
+    duplicates"""
+
+    def __init__(self):
+        self.lsh = MinHashLSH(threshold=THRESHOLD)
+        self.articles = {}
+        self.digests = {}
+
+    def insert(self, path, day, digest, minhash):
+        self.remove(path)
+        self.articles[path] = (day, digest)
+        self.digests.setdefault(digest, path)
+        self.lsh.insert(path, minhash)
+
+    def remove(self, path):
+        if path in self.articles:
+            _, digest = self.articles.pop(path)
+            if self.digests.get(digest) == path:
+                del self.digests[digest]
+            self.lsh.remove(path)
+
+    def remove_older(self, day):
+        for path in [path for path, (path_day, _) in self.articles.items() if path_day < day]:
+            self.remove(path)
+
+    def find(self, path, day, digest, minhash, window_days):
+        """Path of an article (other than `path`) at most `window_days` days away with the same or a similar body"""
+        candidates = [self.digests[digest]] if digest in self.digests else self.lsh.query(minhash)
+        for candidate in candidates:
+            if candidate != path and abs(self.articles[candidate][0] - day) <= window_days:
+                return candidate
+        return None
+
+
+class _ChangesHandler(FileSystemEventHandler):
+    """Remembers the last time every JSON file was created, modified, moved or deleted"""
+
+    def __init__(self):
+        super().__init__()
+        self.changes = {}
+        self.lock = threading.Lock()
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        with self.lock:
+            for path in (event.src_path, getattr(event, 'dest_path', None)):
+                if path and str(path).endswith('.json'):
+                    self.changes[str(path)] = time.monotonic()
+
+    def pop_quiet(self, debounce):
+        """Returns (and forgets) the files that haven't changed in the last `debounce` seconds"""
+        now = time.monotonic()
+        with self.lock:
+            quiet = sorted(path for path, changed in self.changes.items() if now - changed >= debounce)
+            for path in quiet:
+                del self.changes[path]
+        return quiet
+
+
+class StatsWatcher:
+    """Incremental word, NEC and topic counts of the articles of `dump_dir`, persisted in `db_path`. `topics` is a
+    {name: (topics, func)} dict, counting the articles with all (or any, depending on `func`) of the topics in a part"""
+
+    def __init__(self, db_path=WATCH_DB, dump_dir=RAW_DUMP_DIR, categories=None, topics=None, text='lemmatized_text',
+                 window_days=WINDOW_DAYS):
+        self.dump_dir = dump_dir.rstrip('/')
+        self.categories = categories or read_categories_from_file()
+        self.topics = topics or {}
+        self.text = text
+        self.window_days = window_days
+        self.db = sqlite3.connect(db_path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS files ('
+                        'path TEXT PRIMARY KEY, province TEXT, date TEXT, mtime REAL, analyzed INTEGER, digest BLOB, '
+                        'minhash BLOB)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS files_date ON files (date, province)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS contributions (path TEXT, kind TEXT, key TEXT, count INTEGER)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS contributions_path ON contributions (path)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS aggregates ('
+                        'kind TEXT, province TEXT, year INTEGER, key TEXT, count INTEGER, '
+                        'PRIMARY KEY (kind, province, year, key))')
+        # Articles of the last `window_days` days
+        self.window = _LshWindow()
+        self.newest_day = None
+        # Articles of the database around the days older than the window (see `_find_old_duplicate`)
+        self.old_window = _LshWindow()
+        self.old_days = None
+        self.statuses = Counter()
+        newest, = self.db.execute('SELECT MAX(date) FROM files').fetchone()
+        if newest is not None:
+            newest_day = datetime.datetime.strptime(newest, DATES_SQL_FORMAT).toordinal()
+            self._load_days(self.window, newest_day - self.window_days, newest_day)
+            self.newest_day = newest_day
+
+    def _load_days(self, window, first_day, last_day):
+        """Puts in the window the articles of the database between both days"""
+        first, last = (datetime.date.fromordinal(day).strftime(DATES_SQL_FORMAT) for day in (first_day, last_day))
+        for path, date, digest, minhash in self.db.execute(
+                'SELECT path, date, digest, minhash FROM files WHERE date BETWEEN ? AND ?', (first, last)):
+            window.insert(path, datetime.datetime.strptime(date, DATES_SQL_FORMAT).toordinal(), digest,
+                          LeanMinHash.deserialize(minhash))
+
+    def _remember(self, path, day, digest, minhash):
+        if self.newest_day is None or day > self.newest_day:
+            self.newest_day = day
+            self.window.remove_older(day - self.window_days)
+        if day >= self.newest_day - self.window_days:
+            self.window.insert(path, day, digest, minhash)
+        elif self.old_days is not None and self.old_days[0] <= day <= self.old_days[1]:
+            self.old_window.insert(path, day, digest, minhash)
+
+    def _forget(self, path):
+        self.window.remove(path)
+        self.old_window.remove(path)
+
+    def _find_duplicate(self, path, day, digest, minhash):
+        """Path of an article of the window (other than `path`) with the same or a similar body, if any"""
+        if self.newest_day is not None and day < self.newest_day - self.window_days:
+            return self._find_old_duplicate(path, day, digest, minhash)
+        return self.window.find(path, day, digest, minhash, self.window_days)
+
+    def _find_old_duplicate(self, path, day, digest, minhash):
+        """Same for an article older than the window (e.g. when catching up old dates): it is compared with a second
+        LSH of the articles of the database around its day. The catch-ups go in date order, so that window slides
+        forward and every day is loaded from the database once"""
+        first_day, last_day = day - self.window_days, day + self.window_days
+        if self.old_days is None or not self.old_days[0] <= first_day <= self.old_days[1]:
+            self.old_window = _LshWindow()
+            self._load_days(self.old_window, first_day, last_day)
+        else:
+            self.old_window.remove_older(first_day)
+            if last_day > self.old_days[1]:
+                self._load_days(self.old_window, self.old_days[1] + 1, last_day)
+        self.old_days = (first_day, max(last_day, self.old_days[1]) if self.old_days else last_day)
+        return self.old_window.find(path, day, digest, minhash, self.window_days)
+
+    def _parse_path(self, path):
+        """Returns the (province, date) of a file of a day directory of `dump_dir`, or None for any other file"""
+        parts = os.path.relpath(path, self.dump_dir).split(os.sep)
+        if len(parts) != 5 or parts[0] not in self.categories or not parts[4].endswith('.json'):
+            return None
+        try:
+            return parts[0], datetime.datetime.strptime('/'.join(parts[1:4]), '%Y/%m/%d')
+        except ValueError:
+            return None
+
+    def get_contributions(self, article):
+        """Returns a {(kind, key): count} dict with what an analyzed article adds to the aggregates"""
+        contributions = Counter()
+        for part in ARTICLE_PARTS:
+            for word in article[part][self.text].split(' '):
+                contributions['words', word] += 1
+            for nec_type in NEC_TYPES:
+                for nec in article[part][nec_type]:
+                    contributions['necs', nec] += 1
+        for name, (topics, func) in self.topics.items():
+            if any(func(topic in article[part][self.text] for topic in topics) for part in ARTICLE_PARTS):
+                contributions['topics', name] += 1
+        return contributions
+
+    def _add(self, path, province, year, contributions):
+        self.db.executemany('INSERT INTO contributions (path, kind, key, count) VALUES (?, ?, ?, ?)',
+                            [(path, kind, key, count) for (kind, key), count in contributions.items()])
+        self.db.executemany('INSERT INTO aggregates (kind, province, year, key, count) VALUES (?, ?, ?, ?, ?) '
+                            'ON CONFLICT (kind, province, year, key) DO UPDATE SET count = count + excluded.count',
+                            [(kind, province, year, key, count) for (kind, key), count in contributions.items()])
+
+    def retract(self, path):
+        """Subtracts the counts of a known file from the aggregates and forgets it"""
+        province, date = self.db.execute('SELECT province, date FROM files WHERE path = ?', (path,)).fetchone()
+        year = int(date[:4])
+        contributions = self.db.execute('SELECT kind, key, count FROM contributions WHERE path = ?', (path,)).fetchall()
+        self.db.executemany('UPDATE aggregates SET count = count - ? WHERE kind = ? AND province = ? AND year = ? '
+                            'AND key = ?', [(count, kind, province, year, key) for kind, key, count in contributions])
+        # Only the rows just decremented can have dropped to zero
+        self.db.executemany('DELETE FROM aggregates WHERE kind = ? AND province = ? AND year = ? AND key = ? '
+                            'AND count <= 0', [(kind, province, year, key) for kind, key, _ in contributions])
+        self.db.execute('DELETE FROM contributions WHERE path = ?', (path,))
+        self.db.execute('DELETE FROM files WHERE path = ?', (path,))
+        self._forget(path)
+
+    def update_file(self, path):
+        """Brings the aggregates up to date with the current state of a file. Returns what happened (ADDED, UPDATED,
+        DUPLICATE or RETRACTED) or None if nothing changed"""
+        location = self._parse_path(path)
+        if location is None:
+            return None
+        province, date = location
+        known = self.db.execute('SELECT mtime FROM files WHERE path = ?', (path,)).fetchone()
+        try:
+            mtime = os.stat(path).st_mtime
+            if known and known[0] == mtime:
+                return None
+            with open(path) as f:
+                article = json.load(f)
+        except FileNotFoundError:
+            if known:
+                self.retract(path)
+                return RETRACTED
+            return None
+        except ValueError:
+            # Still being written: it will change again
+            return None
+
+        body = _get_body(article)
+        day = date.toordinal()
+        digest, minhash = get_body_digest(body), get_minhash(body)
+        serialized_minhash = bytearray(minhash.bytesize())
+        minhash.serialize(serialized_minhash)
+        duplicate_of = self._find_duplicate(path, day, digest, minhash) if body else path
+        if duplicate_of is not None:
+            print(f'\tremoving {"similar" if body else "empty"} article from {path}')
+            if known:
+                self.retract(path)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            return DUPLICATE
+
+        if known:
+            self.retract(path)
+        analyzed = isinstance(article['body'], dict)
+        self._add(path, province, date.year, self.get_contributions(article) if analyzed else {})
+        self.db.execute('INSERT INTO files (path, province, date, mtime, analyzed, digest, minhash) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (path, province, date.strftime(DATES_SQL_FORMAT), mtime, analyzed, digest,
+                         bytes(serialized_minhash)))
+        self._remember(path, day, digest, minhash)
+        return UPDATED if known else ADDED
+
+    def update_files(self, paths):
+        statuses = Counter(status for status in map(self.update_file, paths) if status)
+        self.db.commit()
+        self.statuses.update(statuses)
+        if statuses:
+            print(f'{time.strftime("%H:%M:%S")} ' + ', '.join(f'{count} {status}' for status, count in statuses.items()))
+        return statuses
+
+    def catch_up(self, start_date, end_date, debounce=0):
+        """Updates the files of the day directories between both dates that are new, have changed (and have been quiet
+        for `debounce` seconds) or have been deleted since the last time"""
+        paths = []
+        now = time.time()
+        # In date order, so the window of recent articles slides forward instead of every article being older than it
+        for category, date, day_dir in get_day_dirs(start_date, end_date, self.categories, self.dump_dir,
+                                                    by_date=True):
+            known = dict(self.db.execute('SELECT path, mtime FROM files WHERE province = ? AND date = ?',
+                                         (category, date.strftime(DATES_SQL_FORMAT))))
+            try:
+                entries = list(os.scandir(day_dir))
+            except FileNotFoundError:
+                entries = []
+            for entry in sorted(entries, key=lambda entry: entry.name):
+                mtime = entry.stat().st_mtime
+                if known.pop(entry.path, None) != mtime and now - mtime >= debounce:
+                    paths.append(entry.path)
+            paths += known
+        return self.update_files(paths)
+
+    def watch(self, debounce=DEBOUNCE_SECONDS, poll_interval=POLL_INTERVAL, poll_days=POLL_DAYS, polling=False):
+        """Updates the counts as files change until interrupted, with watchdog or polling the last `poll_days` days"""
+        today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+        self.catch_up(today - datetime.timedelta(days=poll_days), today)
+        if Observer is None or polling:
+            print(f'Polling {self.dump_dir} every {poll_interval} seconds...')
+            with contextlib.suppress(KeyboardInterrupt):
+                while True:
+                    time.sleep(poll_interval)
+                    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+                    self.catch_up(today - datetime.timedelta(days=poll_days), today, debounce)
+            return
+        print(f'Watching {self.dump_dir}...')
+        handler = _ChangesHandler()
+        observer = Observer()
+        observer.schedule(handler, self.dump_dir, recursive=True)
+        observer.start()
+        try:
+            while True:
+                time.sleep(min(debounce, 1))
+                self.update_files(handler.pop_quiet(debounce))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            observer.stop()
+            observer.join()
+
+    def get_counts(self, kind, group_by='year'):
+        """Returns a {group: {key: count}} dict with the aggregates of a kind per year, province or in total"""
+        if kind not in KINDS or group_by not in GROUP_BY:
+            raise ValueError(f'kind must be one of {KINDS} and group_by one of {GROUP_BY}')
+        group = "'total'" if group_by == 'total' else group_by
+        counts = {}
+        for label, key, count in self.db.execute(f'SELECT {group}, key, SUM(count) FROM aggregates WHERE kind = ? '
+                                                 f'GROUP BY {group}, key', (kind,)):
+            counts.setdefault(label, {})[key] = count
+        return counts
+
+    def export_counts(self, group_by='year', csv_suffix='_watch'):
+        """Generates the same `{kind}_count_{group}` CSVs as `news_stats.py` from the aggregates"""
+        for kind in KINDS:
+            for label, counts in self.get_counts(kind, group_by).items():
+                with open(f'{kind}_count_{label}{csv_suffix}.csv', 'w') as f:
+                    for key, count in counts.items():
+                        print(f'{label};{key};{count}', file=f)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+if __name__ == '__main__':
+    usage = f'usage: {sys.argv[0]} [-d <db> -D <dump_dir> -c <categories> -t <all_topics> -T <any_topics> ' \
+            f'-w <window_days> -b <debounce_seconds> -i <poll_interval> -p --catch-up -x <group_by>]'
+    [db_path, dump_dir, categories, topics, window_days, debounce, poll_interval, polling, catch_up, group_by] = \
+        [WATCH_DB, RAW_DUMP_DIR, None, {}, WINDOW_DAYS, DEBOUNCE_SECONDS, POLL_INTERVAL, False, False, None]
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], 'hd:D:c:t:T:w:b:i:px:',
+                                ['help', 'db=', 'dump-dir=', 'categories=', 'topics=', 'any-topics=', 'window-days=',
+                                 'debounce=', 'poll-interval=', 'polling', 'catch-up', 'export='])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(usage)
+            sys.exit()
+        elif opt in ('-d', '--db'):
+            db_path = arg
+        elif opt in ('-D', '--dump-dir'):
+            dump_dir = arg
+        elif opt in ('-c', '--categories'):
+            categories = arg.split(',')
+        elif opt in ('-t', '--topics'):
+            topics[arg] = (set(arg.split(',')), all)
+        elif opt in ('-T', '--any-topics'):
+            topics[arg] = (set(arg.split(',')), any)
+        elif opt in ('-w', '--window-days'):
+            window_days = int(arg)
+        elif opt in ('-b', '--debounce'):
+            debounce = float(arg)
+        elif opt in ('-i', '--poll-interval'):
+            poll_interval = float(arg)
+        elif opt in ('-p', '--polling'):
+            polling = True
+        elif opt == '--catch-up':
+            catch_up = True
+        elif opt in ('-x', '--export'):
+            group_by = arg
+    stats_watcher = StatsWatcher(db_path, dump_dir, categories, topics, window_days=window_days)
+    if group_by:
+        stats_watcher.export_counts(group_by)
+    elif catch_up:
+        start_cfg_date, end_cfg_date = get_dates_from_cfg()
+        print(f'Catching up between {start_cfg_date.strftime(DATES_CFG_FORMAT)} and '
+              f'{end_cfg_date.strftime(DATES_CFG_FORMAT)}')
+        stats_watcher.catch_up(start_cfg_date, end_cfg_date)
+    else:
+        stats_watcher.watch(debounce, poll_interval, polling=polling)
+    stats_watcher.close()
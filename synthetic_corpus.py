@@ -0,0 +1,155 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Generates a small synthetic corpus with the same directory layout and JSON fields as the real one, to try the scripts
+(sharded runs, deduplication settings...) without the real dump. The words follow a Zipf distribution over a generated
+vocabulary, so the counts look like natural text, and the same seed always gives the same corpus.
+
+    python synthetic_corpus.py -o /tmp/synthetic/dump-processed -c MADRID,MURCIA -s 01/01/2016 -e 31/03/2016
+    python synthetic_corpus.py -o /tmp/synthetic/dump -r  # Raw articles, as written by the spider
+"""
+import datetime
+import getopt
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+from news_stats import ARTICLE_PARTS, DATES_CFG_FORMAT, DATES_FILE_FORMAT, get_dates_between
+
+SEED = 2018
+PROVINCES = ['ALICANTE', 'MADRID', 'MURCIA']
+START_DATE = datetime.datetime(2016, 12, 15)
+END_DATE = datetime.datetime(2017, 1, 31)
+ARTICLES_PER_DAY = 5
+VOCABULARY_SIZE = 5000
+ZIPF_EXPONENT = 1.1
+# The most frequent words play the role of stopwords, left out of `lemmatized_text_reduced`
+STOPWORDS = 20
+# Amount of words of every part
+PART_WORDS = {'title': (4, 15), 'lead': (15, 40), 'body': (80, 400)}
+SYLLABLES = ['ba', 'ca', 'da', 'de', 'el', 'es', 'fa', 'go', 'la', 'li', 'ma', 'mo', 'na', 'no', 'pa', 'po', 'que',
+             'ra', 're', 'ri', 'sa', 'se', 'ta', 'te', 'to', 'tu', 'va', 'za']
+# Real words mixed in the vocabulary, so topics and anglicisms can be searched
+KNOWN_WORDS = ['corrupción', 'trama', 'gobierno', 'juez', 'imputado', 'partido', 'ciudad', 'agua', 'marketing', 'show']
+PERSONS = ['Mariano Rajoy', 'Pedro Sánchez', 'Cristina Cifuentes', 'Manuela Carmena', 'Pablo Iglesias']
+LOCATIONS = ['Madrid', 'Alicante', 'Murcia', 'Valencia', 'Bruselas']
+ORGANIZATIONS = ['PP', 'PSOE', 'Podemos', 'ONU', 'Guardia Civil']
+URL_PREFIX = 'https://www.20minutos.es/noticia'
+
+
+def get_vocabulary(size=VOCABULARY_SIZE, seed=SEED):
+    rng = np.random.default_rng(seed)
+    syllables = np.array(SYLLABLES)
+    words = set(KNOWN_WORDS)
+    while len(words) < size:
+        words.add(''.join(rng.choice(syllables, rng.integers(2, 5))))
+    # The known words take spread ranks, so some are frequent and some are rare
+    words = sorted(words - set(KNOWN_WORDS))
+    rng.shuffle(words)
+    for rank, word in zip(np.geomspace(5, size // 2, len(KNOWN_WORDS)).astype(int), KNOWN_WORDS):
+        words.insert(rank, word)
+    return words[:size]
+
+
+class SyntheticCorpus:
+    """Generator of articles: `get_article` is deterministic for a given seed, province, date and number"""
+
+    def __init__(self, seed=SEED, vocabulary_size=VOCABULARY_SIZE, zipf_exponent=ZIPF_EXPONENT):
+        self.seed = seed
+        self.vocabulary = np.array(get_vocabulary(vocabulary_size, seed))
+        weights = 1 / np.arange(1, vocabulary_size + 1) ** zipf_exponent
+        self.probabilities = weights / weights.sum()
+        # Same sampling as `rng.choice(..., p=self.probabilities)`, without summing the probabilities on every call
+        self.cumulative = self.probabilities.cumsum()
+        self.cumulative /= self.cumulative[-1]
+        self.stopwords = set(self.vocabulary[:STOPWORDS])
+
+    def get_words(self, rng, amount):
+        return list(self.vocabulary[self.cumulative.searchsorted(rng.random(amount), side='right')])
+
+    def get_part(self, rng, part):
+        words = self.get_words(rng, rng.integers(*PART_WORDS[part]))
+        return {'raw_text': ' '.join(words).capitalize() + '.',
+                'lemmatized_text': ' '.join(words),
+                'lemmatized_text_reduced': ' '.join(word for word in words if word not in self.stopwords),
+                'persons': list(rng.choice(PERSONS, rng.integers(0, 3), replace=False)),
+                'locations': list(rng.choice(LOCATIONS, rng.integers(0, 3), replace=False)),
+                'organizations': list(rng.choice(ORGANIZATIONS, rng.integers(0, 3), replace=False)),
+                'others': [], 'dates': [], 'numbers': [str(number) for number in rng.integers(1, 1000, 2)]}
+
+    def get_article(self, province, date, number, raw=False):
+        key = int.from_bytes(hashlib.blake2b(f'{province}/{date:%Y%m%d}/{number}'.encode('utf8'),
+                                             digest_size=8).digest(), 'little')
+        rng = np.random.default_rng([self.seed, key])
+        article = {'url': f'{URL_PREFIX}/{key}', 'province': province, 'date': date.isoformat()}
+        for part in ARTICLE_PARTS:
+            article[part] = self.get_part(rng, part)
+            if raw:
+                article[part] = article[part]['raw_text']
+        return article
+
+    def get_articles_per_day(self, province, date, articles_per_day):
+        rng = np.random.default_rng([self.seed, date.toordinal(), sum(province.encode('utf8'))])
+        return int(rng.integers(0, 2 * articles_per_day + 1))
+
+    def write(self, dump_dir, provinces=PROVINCES, start_date=START_DATE, end_date=END_DATE,
+              articles_per_day=ARTICLES_PER_DAY, raw=False):
+        """Writes the articles in `dump_dir/province/yyyy/mm/dd/` and returns how many were written"""
+        written = 0
+        for province in provinces:
+            for date in get_dates_between(start_date, end_date):
+                amount = self.get_articles_per_day(province, date, articles_per_day)
+                if not amount:
+                    continue
+                day_dir = f'{dump_dir}/{province}/{date.strftime(DATES_FILE_FORMAT)}'
+                os.makedirs(day_dir, exist_ok=True)
+                for number in range(amount):
+                    article = self.get_article(province, date, number, raw)
+                    filename = hashlib.sha224(article['url'].encode('utf8')).hexdigest()
+                    with open(f'{day_dir}/{filename}.json', 'w') as f:
+                        json.dump(article, f, ensure_ascii=False)
+                written += amount
+        return written
+
+
+if __name__ == '__main__':
+    usage = f'usage: {sys.argv[0]} -o <dump_dir> [-c <provinces> -s <start_date> -e <end_date> -n <articles_per_day> ' \
+            f'-v <vocabulary_size> -S <seed> -r]'
+    [dump_dir, provinces, start_date, end_date, articles_per_day, vocabulary_size, seed, raw] = \
+        [None, PROVINCES, START_DATE, END_DATE, ARTICLES_PER_DAY, VOCABULARY_SIZE, SEED, False]
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], 'ho:c:s:e:n:v:S:r',
+                                ['help', 'output=', 'provinces=', 'start-date=', 'end-date=', 'articles-per-day=',
+                                 'vocabulary-size=', 'seed=', 'raw'])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(usage)
+            sys.exit()
+        elif opt in ('-o', '--output'):
+            dump_dir = arg
+        elif opt in ('-c', '--provinces'):
+            provinces = arg.split(',')
+        elif opt in ('-s', '--start-date'):
+            start_date = datetime.datetime.strptime(arg, DATES_CFG_FORMAT)
+        elif opt in ('-e', '--end-date'):
+            end_date = datetime.datetime.strptime(arg, DATES_CFG_FORMAT)
+        elif opt in ('-n', '--articles-per-day'):
+            articles_per_day = int(arg)
+        elif opt in ('-v', '--vocabulary-size'):
+            vocabulary_size = int(arg)
+        elif opt in ('-S', '--seed'):
+            seed = int(arg)
+        elif opt in ('-r', '--raw'):
+            raw = True
+    if dump_dir is None:
+        print(usage)
+        sys.exit(2)
+    synthetic_corpus = SyntheticCorpus(seed, vocabulary_size)
+    print(f'{synthetic_corpus.write(dump_dir, provinces, start_date, end_date, articles_per_day, raw)} articles written '
+          f'in {dump_dir}')
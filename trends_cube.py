@@ -0,0 +1,191 @@
+"""
+Pavel Razgovorov (pr18@alu.ua.es), Universidad de Alicante (https://www.ua.es)
+
+Precomputes a sparse term x province x day count cube from the processed corpus, so questions like "how did the term X
+evolve per province per month" are answered by slicing memory-mapped arrays instead of scanning the whole corpus.
+
+The cube is a CSR matrix with one row per term and one column per (province, day) pair (province * days + day), plus
+a dense province x day matrix with the total amount of words, used to normalise the series.
+"""
+import datetime
+import itertools
+from collections import Counter
+
+import numpy as np
+
+from calendar_table import CalendarTable
+from news_stats import (ARTICLE_PARTS, DATES_SQL_FORMAT, get_dates_from_cfg, read_articles,
+                        read_categories_from_file)
+from sparse_store import get_row, load_meta, load_rows, load_vocabulary, save_meta, save_rows, save_vocabulary
+
+CUBE_DIR = 'trends_cube'
+CUBE_NAME = 'counts'
+TOTALS_FILE = 'totals.npy'
+VOCABULARY_FILE = 'vocabulary.txt'
+BUCKET_FIELDS = {'day': ('year', 'month', 'day'),
+                 'week': ('iso_year', 'week'),
+                 'month': ('year', 'month'),
+                 'season': ('season_year', 'whole_season'),
+                 'year': ('year',)}
+BURST_WINDOW = 12
+BURST_THRESHOLD = 3.0
+
+
+class CubeWriter:
+    """Accumulates the term counts of every (province, day) and saves them with the layout read by `TrendsCube`"""
+
+    def __init__(self, start_date, days, provinces):
+        self.start_date = start_date
+        self.days = days
+        self.provinces = provinces
+        self.totals = np.zeros((len(provinces), days), dtype=np.int64)
+        self._terms_chunks, self._columns_chunks, self._counts_chunks = [], [], []
+
+    def add_counts(self, category, date, counts):
+        """Adds a {term id: count} dict with the counts of a province in a given day"""
+        province, day = self.provinces.index(category), (date - self.start_date).days
+        self._terms_chunks.append(np.fromiter(counts.keys(), dtype=np.int32, count=len(counts)))
+        self._counts_chunks.append(np.fromiter(counts.values(), dtype=np.int32, count=len(counts)))
+        self._columns_chunks.append(np.full(len(counts), province * self.days + day, dtype=np.int32))
+        self.totals[province, day] += sum(counts.values())
+
+    def save(self, cube_dir, vocabulary, **meta):
+        """Saves the cube, with the terms of the vocabulary ordered by their id"""
+        save_rows(cube_dir, CUBE_NAME, _concatenate(self._terms_chunks, np.int32),
+                  _concatenate(self._columns_chunks, np.int32), _concatenate(self._counts_chunks, np.int32),
+                  len(vocabulary))
+        np.save(f'{cube_dir}/{TOTALS_FILE}', self.totals)
+        save_vocabulary(f'{cube_dir}/{VOCABULARY_FILE}', vocabulary)
+        save_meta(cube_dir, start_date=self.start_date.strftime(DATES_SQL_FORMAT), days=self.days,
+                  provinces=self.provinces, **meta)
+
+
+def build_cube(cube_dir=CUBE_DIR, text='lemmatized_text'):
+    """Reads the whole corpus once and saves the count cube of the words found in the `text` field"""
+    start_cfg_date, end_cfg_date = get_dates_from_cfg()
+    provinces = read_categories_from_file()
+    cube_writer = CubeWriter(start_cfg_date, (end_cfg_date - start_cfg_date).days + 1, provinces)
+
+    vocabulary = {}
+    articles = read_articles(start_cfg_date, end_cfg_date, provinces)
+    for (category, date), day_articles in itertools.groupby(articles, key=lambda x: (x[0], x[1])):
+        print(f'\tExtracting {category} {date}\'s words...', end='\r')
+        counts = Counter()
+        for _, _, article in day_articles:
+            for part in ARTICLE_PARTS:
+                counts.update(vocabulary.setdefault(word, len(vocabulary)) for word in article[part][text].split(' '))
+        cube_writer.add_counts(category, date, counts)
+    print()
+    cube_writer.save(cube_dir, vocabulary, text=text)
+
+
+def _concatenate(chunks, dtype):
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=dtype)
+
+
+class TrendsCube:
+    """Query API over a cube built with `build_cube`. The arrays are memory-mapped, so opening it is instantaneous and
+    only the rows of the queried terms are read from disk"""
+
+    def __init__(self, cube_dir=CUBE_DIR):
+        meta = load_meta(cube_dir)
+        self.text = meta.get('text')
+        self.start_date = datetime.datetime.strptime(meta['start_date'], DATES_SQL_FORMAT)
+        self.days = meta['days']
+        self.provinces = meta['provinces']
+        self.vocabulary = load_vocabulary(f'{cube_dir}/{VOCABULARY_FILE}')
+        self.counts = load_rows(cube_dir, CUBE_NAME)
+        self.totals = np.load(f'{cube_dir}/{TOTALS_FILE}', mmap_mode='r')
+        self.calendar = CalendarTable(self.start_date, self.start_date + datetime.timedelta(days=self.days - 1))
+        self._buckets = {}
+
+    def get_buckets(self, bucket):
+        """Returns an array with the bucket index of every day, and the list of labels of those buckets"""
+        if bucket not in BUCKET_FIELDS:
+            raise ValueError(f'unknown bucket {bucket}, it must be one of {list(BUCKET_FIELDS)}')
+        if bucket not in self._buckets:
+            fields = BUCKET_FIELDS[bucket]
+            day_buckets, groups = self.calendar.get_groups(fields)
+            self._buckets[bucket] = day_buckets, [self.calendar.format_group(fields, group) for group in groups]
+        return self._buckets[bucket]
+
+    def get_daily_counts(self, term):
+        """Returns a dense province x day matrix with the occurrences of the term"""
+        daily = np.zeros((len(self.provinces), self.days), dtype=np.int64)
+        if term in self.vocabulary:
+            columns, counts = get_row(self.counts, self.vocabulary[term])
+            daily.ravel()[columns] = counts
+        return daily
+
+    def get_series_per_province(self, term, bucket='month', normalize=False):
+        """Returns the labels of the buckets and a province x bucket matrix with the occurrences of the term (or its
+        frequency over all the words of the bucket if `normalize` is set)"""
+        day_buckets, labels = self.get_buckets(bucket)
+        series = self._group_days(self.get_daily_counts(term), day_buckets, len(labels))
+        if normalize:
+            totals = self._group_days(self.totals, day_buckets, len(labels))
+            series = np.divide(series, totals, out=np.zeros(series.shape), where=totals > 0)
+        return labels, series
+
+    def get_series(self, term, bucket='month', provinces=None, normalize=False):
+        """Returns the labels of the buckets and the occurrences of the term in each one of them, adding up the given
+        provinces (all of them by default)"""
+        day_buckets, labels = self.get_buckets(bucket)
+        rows = self._get_province_rows(provinces)
+        series = self._group_days(self.get_daily_counts(term)[rows].sum(axis=0), day_buckets, len(labels))
+        if normalize:
+            totals = self._group_days(self.totals[rows].sum(axis=0), day_buckets, len(labels))
+            series = np.divide(series, totals, out=np.zeros(series.shape), where=totals > 0)
+        return labels, series
+
+    def _get_province_rows(self, provinces):
+        if provinces is None:
+            return np.arange(len(self.provinces))
+        return np.array([self.provinces.index(province) for province in provinces], dtype=np.int64)
+
+    @staticmethod
+    def _group_days(daily, day_buckets, n_buckets):
+        """Adds up the last axis (days) of the counts into buckets"""
+        grouped = np.zeros(daily.shape[:-1] + (n_buckets,), dtype=daily.dtype)
+        np.add.at(grouped.T, day_buckets, daily.T)
+        return grouped
+
+
+def get_burst_scores(series, window=BURST_WINDOW):
+    """Returns the z-score of every bucket against the mean and standard deviation of the `window` previous buckets.
+    It works along the last axis, so a matrix with several series (terms or provinces) is scored at once"""
+    series = np.asarray(series, dtype=np.float64)
+    padded = np.concatenate([np.zeros(series.shape[:-1] + (1,)), series], axis=-1)
+    sums = np.cumsum(padded, axis=-1)
+    squares = np.cumsum(padded ** 2, axis=-1)
+    ends = np.arange(series.shape[-1])
+    starts = np.maximum(ends - window, 0)
+    sizes = np.maximum(ends - starts, 1)
+    means = (sums[..., ends] - sums[..., starts]) / sizes
+    variances = (squares[..., ends] - squares[..., starts]) / sizes - means ** 2
+    deviations = np.sqrt(np.maximum(variances, 0))
+    scores = np.divide(series - means, deviations, out=np.zeros(series.shape), where=deviations > 0)
+    scores[..., ends < 2] = 0  # not enough history to score the first buckets
+    return scores
+
+
+def detect_bursts(series, window=BURST_WINDOW, threshold=BURST_THRESHOLD):
+    """Returns a boolean mask with the buckets whose burst score exceeds the threshold"""
+    return get_burst_scores(series, window) > threshold
+
+
+def get_trend_slopes(series):
+    """Returns the least squares slope of every series along the last axis"""
+    series = np.asarray(series, dtype=np.float64)
+    x = np.arange(series.shape[-1], dtype=np.float64)
+    x -= x.mean()
+    return (series * x).sum(axis=-1) / max((x ** 2).sum(), 1)
+
+
+if __name__ == '__main__':
+    # Example:
+    build_cube(text='lemmatized_text_reduced')
+    cube = TrendsCube()
+    labels, series = cube.get_series('corrupción', bucket='month', normalize=True)
+    for label, value, burst in zip(labels, series, detect_bursts(series)):
+        print(f'{label};{value};{"burst" if burst else ""}')